@@ -7,8 +7,12 @@ import requests
 import asyncio
 import json
 
-from ekilibria.google_suite.services.extract_features import extract_all_features
-from ekilibria.microsoft_suite.api_microsoft_org import get_data, create_graph_client_from_token, get_microsoft_graph_api_token
+from ekilibria.google_suite.services.extract_features import extract_weeks_features
+from ekilibria.google_suite.services.concurrency import format_errors
+from ekilibria.google_suite.services.session import GoogleWorkspaceSession
+from ekilibria.google_suite.services.scheduler import quota_scheduler
+from ekilibria.microsoft_suite.api_microsoft_org import get_weeks_data, create_graph_client_from_token, get_microsoft_graph_api_token, GRAPH_SYNC_STORE
+from ekilibria.microsoft_suite.graph_batch import get_weeks_data_batch
 from utils import get_last_n_weeks_range
 
 from dotenv import load_dotenv
@@ -23,6 +27,12 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 SCOPES = os.getenv("GOOGLE_SCOPES", "")
 ENV = os.getenv("VITE_ENV", "development")
+# "range": una consulta por fuente para todas las semanas y reparto local
+# "weekly": una extracción completa por semana
+# "sync": solo los cambios desde la última carga, sobre un registro local por usuario
+GOOGLE_EXTRACTION_MODE = os.getenv("GOOGLE_EXTRACTION_MODE", "range")
+# true: las llamadas a Microsoft Graph van empaquetadas en $batch de hasta 20 requests
+GRAPH_BATCH = os.getenv("GRAPH_BATCH", "true").lower() == "true"
 
 # OAuth configuration
 oauth = OAuth(app)
@@ -85,22 +95,29 @@ def auth_microsoft():
 def get_features_microsoft(weeks):
     token_filename = session.get("token_path")
 
-    client = create_graph_client_from_token(session["ms_token"])
     week_ranges = get_last_n_weeks_range(n=weeks)
     features_result = []
+    datetime_ranges = [
+        (datetime.datetime.combine(date_from, datetime.datetime.min.time()),
+         datetime.datetime.combine(date_to, datetime.datetime.max.time()))
+        for date_from, date_to in week_ranges
+    ]
+
+    # Mailbox settings once, then every source of every week concurrently in a single event loop
+    # (packed in $batch requests, or one SDK call per source and week); with GRAPH_SYNC_STORE,
+    # from the user's local store after a delta refresh
+    if GRAPH_BATCH and not GRAPH_SYNC_STORE:
+        extraction = get_weeks_data_batch(session["ms_token"], datetime_ranges)
+    else:
+        extraction = get_weeks_data(create_graph_client_from_token(session["ms_token"]), datetime_ranges)
+    features_by_week, errors_by_week = asyncio.run(extraction)
 
-    asyncio.set_event_loop(asyncio.new_event_loop())
-    loop = asyncio.get_event_loop()
-
-
-    for i, (date_from, date_to) in enumerate(week_ranges):
+    for i, ((date_from, date_to), features, errors) in enumerate(zip(week_ranges, features_by_week, errors_by_week)):
         print(f"🗓️ Semana {i+1}: desde {date_from} hasta {date_to}")
 
-        features = loop.run_until_complete(
-            get_data(
-                client,
-                datetime.datetime.combine(date_from, datetime.datetime.min.time()),
-                datetime.datetime.combine(date_to, datetime.datetime.max.time())))
+        if errors:
+            features['extraction_errors'] = format_errors(errors)
+            print("⚠️ Fuentes con error:", features['extraction_errors'])
 
         features['fecha_desde'] = str(date_from)
         features['fecha_hasta'] = str(date_to)
@@ -143,17 +160,22 @@ def authenticate_google_user():
 def get_features_google(weeks):
     token_filename = session.get("token_path")
 
+    # Credenciales y servicios de Google compartidos por todas las semanas del request
+    google_session = GoogleWorkspaceSession(token_filename)
+
     week_ranges = get_last_n_weeks_range(n=weeks)
     features_result = []
 
-    for i, (date_from, date_to) in enumerate(week_ranges):
+    # Gmail, Calendar y Drive (y en modo "weekly" cada semana) se extraen en paralelo;
+    # si una fuente falla o vence, las demás igual se devuelven
+    features_by_week, errors_by_week = extract_weeks_features(google_session, week_ranges, mode=GOOGLE_EXTRACTION_MODE)
+
+    for i, ((date_from, date_to), features, errors) in enumerate(zip(week_ranges, features_by_week, errors_by_week)):
         print(f"🗓️ Semana {i+1}: desde {date_from} hasta {date_to}")
 
-        features = extract_all_features(
-            token_filename,
-            fecha_desde=datetime.datetime.combine(date_from, datetime.datetime.min.time()),
-            fecha_hasta=datetime.datetime.combine(date_to, datetime.datetime.max.time())
-        )
+        if errors:
+            features['extraction_errors'] = format_errors(errors)
+            print("⚠️ Fuentes con error:", features['extraction_errors'])
 
         features['fecha_desde'] = str(date_from)
         features['fecha_hasta'] = str(date_to)
@@ -253,6 +275,11 @@ def get_login_user_email():
         return jsonify({'error': 'User not authenticated'}), 401
     return jsonify({'user_name': user_name})
 
+# Endpoint with the Google API quota scheduler metrics (throttling, retries, 429s)
+@app.route('/google_scheduler_stats')
+def google_scheduler_stats():
+    return jsonify(quota_scheduler.stats())
+
 # Endpoint to log out the user
 @app.route('/logout')
 def logout():
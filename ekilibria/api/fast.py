@@ -1,23 +1,93 @@
-from fastapi import FastAPI
+import tempfile
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List, Dict, Union
+from typing import List, Optional
 
-from ekilibria.ml_logic.predict import predict_weektype, predict_burnoutindex, compute_burnout_contributions, expected_features
+from ekilibria.ml_logic.predict import predict_weektype, predict_burnoutindex, compute_burnout_contributions, predict_batch, predict_rows, expected_features
+from ekilibria.ml_logic.registry import MODEL_WARMUP, warmup
+from ekilibria.ml_logic.cache import prediction_cache
+from ekilibria.ml_logic.microbatch import MICROBATCH, MicroBatcher
+from ekilibria.api.streaming import DuplexStreamingResponse, iter_ndjson, score_ndjson
+from ekilibria.ml_logic.score import score_stream
 
 # Definición del esquema del input
 # class FeaturesInput(BaseModel):
 #     features: Dict[str, float]
 
+# Serialización rápida de las respuestas si orjson está instalado
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as FastJSONResponse
+
+# Las features son opcionales para poder informar por semana cuáles faltan
+class WeekFeatures(BaseModel):
+    num_events: Optional[float] = None
+    num_events_outside_hours: Optional[float] = None
+    total_meeting_hours: Optional[float] = None
+    avg_meeting_duration: Optional[float] = None
+    meetings_weekend: Optional[float] = None
+    emails_sent: Optional[float] = None
+    emails_sent_out_of_hours: Optional[float] = None
+    docs_created: Optional[float] = None
+    docs_edited: Optional[float] = None
+    num_meetings_no_breaks: Optional[float] = None
+    emails_received: Optional[float] = None
+    num_overlapping_meetings: Optional[float] = None
+    fecha_desde: Optional[str] = None
+    fecha_hasta: Optional[str] = None
+
 class FeaturesInput(BaseModel):
-    features: List[Dict[str, Union[int, float, str]]]
+    features: List[WeekFeatures]
+
+# Formato compacto: una lista de valores por semana, en el orden de `columns`
+class CompactFeaturesInput(BaseModel):
+    columns: List[str] = expected_features
+    rows: List[List[Optional[float]]]
+
+# Columnas de cada fila de la respuesta compacta
+COMPACT_RESPONSE_COLUMNS = ["week_type", "burnout_index"] + [f"contribution_{feat}" for feat in expected_features]
+
+# Formatos aceptados por /predict_bulk (Content-Type -> formato de score.py)
+BULK_CONTENT_TYPES = {
+    "application/vnd.apache.parquet": "parquet",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+}
+BULK_RESPONSE_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Tamaño a partir del cual los archivos de /predict_bulk pasan de memoria a disco
+BULK_SPOOL_BYTES = 64 * 1024 * 1024
 
 # Crear la app FastAPI
 app = FastAPI()
 
+# Con MICROBATCH=true las semanas de requests concurrentes se predicen juntas
+batcher = MicroBatcher(predict_batch) if MICROBATCH else None
+
+@app.on_event("startup")
+def load_models():
+    # Los modelos se cargan perezosamente; con MODEL_WARMUP=true se precargan al arrancar
+    if MODEL_WARMUP:
+        warmup()
+
 @app.get("/")
 def root():
     return {"message": "Servidor levantado. API activa"}
 
+@app.get("/cache_stats")
+def cache_stats():
+    stats = prediction_cache.stats()
+    if batcher is not None:
+        stats["microbatch"] = batcher.stats()
+    return stats
+
 @app.post("/predict")
 def predict(input_data: FeaturesInput):
     features_dict = input_data.features
@@ -38,34 +108,72 @@ def predict(input_data: FeaturesInput):
             "burnout_index": prediction2,
             "contributions": explanations}
 
-@app.post("/predict_new")
-def predict_new(input_data: FeaturesInput):
-    semanas = input_data.features  # Ahora es una lista de dicts
-    result = []
-
-    for semana in semanas:
-        # Verificamos que estén todas las features esperadas
-        features_dict = semana.copy()  # No modificar el original
-        missing = [feat for feat in expected_features if feat not in features_dict]
-        if missing:
-            result.append({
-                "fecha_desde": semana.get("fecha_desde"),
-                "fecha_hasta": semana.get("fecha_hasta"),
-                "error": f"Faltan las siguientes features: {missing}"
-            })
-            continue
-
-        # Realizar predicciones
-        prediction1 = predict_weektype(features_dict)
-        prediction2 = predict_burnoutindex(features_dict)
-        explanations = compute_burnout_contributions(features_dict)
-
-        result.append({
-            "fecha_desde": semana.get("fecha_desde"),
-            "fecha_hasta": semana.get("fecha_hasta"),
-            "week_type": prediction1,
-            "burnout_index": prediction2,
-            "contributions": explanations
-        })
+@app.post("/predict_new", response_class=FastJSONResponse)
+async def predict_new(input_data: FeaturesInput):
+    # Solo las features presentes: las que faltan se informan por semana
+    semanas = [semana.model_dump(exclude_none=True) for semana in input_data.features]
+
+    # Todas las semanas se validan y predicen en bloque; las inválidas vuelven con "error"
+    if batcher is not None:
+        result = await batcher.submit(semanas)
+    else:
+        result = await run_in_threadpool(predict_batch, semanas)
+
+    # Devolver la respuesta directamente evita el jsonable_encoder de FastAPI
+    return FastJSONResponse({"result": result})
+
+@app.post("/predict_compact", response_class=FastJSONResponse)
+async def predict_compact(input_data: CompactFeaturesInput):
+    try:
+        rows, errors = await run_in_threadpool(predict_rows, input_data.rows, input_data.columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return FastJSONResponse({
+        "columns": COMPACT_RESPONSE_COLUMNS,
+        "rows": rows,
+        "errors": [{"row": i, "error": error} for i, error in errors.items()]
+    })
+
+@app.post("/predict_stream")
+async def predict_stream(request: Request):
+    """
+    Entrada y salida NDJSON: una semana por línea, procesadas en bloques acotados.
+
+    La respuesta empieza a escribirse mientras todavía se lee el cuerpo, así que
+    el cliente tiene que ser full-duplex (p. ej. httpx o aiohttp leyendo en
+    paralelo al envío). Clientes que suben todo el cuerpo antes de leer
+    (requests, la mayoría de los proxies HTTP/1.1) se bloquean con cohortes
+    grandes: para ellos está /predict_bulk, que guarda la entrada primero.
+    """
+    rows = iter_ndjson(request.stream())
+    return DuplexStreamingResponse(score_ndjson(rows), media_type="application/x-ndjson")
+
+@app.post("/predict_bulk")
+async def predict_bulk(request: Request):
+    # Cuerpo Arrow IPC o Parquet con las features; la respuesta usa el mismo formato
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = BULK_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail=f"Content-Type no soportado, usar uno de: {list(BULK_CONTENT_TYPES)}")
+
+    upload = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_BYTES)
+    output = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_BYTES)
+
+    try:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        await run_in_threadpool(score_stream, upload, output, fmt)
+    except ValueError as e:
+        output.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        upload.close()
 
-    return {"result": result}
+    output.seek(0)
+    return StreamingResponse(
+        iter(lambda: output.read(1024 * 1024), b""),
+        media_type=BULK_RESPONSE_TYPES[fmt],
+        background=BackgroundTask(output.close)
+    )
@@ -0,0 +1,103 @@
+import os
+import json
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from ekilibria.ml_logic.predict import predict_batch
+
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode()
+
+# Semanas que se predicen juntas en cada bloque de /predict_stream
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1000"))
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que se puede generar mientras todavía se lee el cuerpo
+    del request. El StreamingResponse estándar escucha `receive` en paralelo
+    para detectar desconexiones y se "come" los fragmentos del cuerpo; acá la
+    desconexión se detecta cuando falla el envío.
+
+    El cliente tiene que ser full-duplex (leer la respuesta mientras sube el
+    cuerpo): uno que sube todo antes de leer se bloquea cuando se llenan los
+    buffers de ambos sockets.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_ndjson(byte_chunks):
+    """
+    Recorre un cuerpo NDJSON que llega en fragmentos de bytes y devuelve
+    un objeto por línea, sin tener nunca el cuerpo completo en memoria.
+    Las líneas que no son un objeto JSON se devuelven como {"error": ...}.
+    """
+    buffer = bytearray()
+    async for chunk in byte_chunks:
+        # Solo se buscan saltos de línea en los bytes nuevos: una línea larga que
+        # llega en muchos fragmentos no se vuelve a recorrer en cada uno
+        search_from = len(buffer)
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", search_from)) != -1:
+            line = buffer[start:end]
+            if line.strip():
+                yield _parse_line(line)
+            start = search_from = end + 1
+        if start:
+            del buffer[:start]
+
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line):
+    try:
+        row = json.loads(line)
+    except ValueError:
+        return {"error": "Línea NDJSON inválida"}
+    if not isinstance(row, dict):
+        return {"error": "Cada línea debe ser un objeto JSON con las features de una semana"}
+    return row
+
+
+async def score_ndjson(rows, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Predice las semanas de `rows` (iterador asíncrono de dicts) en bloques de
+    `chunk_rows` y devuelve una línea NDJSON por semana, en el mismo orden.
+
+    Como es un generador, el siguiente bloque de entrada recién se lee cuando
+    el cliente consumió la salida del anterior: la memoria queda acotada a un
+    bloque sin importar el tamaño de la cohorte.
+    """
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield await _score_chunk(chunk)
+            chunk = []
+
+    if chunk:
+        yield await _score_chunk(chunk)
+
+
+async def _score_chunk(chunk):
+    # Las filas que ya vienen con error de parseo no pasan por el modelo
+    valid = [row for row in chunk if "error" not in row]
+    predictions = iter(await run_in_threadpool(predict_batch, valid)) if valid else iter(())
+
+    lines = [
+        _dumps(row if "error" in row else next(predictions))
+        for row in chunk
+    ]
+    return b"\n".join(lines) + b"\n"
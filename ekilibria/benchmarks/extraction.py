@@ -0,0 +1,173 @@
+"""
+Benchmark de la extracción de features contra el servidor falso de
+ekilibria.benchmarks.fake_workspace, sin red ni tenants reales.
+
+Levanta el servidor en un thread (o usa uno ya levantado con --url), apunta
+los clientes de Google y Microsoft Graph a él y mide, para N semanas, el
+tiempo de extracción y la cantidad de requests por API de cada modo.
+
+Uso:
+    python -m ekilibria.benchmarks.extraction
+    python -m ekilibria.benchmarks.extraction --weeks 8 --latency-ms 50 --repeat 3
+    python -m ekilibria.benchmarks.extraction --url http://localhost:9000 --targets google:range,microsoft
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import urllib.request
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+
+DEFAULT_WEEKS = 4
+DEFAULT_REPEAT = 3
+DEFAULT_TARGETS = ["google:range", "google:weekly", "google:sync", "microsoft", "microsoft:batch", "microsoft:sync"]
+
+
+def start_server(port: int) -> str:
+    """Levanta el servidor falso en un thread y devuelve su URL base."""
+    import uvicorn
+    from ekilibria.benchmarks.fake_workspace import app
+
+    # Keep-alive largo: la deserialización de msgraph puede dejar conexiones del pool ociosas varios segundos
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", timeout_keep_alive=60))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def fake_request(url: str, path: str, payload: dict = None) -> dict:
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(f"{url}{path}", data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def build_targets(work_dir: Path, weeks: int) -> dict:
+    """Devuelve {nombre: callable} para cada modo de extracción a medir."""
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    from utils import get_last_n_weeks_range
+    from ekilibria.google_suite.services.extract_features import extract_weeks_features
+    from ekilibria.google_suite.services.session import GoogleWorkspaceSession
+    from ekilibria.microsoft_suite.api_microsoft_org import get_weeks_data, create_graph_client_from_token
+    from ekilibria.microsoft_suite.graph_batch import get_weeks_data_batch
+    import datetime
+
+    expires_at = int(time.time()) + 24 * 3600
+    token_file = work_dir / "token_benchmark.json"
+    token_file.write_text(json.dumps({"access_token": "fake", "expires_at": expires_at}))
+    week_ranges = get_last_n_weeks_range(n=weeks)
+
+    def google(mode):
+        def run():
+            session = GoogleWorkspaceSession(str(token_file))
+            features, errors = extract_weeks_features(session, week_ranges, mode=mode)
+            return sum(1 for week_errors in errors if week_errors)
+        return run
+
+    token_dict = {"token": "fake", "expires_on": expires_at}
+    datetime_ranges = [
+        (datetime.datetime.combine(date_from, datetime.datetime.min.time()),
+         datetime.datetime.combine(date_to, datetime.datetime.max.time()))
+        for date_from, date_to in week_ranges
+    ]
+
+    def microsoft(batch=False, sync=False):
+        def run():
+            if batch:
+                extraction = get_weeks_data_batch(token_dict, datetime_ranges)
+            else:
+                extraction = get_weeks_data(create_graph_client_from_token(token_dict), datetime_ranges, sync=sync)
+            features, errors = asyncio.run(extraction)
+            return sum(1 for week_errors in errors if week_errors)
+        return run
+
+    return {
+        "google:range": google("range"),
+        "google:weekly": google("weekly"),
+        "google:sync": google("sync"),
+        "microsoft": microsoft(batch=False),
+        "microsoft:batch": microsoft(batch=True),
+        "microsoft:sync": microsoft(sync=True),
+    }
+
+
+def run(url=None, weeks=DEFAULT_WEEKS, repeat=DEFAULT_REPEAT, targets=None, fake_config=None, port=9000) -> dict:
+    url = url or start_server(port)
+    if fake_config:
+        fake_request(url, "/_fake/config", fake_config)
+
+    # Los clientes leen la URL base al importarse
+    work_dir = Path(tempfile.mkdtemp(prefix="ekilibria-bench-"))
+    os.environ["GOOGLE_API_BASE_URL"] = url
+    os.environ["GRAPH_API_BASE_URL"] = f"{url}/v1.0"
+    os.environ["SYNC_DIR"] = str(work_dir / "sync")
+
+    available = build_targets(work_dir, weeks)
+    results = []
+    for name in targets or DEFAULT_TARGETS:
+        # Una corrida de calentamiento: imports perezosos de msgraph y, en "google:sync", la carga completa inicial
+        available[name]()
+        timings = []
+        for i in range(repeat):
+            fake_request(url, "/_fake/stats?reset=true")
+            start = time.perf_counter()
+            failed_weeks = available[name]()
+            timings.append(time.perf_counter() - start)
+            calls = fake_request(url, "/_fake/stats?reset=true")
+
+        timings.sort()
+        result = {
+            "target": name,
+            "weeks": weeks,
+            "repeat": repeat,
+            "p50_s": round(timings[len(timings) // 2], 3),
+            "max_s": round(timings[-1], 3),
+            "failed_weeks": failed_weeks,
+            # Requests HTTP de la última repetición, sin contar las partes de cada batch
+            "requests": sum(count for key, count in calls.items() if key not in ("429", "503") and not key.endswith(".item")),
+            "requests_by_api": calls,
+        }
+        results.append(result)
+        print(f"{name:<16} semanas={weeks:>3}  p50={result['p50_s']:>8.3f}s  max={result['max_s']:>8.3f}s  requests={result['requests']:>6}")
+
+    return {"url": url, "results": results}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark de extracción contra el servidor falso de Google/Graph")
+    parser.add_argument("--url", help="URL de un servidor falso ya levantado (por defecto se levanta uno)")
+    parser.add_argument("--port", type=int, default=9000, help="Puerto del servidor que se levanta")
+    parser.add_argument("--weeks", type=int, default=DEFAULT_WEEKS, help="Semanas a extraer")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Repeticiones por modo")
+    parser.add_argument("--targets", help="Modos a medir separados por coma (" + ",".join(DEFAULT_TARGETS) + ")")
+    parser.add_argument("--latency-ms", type=float, help="Latencia por request del servidor falso")
+    parser.add_argument("--rate-limit-rate", type=float, help="Probabilidad de 429 del servidor falso")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    fake_config = {}
+    if args.latency_ms is not None:
+        fake_config["latency_ms"] = args.latency_ms
+    if args.rate_limit_rate is not None:
+        fake_config["rate_limit_rate"] = args.rate_limit_rate
+
+    report = run(
+        url=args.url,
+        weeks=args.weeks,
+        repeat=args.repeat,
+        targets=args.targets.split(",") if args.targets else None,
+        fake_config=fake_config,
+        port=args.port
+    )
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\n✅ Resultados guardados en {args.output}")
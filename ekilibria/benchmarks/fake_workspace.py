@@ -0,0 +1,670 @@
+"""
+Servidor local que imita Google Workspace (Gmail, Calendar, Drive) y
+Microsoft Graph (mail, eventos, OneDrive) con datos sintéticos, para medir
+la extracción de features sin red ni tenants reales.
+
+Los clientes existentes lo usan con:
+    GOOGLE_API_BASE_URL=http://localhost:9000
+    GRAPH_API_BASE_URL=http://localhost:9000/v1.0
+
+Las sub-requests de un $batch de Graph (POST /v1.0/$batch) se cuentan en
+/_fake/stats como "<api>.item", aparte de la llamada "graph.batch".
+
+Uso:
+    uvicorn ekilibria.benchmarks.fake_workspace:app --port 9000
+    FAKE_LATENCY_MS=80 FAKE_RATE_LIMIT_RATE=0.05 uvicorn ekilibria.benchmarks.fake_workspace:app --port 9000
+
+La configuración se puede cambiar en caliente con POST /_fake/config y los
+contadores de requests se leen (y reinician) en /_fake/stats.
+"""
+import os
+import re
+import json
+import random
+import asyncio
+import hashlib
+import contextvars
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, parse_qs
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# --- Configuración (variables de entorno FAKE_*) ---
+
+DEFAULT_CONFIG = {
+    # Volumen de datos sintéticos
+    "seed": 42,
+    "days": 120,                 # días hacia atrás desde hoy con actividad
+    "messages_per_day": 40,
+    "sent_ratio": 0.3,
+    "events_per_day": 6,
+    "files": 300,
+    "folders": 10,
+    "user_email": "usuario@ekilibria.test",
+    "graph_time_zone": "UTC",    # zona (nombre de Windows) de los mailbox settings de Graph
+    # Paginación
+    "max_page_size": 500,        # tope de maxResults/pageSize/$top en todas las APIs
+    "graph_default_top": 10,     # tamaño de página de Graph si no se pide $top
+    # Latencia y errores
+    "latency_ms": 0.0,
+    "latency_jitter_ms": 0.0,
+    "error_rate": 0.0,           # probabilidad de responder 503
+    "rate_limit_rate": 0.0,      # probabilidad de responder 429
+    "retry_after": 1,            # segundos del header Retry-After en los 429
+}
+
+
+def load_config():
+    config = {}
+    for key, default in DEFAULT_CONFIG.items():
+        value = os.getenv(f"FAKE_{key.upper()}")
+        config[key] = type(default)(value) if value is not None else default
+    return config
+
+
+config = load_config()
+stats = Counter()
+_rng = random.Random(config["seed"])
+
+# True mientras se atienden las sub-requests de un $batch de Graph
+_in_graph_batch = contextvars.ContextVar("in_graph_batch", default=False)
+
+# Máximo de sub-requests por $batch que acepta Graph
+GRAPH_BATCH_LIMIT = 20
+
+
+# --- Datos sintéticos ---
+
+def _id(prefix, i):
+    return f"{prefix}{hashlib.md5(f'{prefix}{i}'.encode()).hexdigest()[:16]}"
+
+
+def generate_dataset(cfg):
+    """Genera mensajes, eventos y archivos deterministas para la configuración dada."""
+    rng = random.Random(cfg["seed"])
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=cfg["days"])
+
+    messages = []
+    events = []
+    for day in range(cfg["days"] + 1):
+        date = start + timedelta(days=day)
+        for _ in range(rng.randint(cfg["messages_per_day"] // 2, cfg["messages_per_day"] * 3 // 2)):
+            sent = rng.random() < cfg["sent_ratio"]
+            labels = ["SENT"] if sent else ["INBOX", rng.choice(["CATEGORY_PERSONAL"] * 3 + ["CATEGORY_PROMOTIONS", "CATEGORY_UPDATES"])]
+            messages.append({
+                "id": _id("m", len(messages)),
+                "date": date + timedelta(seconds=rng.randrange(86400)),
+                "labels": labels,
+            })
+
+        minute = 8 * 60
+        for _ in range(rng.randint(0, cfg["events_per_day"] * 2)):
+            # Algunas reuniones se solapan o quedan pegadas a la anterior
+            minute += rng.choice([-30, 0, 5, 15, 30, 60, 90])
+            duration = rng.choice([15, 30, 45, 60, 90, 120])
+            event_start = date + timedelta(minutes=max(minute, 0))
+            events.append({
+                "id": _id("e", len(events)),
+                "start": event_start,
+                "end": event_start + timedelta(minutes=duration),
+                "subject": f"Reunión {len(events)}",
+            })
+            minute += duration
+
+    messages.sort(key=lambda m: m["date"])
+    events.sort(key=lambda e: e["start"])
+
+    others = ["colega@ekilibria.test", "jefe@ekilibria.test"]
+    folders = [{"id": _id("d", i), "name": f"Carpeta {i}"} for i in range(cfg["folders"])]
+    files = []
+    for i in range(cfg["files"]):
+        created = start - timedelta(days=30) + timedelta(seconds=rng.randrange((cfg["days"] + 30) * 86400))
+        modified = min(created + timedelta(seconds=rng.randrange(20 * 86400)), today + timedelta(hours=23))
+        files.append({
+            "id": _id("f", i),
+            "name": f"Documento {i}.docx",
+            "created": created,
+            "modified": modified,
+            "owner": cfg["user_email"] if rng.random() < 0.6 else rng.choice(others),
+            "last_editor": cfg["user_email"] if rng.random() < 0.7 else rng.choice(others),
+            "parent": rng.choice(folders)["id"] if folders and rng.random() < 0.7 else "root",
+        })
+
+    return {"messages": messages, "events": events, "files": files, "folders": folders}
+
+
+dataset = generate_dataset(config)
+messages_by_id = {m["id"]: m for m in dataset["messages"]}
+# Cambia cada vez que se regenera el dataset: los delta tokens de OneDrive anteriores dejan de valer
+dataset_version = 0
+
+
+# --- Utilidades ---
+
+def _rfc3339(dt):
+    return dt.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _parse_time(value):
+    value = value.strip("'\"").replace("Z", "+00:00")
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _page(items, size, offset):
+    size = max(1, min(int(size), config["max_page_size"]))
+    offset = int(offset or 0)
+    next_offset = offset + size if offset + size < len(items) else None
+    return items[offset:offset + size], next_offset
+
+
+async def _simulate(api):
+    """Suma latencia y, con la probabilidad configurada, devuelve un 429 o 503 en lugar de la respuesta."""
+    if _in_graph_batch.get():
+        # Sub-request de un $batch: la latencia ya la pagó el batch, pero puede fallar por separado
+        stats[f"{api}.item"] += 1
+    else:
+        stats[api] += 1
+        latency = config["latency_ms"] + _rng.uniform(0, config["latency_jitter_ms"])
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    roll = _rng.random()
+    if roll < config["rate_limit_rate"]:
+        stats["429"] += 1
+        return _error(429, "rateLimitExceeded", {"Retry-After": str(config["retry_after"])})
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        stats["503"] += 1
+        return _error(503, "backendError")
+    return None
+
+
+def _error(status, reason, headers=None):
+    body = {"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}}
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+app = FastAPI(title="ekilibria fake workspace")
+
+
+# --- Control ---
+
+@app.get("/_fake/stats")
+def get_stats(reset: bool = False):
+    current = dict(stats)
+    if reset:
+        stats.clear()
+    return current
+
+
+@app.post("/_fake/config")
+async def set_config(request: Request):
+    """Actualiza la configuración; si cambia el volumen de datos, regenera el dataset."""
+    global dataset, messages_by_id, dataset_version
+    changes = await request.json()
+    unknown = [key for key in changes if key not in DEFAULT_CONFIG]
+    if unknown:
+        return JSONResponse({"error": f"Claves desconocidas: {unknown}"}, status_code=400)
+
+    config.update({key: type(DEFAULT_CONFIG[key])(value) for key, value in changes.items()})
+    if set(changes) & {"seed", "days", "messages_per_day", "sent_ratio", "events_per_day", "files", "folders", "user_email"}:
+        dataset = generate_dataset(config)
+        messages_by_id = {m["id"]: m for m in dataset["messages"]}
+        dataset_version += 1
+    return config
+
+
+# --- Gmail ---
+
+def _gmail_matches(message, query):
+    terms = dict(term.split(":", 1) for term in query.split() if ":" in term)
+    local_date = message["date"].astimezone().replace(tzinfo=None)
+    if "after" in terms and local_date < datetime.strptime(terms["after"], "%Y/%m/%d"):
+        return False
+    if "before" in terms and local_date >= datetime.strptime(terms["before"], "%Y/%m/%d"):
+        return False
+    if terms.get("in") == "sent" and "SENT" not in message["labels"]:
+        return False
+    if terms.get("in") == "inbox" and "INBOX" not in message["labels"]:
+        return False
+    if terms.get("category") == "primary" and "CATEGORY_PERSONAL" not in message["labels"]:
+        return False
+    return True
+
+
+def _gmail_message(message, fmt="full"):
+    body = {
+        "id": message["id"],
+        "threadId": message["id"],
+        "labelIds": message["labels"],
+        "internalDate": str(int(message["date"].timestamp() * 1000)),
+    }
+    if fmt != "minimal":
+        body["payload"] = {"headers": [{"name": "Subject", "value": f"Mensaje {message['id']}"}]}
+    return body
+
+
+@app.get("/gmail/v1/users/{user_id}/messages")
+async def gmail_list(user_id: str, q: str = "", maxResults: int = 100, pageToken: str = None):
+    if (error := await _simulate("gmail.messages.list")):
+        return error
+    matches = [m for m in dataset["messages"] if _gmail_matches(m, q)]
+    page, next_offset = _page(matches, maxResults, pageToken)
+    body = {"messages": [{"id": m["id"], "threadId": m["id"]} for m in page], "resultSizeEstimate": len(matches)}
+    if next_offset is not None:
+        body["nextPageToken"] = str(next_offset)
+    return body
+
+
+@app.get("/gmail/v1/users/{user_id}/messages/{message_id}")
+async def gmail_get(user_id: str, message_id: str, format: str = "full"):
+    if (error := await _simulate("gmail.messages.get")):
+        return error
+    message = messages_by_id.get(message_id)
+    if message is None:
+        return _error(404, "notFound")
+    return _gmail_message(message, format)
+
+
+@app.get("/gmail/v1/users/{user_id}/profile")
+async def gmail_profile(user_id: str):
+    if (error := await _simulate("gmail.profile")):
+        return error
+    return {"emailAddress": config["user_email"], "historyId": str(len(dataset["messages"]))}
+
+
+@app.get("/gmail/v1/users/{user_id}/history")
+async def gmail_history(user_id: str, startHistoryId: str):
+    if (error := await _simulate("gmail.history.list")):
+        return error
+    # El dataset no cambia: no hay historia nueva
+    return {"history": [], "historyId": str(len(dataset["messages"]))}
+
+
+@app.post("/batch")
+@app.post("/batch/{api}/{version}")
+async def google_batch(request: Request, api: str = "gmail", version: str = "v1"):
+    """Batch multipart/mixed de Google: cada parte es un GET embebido."""
+    if (error := await _simulate(f"{api}.batch")):
+        return error
+
+    boundary = re.search(r'boundary="?([^";]+)"?', request.headers.get("content-type", "")).group(1)
+    body = (await request.body()).decode()
+    parts = [part for part in body.split(f"--{boundary}") if part.strip() and part.strip() != "--"]
+
+    out_boundary = "batch_fake_workspace"
+    responses = []
+    for part in parts:
+        headers, http_request = re.split(r"\r?\n\r?\n", part.strip(), maxsplit=1)
+        content_id = re.search(r"Content-ID:\s*<?([^>\r\n]+)>?", headers, re.IGNORECASE).group(1)
+        request_line = http_request.splitlines()[0]
+        method, url, _ = request_line.split(" ", 2)
+
+        status, payload = await _batch_item(method, url)
+        responses.append(
+            f"--{out_boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{json.dumps(payload)}\r\n"
+        )
+    content = "".join(responses) + f"--{out_boundary}--\r\n"
+    return Response(content, media_type=f"multipart/mixed; boundary={out_boundary}")
+
+
+async def _batch_item(method, url):
+    stats["gmail.batch.item"] += 1
+    roll = _rng.random()
+    if roll < config["rate_limit_rate"]:
+        stats["429"] += 1
+        return 429, {"error": {"code": 429, "message": "rateLimitExceeded"}}
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        stats["503"] += 1
+        return 503, {"error": {"code": 503, "message": "backendError"}}
+
+    parsed = urlsplit(url)
+    match = re.search(r"/users/[^/]+/messages/([^/?]+)$", parsed.path)
+    message = messages_by_id.get(match.group(1)) if match else None
+    if method != "GET" or message is None:
+        return 404, {"error": {"code": 404, "message": "notFound"}}
+    fmt = parse_qs(parsed.query).get("format", ["full"])[0]
+    return 200, _gmail_message(message, fmt)
+
+
+# --- Calendar ---
+
+def _calendar_event(event):
+    return {
+        "id": event["id"],
+        "status": "confirmed",
+        "summary": event["subject"],
+        "start": {"dateTime": _rfc3339(event["start"])},
+        "end": {"dateTime": _rfc3339(event["end"])},
+    }
+
+
+@app.get("/calendar/v3/calendars/{calendar_id}/events")
+async def calendar_events(calendar_id: str, timeMin: str = None, timeMax: str = None, syncToken: str = None,
+                          maxResults: int = 250, pageToken: str = None):
+    if (error := await _simulate("calendar.events.list")):
+        return error
+
+    if syncToken:
+        # El dataset no cambia: no hay cambios desde el último syncToken
+        return {"items": [], "nextSyncToken": syncToken}
+
+    events = dataset["events"]
+    if timeMin:
+        events = [e for e in events if e["end"] > _parse_time(timeMin)]
+    if timeMax:
+        events = [e for e in events if e["start"] < _parse_time(timeMax)]
+
+    page, next_offset = _page(events, maxResults, pageToken)
+    body = {"items": [_calendar_event(e) for e in page]}
+    if next_offset is not None:
+        body["nextPageToken"] = str(next_offset)
+    else:
+        body["nextSyncToken"] = f"sync-{len(dataset['events'])}"
+    return body
+
+
+# --- Drive ---
+
+def _drive_file(file):
+    return {
+        "id": file["id"],
+        "name": file["name"],
+        "createdTime": _rfc3339(file["created"]),
+        "modifiedTime": _rfc3339(file["modified"]),
+        "owners": [{"emailAddress": file["owner"]}],
+        "lastModifyingUser": {"emailAddress": file["last_editor"]},
+    }
+
+
+@app.get("/drive/v3/about")
+async def drive_about():
+    if (error := await _simulate("drive.about")):
+        return error
+    return {"user": {"emailAddress": config["user_email"]}}
+
+
+@app.get("/drive/v3/files")
+async def drive_files(q: str = "", pageSize: int = 100, pageToken: str = None):
+    if (error := await _simulate("drive.files.list")):
+        return error
+
+    files = dataset["files"]
+    for field, op, value in re.findall(r"(modifiedTime|createdTime)\s*(>=|<=|<|>)\s*'([^']+)'", q):
+        key = "modified" if field == "modifiedTime" else "created"
+        bound = _parse_time(value)
+        compare = {">=": lambda a: a >= bound, "<=": lambda a: a <= bound, "<": lambda a: a < bound, ">": lambda a: a > bound}[op]
+        files = [f for f in files if compare(f[key])]
+
+    page, next_offset = _page(files, pageSize, pageToken)
+    body = {"files": [_drive_file(f) for f in page]}
+    if next_offset is not None:
+        body["nextPageToken"] = str(next_offset)
+    return body
+
+
+@app.get("/drive/v3/changes/startPageToken")
+async def drive_start_page_token():
+    if (error := await _simulate("drive.changes.startPageToken")):
+        return error
+    return {"startPageToken": "1"}
+
+
+@app.get("/drive/v3/changes")
+async def drive_changes(pageToken: str):
+    if (error := await _simulate("drive.changes.list")):
+        return error
+    return {"changes": [], "newStartPageToken": pageToken}
+
+
+# --- Microsoft Graph ---
+
+def _graph_time(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.0000000")
+
+
+def _graph_page(request, items, default_top=None):
+    """Página al estilo Graph: `value` y un @odata.nextLink absoluto mientras queden elementos."""
+    params = request.query_params
+    top = int(params.get("$top", default_top or config["graph_default_top"]))
+    page, next_offset = _page(items, top, params.get("$skip"))
+    if params.get("$select"):
+        # Proyección: solo los campos pedidos (más id)
+        fields = {field.strip() for field in params["$select"].split(",")} | {"id"}
+        page = [{key: value for key, value in item.items() if key in fields} for item in page]
+    body = {"value": page}
+    if "$count" in params and params["$count"].lower() == "true":
+        body["@odata.count"] = len(items)
+    if next_offset is not None:
+        query = {key: value for key, value in params.items() if key != "$skip"}
+        query["$skip"] = str(next_offset)
+        query["$top"] = str(top)
+        body["@odata.nextLink"] = str(request.url.replace_query_params(**query))
+    return body
+
+
+def _graph_filter_range(filter_expr, field):
+    """Extrae los límites `field ge X` / `field le X` (y gt/lt) de un $filter de Graph."""
+    bounds = {}
+    for op, value in re.findall(rf"{re.escape(field)}\s+(ge|gt|le|lt)\s+'?([0-9T:\-\.Z+]+)'?", filter_expr or ""):
+        bounds[op] = _parse_time(value)
+    return bounds
+
+
+def _in_bounds(dt, bounds):
+    return (
+        ("ge" not in bounds or dt >= bounds["ge"]) and ("gt" not in bounds or dt > bounds["gt"])
+        and ("le" not in bounds or dt <= bounds["le"]) and ("lt" not in bounds or dt < bounds["lt"])
+    )
+
+
+@app.get("/v1.0/me")
+async def graph_me():
+    if (error := await _simulate("graph.me")):
+        return error
+    return {"id": "fake-user", "mail": config["user_email"], "displayName": "Usuario de prueba"}
+
+
+@app.get("/v1.0/me/mailboxSettings")
+async def graph_mailbox_settings():
+    if (error := await _simulate("graph.mailboxSettings")):
+        return error
+    return {
+        "timeZone": config["graph_time_zone"],
+        "workingHours": {
+            "daysOfWeek": ["monday", "tuesday", "wednesday", "thursday", "friday"],
+            "startTime": "09:00:00.0000000",
+            "endTime": "18:00:00.0000000",
+            "timeZone": {"name": config["graph_time_zone"]},
+        },
+    }
+
+
+@app.get("/v1.0/me/mailFolders/{folder}/messages")
+async def graph_messages(folder: str, request: Request):
+    if (error := await _simulate("graph.messages.list")):
+        return error
+    label = "SENT" if folder.lower() == "sentitems" else "INBOX"
+    bounds = _graph_filter_range(request.query_params.get("$filter"), "receivedDateTime")
+    messages = [
+        m for m in dataset["messages"]
+        if label in m["labels"] and _in_bounds(m["date"], bounds)
+    ]
+    if "desc" in request.query_params.get("$orderby", ""):
+        messages = messages[::-1]
+    return _graph_page(request, [
+        {"id": m["id"], "receivedDateTime": _rfc3339(m["date"]), "subject": f"Mensaje {m['id']}"}
+        for m in messages
+    ])
+
+
+@app.get("/v1.0/me/events")
+async def graph_events(request: Request):
+    if (error := await _simulate("graph.events.list")):
+        return error
+    filter_expr = request.query_params.get("$filter")
+    start_bounds = _graph_filter_range(filter_expr, "start/dateTime")
+    end_bounds = _graph_filter_range(filter_expr, "end/dateTime")
+    events = [
+        e for e in dataset["events"]
+        if _in_bounds(e["start"], start_bounds) and _in_bounds(e["end"], end_bounds)
+    ]
+    return _graph_page(request, [
+        {
+            "id": e["id"],
+            "subject": e["subject"],
+            "start": {"dateTime": _graph_time(e["start"]), "timeZone": "UTC"},
+            "end": {"dateTime": _graph_time(e["end"]), "timeZone": "UTC"},
+        }
+        for e in events
+    ])
+
+
+def _graph_drive_item(file):
+    return {
+        "id": file["id"],
+        "name": file["name"],
+        "file": {"mimeType": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"},
+        "createdDateTime": _rfc3339(file["created"]),
+        "lastModifiedDateTime": _rfc3339(file["modified"]),
+        "lastModifiedBy": {"user": {"email": file["last_editor"]}},
+        "parentReference": {"id": file["parent"]},
+    }
+
+
+@app.get("/v1.0/me/drive")
+async def graph_drive():
+    if (error := await _simulate("graph.drive")):
+        return error
+    return {"id": "drive-fake", "driveType": "business"}
+
+
+@app.get("/v1.0/drives/{drive_id}/items/{item_id}/children")
+async def graph_children(drive_id: str, item_id: str, request: Request):
+    if (error := await _simulate("graph.drive.children")):
+        return error
+    items = []
+    if item_id == "root":
+        items += [
+            {"id": folder["id"], "name": folder["name"], "folder": {"childCount": 0}}
+            for folder in dataset["folders"]
+        ]
+    items += [_graph_drive_item(f) for f in dataset["files"] if f["parent"] == item_id]
+    return _graph_page(request, items, default_top=200)
+
+
+@app.get("/v1.0/me/mailFolders/{folder}/messages/delta")
+@app.get("/v1.0/me/mailFolders/{folder}/messages/delta()")
+async def graph_messages_delta(folder: str, request: Request, token: str = None):
+    """Delta de mensajes de una carpeta: sin token, los recibidos desde el `ge` del $filter; con token, los cambios (ninguno)."""
+    if (error := await _simulate("graph.messages.delta")):
+        return error
+    if token is not None:
+        return _graph_delta_changes(request, token)
+
+    label = "SENT" if folder.lower() == "sentitems" else "INBOX"
+    bounds = _graph_filter_range(request.query_params.get("$filter"), "receivedDateTime")
+    messages = [m for m in dataset["messages"] if label in m["labels"] and _in_bounds(m["date"], bounds)]
+    return _graph_delta_page(request, [
+        {"id": m["id"], "receivedDateTime": _rfc3339(m["date"]), "subject": f"Mensaje {m['id']}"}
+        for m in messages
+    ])
+
+
+@app.get("/v1.0/me/calendarView/delta")
+@app.get("/v1.0/me/calendarView/delta()")
+async def graph_calendar_view_delta(request: Request, startDateTime: str = None, endDateTime: str = None, token: str = None):
+    """Delta de calendarView: sin token, los eventos que se cruzan con la ventana; con token, los cambios (ninguno)."""
+    if (error := await _simulate("graph.calendarView.delta")):
+        return error
+    if token is not None:
+        return _graph_delta_changes(request, token)
+
+    start, end = _parse_time(startDateTime), _parse_time(endDateTime)
+    events = [e for e in dataset["events"] if e["end"] > start and e["start"] < end]
+    return _graph_delta_page(request, [
+        {
+            "id": e["id"],
+            "subject": e["subject"],
+            "start": {"dateTime": _graph_time(e["start"]), "timeZone": "UTC"},
+            "end": {"dateTime": _graph_time(e["end"]), "timeZone": "UTC"},
+        }
+        for e in events
+    ])
+
+
+def _graph_delta_page(request, items):
+    """Página de una carga completa de delta: la última trae el @odata.deltaLink en lugar del nextLink."""
+    body = _graph_page(request, items, default_top=200)
+    if "@odata.nextLink" not in body:
+        body["@odata.deltaLink"] = str(request.url.replace_query_params(token=str(dataset_version)))
+    return body
+
+
+def _graph_delta_changes(request, token):
+    """Cambios desde un delta token: ninguno si el dataset no cambió, 410 si se regeneró (como Graph)."""
+    if token != str(dataset_version):
+        return _error(410, "resyncRequired")
+    return {"value": [], "@odata.deltaLink": str(request.url.replace_query_params(token=str(dataset_version)))}
+
+
+@app.get("/v1.0/me/drive/root/delta")
+@app.get("/v1.0/drives/{drive_id}/items/{item_id}/delta")
+@app.get("/v1.0/drives/{drive_id}/items/{item_id}/delta()")
+async def graph_drive_delta(request: Request, token: str = None):
+    """Delta de OneDrive: sin token, todo el árbol paginado; con el token del deltaLink, los cambios (ninguno)."""
+    if (error := await _simulate("graph.drive.delta")):
+        return error
+    if token is not None:
+        return _graph_delta_changes(request, token)
+
+    items = [
+        {"id": folder["id"], "name": folder["name"], "folder": {"childCount": 0}, "parentReference": {"id": "root"}}
+        for folder in dataset["folders"]
+    ]
+    items += [_graph_drive_item(f) for f in dataset["files"]]
+    return _graph_delta_page(request, items)
+
+
+@app.post("/v1.0/$batch")
+async def graph_batch(request: Request):
+    """$batch JSON de Graph: cada sub-request se resuelve contra los endpoints de este mismo servidor."""
+    if (error := await _simulate("graph.batch")):
+        return error
+    requests = (await request.json()).get("requests", [])
+    if len(requests) > GRAPH_BATCH_LIMIT:
+        return _error(400, f"El batch admite como máximo {GRAPH_BATCH_LIMIT} requests")
+
+    base_url = f"{str(request.base_url).rstrip('/')}/v1.0"
+    token = _in_graph_batch.set(True)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+            responses = await asyncio.gather(*(_graph_batch_item(client, item) for item in requests))
+    finally:
+        _in_graph_batch.reset(token)
+    return {"responses": responses}
+
+
+async def _graph_batch_item(client, item):
+    response = await client.request(item.get("method", "GET"), item["url"], headers=item.get("headers"))
+    headers = {key: value for key, value in response.headers.items() if key.lower() in ("retry-after", "content-type")}
+    return {"id": item["id"], "status": response.status_code, "headers": headers, "body": response.json()}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Servidor local que imita Google Workspace y Microsoft Graph")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    uvicorn.run(app, host=args.host, port=args.port)
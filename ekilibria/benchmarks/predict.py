@@ -0,0 +1,243 @@
+"""
+Benchmark reproducible del camino de predicción y explicación.
+
+Genera semanas con generate_synthetic_dataset.py (semilla fija) y mide
+predict_weektype, predict_burnoutindex, compute_burnout_contributions,
+predict_batch y el endpoint /predict_new (vía el cliente ASGI de prueba)
+para distintos tamaños de lote. Reporta throughput, latencia p50/p99 y el
+pico de RSS, y guarda los resultados en JSON para comparar commits.
+
+Uso:
+    python -m ekilibria.benchmarks.predict
+    python -m ekilibria.benchmarks.predict --sizes 1,12,100 --repeat 50
+    python -m ekilibria.benchmarks.predict --compare benchmarks/results/<commit>.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import resource
+import subprocess
+import warnings
+import numpy as np
+from pathlib import Path
+from datetime import datetime, timezone
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000]
+DEFAULT_REPEAT = 20
+DEFAULT_SEED = 42
+# Las funciones de a una semana se miden en lotes de hasta este tamaño
+MAX_SIZE_PER_ROW = 1000
+# Una regresión es un p50 más de este factor por encima del de referencia
+DEFAULT_THRESHOLD = 1.2
+
+# Columnas del dataset sintético que no son features
+LABEL_COLUMNS = ["tipo_de_semana", "burnout_index", "week_code"]
+
+
+def generate_weeks(n_rows: int, seed: int = DEFAULT_SEED) -> list:
+    """Genera `n_rows` semanas sintéticas con las features del modelo, siempre las mismas para una semilla."""
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    import generate_synthetic_dataset
+
+    random.seed(seed)
+    np.random.seed(seed)
+    generate_synthetic_dataset.N_ROWS = n_rows
+    rows = generate_synthetic_dataset.generate_rows()
+
+    # El generador mezcla filas por tipo: las desordenamos para que cualquier prefijo sea representativo
+    random.Random(seed).shuffle(rows)
+
+    weeks = []
+    for i, row in enumerate(rows):
+        week = {key: value for key, value in row.items() if key not in LABEL_COLUMNS}
+        week["fecha_desde"] = f"semana-{i}"
+        week["fecha_hasta"] = f"semana-{i}"
+        weeks.append(week)
+    return weeks
+
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso hasta ahora, en MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(fn, size: int, repeat: int) -> dict:
+    """Ejecuta `fn` `repeat` veces (más una de calentamiento) y resume las latencias."""
+    fn()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "size": size,
+        "repeat": repeat,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "mean_ms": round(float(latencies.mean()), 4),
+        "rows_per_s": round(size * repeat / (latencies.sum() / 1000), 1),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def build_targets(weeks_by_size: dict) -> dict:
+    """Devuelve {nombre: fn(size) -> callable} con cada punto del camino caliente a medir."""
+    from fastapi.testclient import TestClient
+    from ekilibria.api.fast import app
+    from ekilibria.ml_logic.predict import (
+        predict_weektype, predict_burnoutindex, compute_burnout_contributions, predict_batch
+    )
+
+    client = TestClient(app)
+
+    def per_row(fn):
+        def target(size):
+            weeks = weeks_by_size[size]
+            return lambda: [fn(week) for week in weeks]
+        return target
+
+    def batch(size):
+        weeks = weeks_by_size[size]
+        return lambda: predict_batch(weeks)
+
+    def endpoint(size):
+        payload = {"features": weeks_by_size[size]}
+
+        def call():
+            response = client.post("/predict_new", json=payload)
+            response.raise_for_status()
+        return call
+
+    return {
+        "predict_weektype": per_row(predict_weektype),
+        "predict_burnoutindex": per_row(predict_burnoutindex),
+        "compute_burnout_contributions": per_row(compute_burnout_contributions),
+        "predict_batch": batch,
+        "/predict_new": endpoint,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, seed=DEFAULT_SEED, targets=None, use_cache=False) -> dict:
+    from ekilibria.ml_logic.cache import prediction_cache
+    from ekilibria.ml_logic.registry import warmup
+
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    # Sin caché medimos el costo real de los modelos, no el de un hit
+    if not use_cache:
+        prediction_cache.maxsize = 0
+
+    weeks = generate_weeks(max(sizes), seed)
+    weeks_by_size = {size: weeks[:size] for size in sizes}
+
+    warmup()
+    available = build_targets(weeks_by_size)
+    selected = targets or list(available)
+
+    results = []
+    for name in selected:
+        for size in sizes:
+            if name in ("predict_weektype", "predict_burnoutindex", "compute_burnout_contributions") and size > MAX_SIZE_PER_ROW:
+                continue
+            # Menos repeticiones para los lotes grandes
+            n_repeat = max(3, repeat if size <= 100 else repeat // 4)
+            result = measure(available[name](size), size, n_repeat)
+            result["target"] = name
+            results.append(result)
+            print(
+                f"{name:<32} size={size:>6}  p50={result['p50_ms']:>10.3f}ms  "
+                f"p99={result['p99_ms']:>10.3f}ms  {result['rows_per_s']:>12.1f} filas/s  "
+                f"rss={result['peak_rss_mb']}MB"
+            )
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "sizes": sizes,
+            "repeat": repeat,
+            "cache": use_cache,
+            "env": {
+                key: os.environ[key]
+                for key in ("SHAP_METHOD", "FLAT_FOREST", "FLAT_FOREST_MAX_ROWS", "MODEL_MMAP_MODE", "MICROBATCH")
+                if key in os.environ
+            }
+        },
+        "results": results
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Compara los p50 con los de una corrida anterior y devuelve las regresiones."""
+    previous = {(r["target"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+
+    print(f"\nComparación contra {baseline['meta'].get('commit')} (umbral x{threshold}):")
+    for result in current["results"]:
+        old = previous.get((result["target"], result["size"]))
+        if old is None:
+            continue
+        ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        flag = "❌" if ratio > threshold else "✅"
+        print(f"{flag} {result['target']:<32} size={result['size']:>6}  p50 {old['p50_ms']:.3f}ms → {result['p50_ms']:.3f}ms (x{ratio:.2f})")
+        if ratio > threshold:
+            regressions.append({**result, "baseline_p50_ms": old["p50_ms"], "ratio": round(ratio, 3)})
+
+    return regressions
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark de predicción y explicación")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Tamaños de lote separados por coma")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Repeticiones por medición")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Semilla del dataset sintético")
+    parser.add_argument("--targets", help="Subconjunto de funciones a medir, separadas por coma")
+    parser.add_argument("--cache", action="store_true", help="Medir con la caché de predicciones activa")
+    parser.add_argument("--output", help="Archivo JSON de salida (por defecto benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="JSON de una corrida anterior contra el cual buscar regresiones")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Factor de p50 que cuenta como regresión")
+    args = parser.parse_args()
+
+    report = run(
+        sizes=[int(size) for size in args.sizes.split(",")],
+        repeat=args.repeat,
+        seed=args.seed,
+        targets=args.targets.split(",") if args.targets else None,
+        use_cache=args.cache
+    )
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['meta']['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n✅ Resultados guardados en {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
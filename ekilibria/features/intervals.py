@@ -0,0 +1,128 @@
+"""
+Cálculos sobre intervalos (reuniones) vectorizados con NumPy.
+
+Todas las funciones reciben arrays planos de inicios y fines de eventos de
+muchos usuarios y semanas a la vez, más un array `group` con el id (0..n-1)
+del usuario/semana al que pertenece cada evento, y devuelven un valor por
+grupo. Los usan tanto Google (extract_calendar_features) como Microsoft
+(get_events); cada proveedor conserva sus propias definiciones (límite de
+"sin descanso", unidades), que son entradas de los modelos.
+"""
+import numpy as np
+
+# Un hueco menor a esto entre dos reuniones cuenta como "sin descanso"
+NO_BREAK_MINUTES = 15
+
+SECONDS = np.timedelta64(1, 's')
+
+
+def to_datetime64(datetimes):
+    """Convierte una lista de datetime (naive, o aware → se toma su hora de pared) a datetime64[s]."""
+    return np.array([dt.replace(tzinfo=None) for dt in datetimes], dtype='datetime64[s]')
+
+
+def _groups(n_events, group=None, n_groups=None):
+    group = np.zeros(n_events, dtype=np.int64) if group is None else np.asarray(group, dtype=np.int64)
+    if n_groups is None:
+        n_groups = int(group.max()) + 1 if len(group) else 1
+    return group, n_groups
+
+
+def group_sum(values, group, n_groups):
+    """Suma `values` (o cuenta los True) por grupo."""
+    return np.bincount(group, weights=np.asarray(values, dtype=float), minlength=n_groups).astype(float)
+
+
+def sweep_gaps(start, end, group=None):
+    """
+    Barrido por grupo: ordena los eventos por inicio (estable: los empates
+    quedan en el orden de entrada) y devuelve, en el orden original, los
+    segundos entre el inicio de cada evento y el fin del evento anterior de
+    su grupo (NaN para el primero de cada grupo).
+
+    Un hueco negativo es un solapamiento. Como en el cálculo original de
+    ambos proveedores, solo se compara contra el evento inmediatamente
+    anterior: un evento que empieza después de que termine una reunión
+    anidada no cuenta como solapado aunque la reunión larga siga en curso.
+    """
+    n = len(start)
+    group, _ = _groups(n, group)
+    gaps = np.full(n, np.nan)
+    if n == 0:
+        return gaps
+
+    order = np.lexsort((start, group))
+    g = group[order]
+    first = np.r_[True, g[1:] != g[:-1]]
+
+    sorted_gaps = np.r_[np.nan, (start[order][1:] - end[order][:-1]) / SECONDS]
+    sorted_gaps[first] = np.nan
+    gaps[order] = sorted_gaps
+    return gaps
+
+
+def hour_of_day(local):
+    """Hora (0-23) de cada datetime64 en hora local."""
+    return ((local - local.astype('datetime64[D]')) // np.timedelta64(1, 'h')).astype(np.int64)
+
+
+def seconds_of_day(local):
+    """Segundos desde la medianoche de cada datetime64 en hora local."""
+    return ((local - local.astype('datetime64[D]')) // SECONDS).astype(np.int64)
+
+
+def weekday(local):
+    """Día de la semana de cada datetime64 (0 = lunes ... 6 = domingo)."""
+    # 1970-01-01 fue jueves
+    return ((local.astype('datetime64[D]').astype(np.int64) + 3) % 7)
+
+
+def meeting_features(start, end, group=None, n_groups=None, out_of_hours=None, weekend=None,
+                     no_break_minutes=NO_BREAK_MINUTES, no_break_inclusive=False):
+    """
+    Features de calendario por grupo a partir de los inicios y fines
+    (datetime64) de todos los eventos:
+
+    - num_events: cantidad de eventos
+    - total_meeting_hours / avg_meeting_duration (minutos)
+    - num_events_outside_hours / meetings_weekend: eventos marcados en las
+      máscaras `out_of_hours` / `weekend` (cada proveedor tiene su criterio)
+    - num_overlapping_meetings: eventos que empiezan antes de que termine el anterior
+    - num_meetings_no_breaks: eventos que empiezan menos de `no_break_minutes` después
+      del fin del anterior (hasta `no_break_minutes` inclusive con `no_break_inclusive`)
+
+    Devuelve un dict de arrays de largo `n_groups`.
+    """
+    n = len(start)
+    group, n_groups = _groups(n, group, n_groups)
+
+    durations = (end - start) / np.timedelta64(1, 'h') if n else np.zeros(0)
+    gaps = sweep_gaps(start, end, group)
+    with np.errstate(invalid='ignore'):
+        overlapping = gaps < 0
+        no_break = (gaps >= 0) & (
+            (gaps <= no_break_minutes * 60) if no_break_inclusive else (gaps < no_break_minutes * 60)
+        )
+
+    num_events = np.bincount(group, minlength=n_groups)
+    total_hours = group_sum(durations, group, n_groups)
+    avg_minutes = np.divide(total_hours * 60, num_events, out=np.zeros(n_groups), where=num_events > 0)
+
+    return {
+        'num_events': num_events,
+        'num_events_outside_hours': group_sum(
+            np.zeros(n, dtype=bool) if out_of_hours is None else out_of_hours, group, n_groups
+        ).astype(np.int64),
+        'total_meeting_hours': total_hours,
+        'avg_meeting_duration': avg_minutes,
+        'meetings_weekend': group_sum(
+            np.zeros(n, dtype=bool) if weekend is None else weekend, group, n_groups
+        ).astype(np.int64),
+        'num_meetings_no_breaks': group_sum(no_break, group, n_groups).astype(np.int64),
+        'num_overlapping_meetings': group_sum(overlapping, group, n_groups).astype(np.int64)
+    }
+
+
+def features_of_group(features, i):
+    """Extrae el dict de features del grupo `i`, con tipos nativos de Python."""
+    return {key: values[i].item() for key, values in features.items()}
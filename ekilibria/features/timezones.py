@@ -0,0 +1,104 @@
+"""
+Resolución de zonas horarias y conversión vectorizada de UTC a hora local.
+
+La tabla Windows → IANA (la que usan los mailbox settings de Microsoft
+Graph) viene precompilada en windows_zones.py; se regenera desde
+data/windowsZones.xml con:
+
+    python -m ekilibria.features.timezones
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+from ekilibria.features import intervals
+from ekilibria.features.windows_zones import WINDOWS_TO_IANA
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+WINDOWS_ZONES_XML = ROOT_DIR / "data" / "windowsZones.xml"
+WINDOWS_ZONES_MODULE = Path(__file__).resolve().parent / "windows_zones.py"
+
+# Todas las transiciones de horario reales caen en múltiplos de 15 minutos:
+# alcanza con calcular el offset una vez por bloque de 15 minutos
+OFFSET_BUCKET_SECONDS = 15 * 60
+
+
+def iana_zone(windows_name, default="UTC"):
+    """Nombre IANA para una zona de Windows (o el mismo nombre si ya es IANA)."""
+    if windows_name in WINDOWS_TO_IANA:
+        return WINDOWS_TO_IANA[windows_name]
+    try:
+        get_zone(windows_name)
+        return windows_name
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return default
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """ZoneInfo de `name`, construido una sola vez."""
+    return ZoneInfo(name)
+
+
+def to_utc_seconds(values):
+    """Convierte datetimes aware, datetime64 (UTC) o segundos epoch a un array int64 de segundos UTC."""
+    if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[s]").astype(np.int64)
+    if isinstance(values, np.ndarray):
+        return values.astype(np.int64)
+    return np.array([int(value.timestamp()) for value in values], dtype=np.int64)
+
+
+def utc_offsets(utc_seconds, zone):
+    """Offset en segundos de `zone` para cada instante, calculado una vez por bloque de 15 minutos."""
+    zone = get_zone(zone) if isinstance(zone, str) else zone
+    if len(utc_seconds) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    buckets, inverse = np.unique(utc_seconds // OFFSET_BUCKET_SECONDS, return_inverse=True)
+    offsets = np.array([
+        int(datetime.fromtimestamp(int(bucket) * OFFSET_BUCKET_SECONDS, tz=timezone.utc).astimezone(zone).utcoffset().total_seconds())
+        for bucket in buckets
+    ], dtype=np.int64)
+    return offsets[inverse.reshape(-1)]
+
+
+def to_local(values, zone):
+    """Hora de pared en `zone` (datetime64[s] naive) de cada instante UTC de `values`."""
+    utc_seconds = to_utc_seconds(values)
+    return (utc_seconds + utc_offsets(utc_seconds, zone)).astype("datetime64[s]")
+
+
+def local_weekday_hour(values, zone):
+    """(día de la semana 0=lunes, hora 0-23, segundos desde la medianoche) en `zone` de cada instante UTC."""
+    local = to_local(values, zone)
+    return intervals.weekday(local), intervals.hour_of_day(local), intervals.seconds_of_day(local)
+
+
+def compile_windows_zones(xml_path=WINDOWS_ZONES_XML, output=WINDOWS_ZONES_MODULE):
+    """Genera windows_zones.py con la tabla Windows → IANA (territorio "001") de windowsZones.xml."""
+    import xml.etree.ElementTree as ET
+
+    mapping = {}
+    for map_zone in ET.parse(xml_path).getroot().findall(".//mapZone"):
+        if map_zone.attrib["territory"] == "001":
+            mapping[map_zone.attrib["other"]] = map_zone.attrib["type"].split(" ")[0]
+
+    lines = [
+        '"""Tabla Windows → IANA generada desde data/windowsZones.xml por ekilibria.features.timezones. No editar a mano."""',
+        "",
+        "WINDOWS_TO_IANA = {",
+        *(f"    {windows!r}: {iana!r}," for windows, iana in sorted(mapping.items())),
+        "}",
+        "",
+    ]
+    Path(output).write_text("\n".join(lines))
+    return mapping
+
+
+if __name__ == "__main__":
+    mapping = compile_windows_zones()
+    print(f"✅ {len(mapping)} zonas escritas en {WINDOWS_ZONES_MODULE}")
@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fuentes que se extraen de Google Workspace
+SOURCES = ('email', 'calendar', 'drive')
+
+# Threads simultáneos para extraer (fuentes × semanas). 1 = secuencial
+GOOGLE_MAX_WORKERS = int(os.getenv("GOOGLE_MAX_WORKERS", "6"))
+
+# Segundos que puede tardar cada fuente antes de darla por fallida.
+# Se puede ajustar por fuente con GOOGLE_TIMEOUT_EMAIL, GOOGLE_TIMEOUT_CALENDAR y GOOGLE_TIMEOUT_DRIVE
+GOOGLE_SOURCE_TIMEOUT = float(os.getenv("GOOGLE_SOURCE_TIMEOUT", "60"))
+SOURCE_TIMEOUTS = {
+    source: float(os.getenv(f"GOOGLE_TIMEOUT_{source.upper()}", GOOGLE_SOURCE_TIMEOUT))
+    for source in SOURCES
+}
+
+# Cada cuánto se revisan los timeouts mientras hay tareas en curso (segundos)
+POLL_INTERVAL = 0.1
+
+
+def run_tasks(tasks, max_workers=GOOGLE_MAX_WORKERS, timeouts=None):
+    """
+    Ejecuta `tasks` ({clave: (fuente, función sin argumentos)}) en un pool de
+    como mucho `max_workers` threads.
+
+    El timeout de cada tarea es el de su fuente y se cuenta desde que empieza
+    a ejecutarse (no mientras espera un thread libre). Una tarea que falla o
+    vence no cancela a las demás.
+
+    Devuelve (resultados, errores), ambos dicts por clave; los errores son la
+    excepción de la tarea o un TimeoutError.
+    """
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+    results = {}
+    errors = {}
+
+    if max_workers <= 1:
+        # Modo secuencial: sin pool, el timeout no puede interrumpir la llamada
+        for key, (source, fn) in tasks.items():
+            try:
+                results[key] = fn()
+            except Exception as e:
+                errors[key] = e
+        return results, errors
+
+    started = {}
+
+    def run(key, fn):
+        started[key] = time.monotonic()
+        return fn()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="google-extract")
+    futures = {executor.submit(run, key, fn): key for key, (source, fn) in tasks.items()}
+    pending = set(futures)
+
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    errors[key] = e
+
+            now = time.monotonic()
+            for future in list(pending):
+                key = futures[future]
+                source = tasks[key][0]
+                start = started.get(key)
+                if start is not None and now - start > timeouts[source]:
+                    # El thread no se puede interrumpir: se abandona su resultado
+                    errors[key] = TimeoutError(f"{source}: sin respuesta después de {timeouts[source]:g}s")
+                    pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, errors
+
+
+def format_errors(errors):
+    """Convierte {fuente: excepción} en {fuente: mensaje} para devolverlo en la respuesta."""
+    return {
+        source: f"{type(error).__name__}: {error}"
+        for source, error in errors.items()
+    }
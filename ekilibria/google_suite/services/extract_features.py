@@ -1,64 +1,103 @@
 import json
 import os
+import time
+from bisect import bisect_right
 from datetime import datetime, timedelta, timezone
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
+from functools import partial
+import numpy as np
+from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
 
+from ekilibria.features import intervals
+from ekilibria.google_suite.services.concurrency import GOOGLE_MAX_WORKERS, SOURCES, run_tasks
+from ekilibria.google_suite.services.scheduler import is_retryable, quota_scheduler
+from ekilibria.google_suite.services.session import get_session
+
 load_dotenv()
 
 TOKEN_DIR = os.getenv("TOKEN_DIR", "google_suite/auth")
 TOKEN_FILENAME = os.getenv("TOKEN_FILENAME")
 token_file = os.path.join(TOKEN_DIR, TOKEN_FILENAME)
 
-def extract_email_features(token_file, fecha_desde, fecha_hasta, hora_inicio_laboral=9, hora_fin_laboral=18):
-    # Cargar token
-    with open(token_file, 'r') as token:
-        token_data = json.load(token)
-
-    creds = Credentials(
-        token=token_data['access_token'],
-        refresh_token=token_data.get('refresh_token'),
-        token_uri='https://oauth2.googleapis.com/token',
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
-    )
-    
-    service = build('gmail', 'v1', credentials=creds)
-
-    # Asegurar que fecha_desde y fecha_hasta sean datetime
-    if not isinstance(fecha_desde, datetime) or not isinstance(fecha_hasta, datetime):
-        raise ValueError("fecha_desde y fecha_hasta deben ser objetos datetime.datetime")
-
-    # Calcular días totales (ambos inclusive)
-    total_dias = (fecha_hasta - fecha_desde).days + 1
-
-    # Formatear para query Gmail (inclusive fecha_hasta)
-    start_str = fecha_desde.strftime('%Y/%m/%d')
-    end_str = (fecha_hasta + timedelta(days=1)).strftime('%Y/%m/%d')
-
-    # --- Correos enviados ---
-    query_sent = f"after:{start_str} before:{end_str} in:sent"
-    results_sent = service.users().messages().list(userId='me', q=query_sent).execute()
-    sent_messages = results_sent.get('messages', [])
-
+# Máximo de sub-requests por llamada batch de Gmail (límite de la API: 100)
+GMAIL_BATCH_SIZE = 100
+# Mensajes por página al listar (límite de la API: 500)
+GMAIL_PAGE_SIZE = 500
+
+def list_message_ids(service, query):
+    """Devuelve los ids de todos los mensajes que cumplen la query, recorriendo todas las páginas."""
+    ids = []
+    page_token = None
+    while True:
+        response = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=GMAIL_PAGE_SIZE,
+            pageToken=page_token,
+            fields='messages(id),nextPageToken'
+        ).execute()
+        ids.extend(msg['id'] for msg in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return ids
+
+def fetch_internal_dates(service, message_ids):
+    """
+    Devuelve {id: internalDate en ms} pidiendo solo ese campo, agrupando
+    hasta GMAIL_BATCH_SIZE requests `get` en cada llamada HTTP. Las
+    sub-requests que fallan por cuota o 5xx se reintentan en un batch nuevo
+    con el backoff del scheduler.
+    """
+    internal_dates = {}
+    errors = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            internal_dates[request_id] = int(response['internalDate'])
+
+    pending = list(message_ids)
+    for attempt in range(quota_scheduler.max_retries + 1):
+        errors.clear()
+        for start in range(0, len(pending), GMAIL_BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in pending[start:start + GMAIL_BATCH_SIZE]:
+                batch.add(
+                    service.users().messages().get(userId='me', id=msg_id, format='minimal', fields='internalDate'),
+                    request_id=msg_id
+                )
+            batch.execute()
+
+        retry = [
+            msg_id for msg_id, error in errors.items()
+            if isinstance(error, HttpError) and is_retryable(error.resp.status, error.content)
+        ]
+        for msg_id, error in errors.items():
+            if msg_id not in retry:
+                raise error
+        if not retry:
+            break
+        if attempt == quota_scheduler.max_retries:
+            raise errors[retry[0]]
+
+        quota_scheduler.record("batch_retries", len(retry))
+        time.sleep(quota_scheduler.retry_delay(attempt))
+        pending = retry
+
+    return internal_dates
+
+def compute_email_features(sent_internal_dates, emails_received, total_dias, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """Features de email a partir de los internalDate (ms) de los enviados y la cantidad de recibidos."""
     emails_sent = 0
     emails_sent_out_of_hours = 0
 
-    for msg in sent_messages:
-        msg_detail = service.users().messages().get(userId='me', id=msg['id'], format='metadata').execute()
-        internal_date = int(msg_detail['internalDate']) / 1000
-        dt = datetime.fromtimestamp(internal_date)
+    for internal_date in sent_internal_dates:
+        dt = datetime.fromtimestamp(internal_date / 1000)
         emails_sent += 1
         if dt.hour < hora_inicio_laboral or dt.hour >= hora_fin_laboral:
             emails_sent_out_of_hours += 1
 
-    # --- Correos recibidos (inbox) ---
-    query_received = f"after:{start_str} before:{end_str} in:inbox category:primary"
-    results_received = service.users().messages().list(userId='me', q=query_received).execute()
-    received_messages = results_received.get('messages', [])
-    emails_received = len(received_messages)
-
     # --- Promedios diarios ---
     emails_sent_prom = round(emails_sent / total_dias, 2)
     emails_sent_out_hours_prom = round(emails_sent_out_of_hours / total_dias, 2)
@@ -70,140 +109,162 @@ def extract_email_features(token_file, fecha_desde, fecha_hasta, hora_inicio_lab
         "emails_received": emails_received_prom
     }
 
-def extract_calendar_features(token_file, fecha_desde, fecha_hasta, hora_inicio_laboral=9, hora_fin_laboral=18):
-    # Cargar credenciales desde token
-    with open(token_file, 'r') as token:
-        token_data = json.load(token)
-
-    creds = Credentials(
-        token=token_data['access_token'],
-        refresh_token=token_data.get('refresh_token'),
-        token_uri='https://oauth2.googleapis.com/token',
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
+def gmail_queries(fecha_desde, fecha_hasta):
+    """Queries de Gmail (enviados, recibidos) para el rango, inclusive fecha_hasta."""
+    start_str = fecha_desde.strftime('%Y/%m/%d')
+    end_str = (fecha_hasta + timedelta(days=1)).strftime('%Y/%m/%d')
+    return (
+        f"after:{start_str} before:{end_str} in:sent",
+        f"after:{start_str} before:{end_str} in:inbox category:primary"
     )
 
-    service = build('calendar', 'v3', credentials=creds)
+def extract_email_features(session, fecha_desde, fecha_hasta, hora_inicio_laboral=9, hora_fin_laboral=18):
+    # `session` puede ser una GoogleWorkspaceSession o la ruta al token
+    service = get_session(session).gmail
 
-    # Formatear rangos para consulta
-    start_time = fecha_desde.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
-    end_time = (fecha_hasta + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
-
-    # print(f"\n🔎 Querying events from {start_time} to {end_time}\n")
-
-    # Obtener eventos
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=start_time,
-        timeMax=end_time,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-
-    events = events_result.get('items', [])
-    # print(f"📒 Total events fetched from calendar: {len(events)}")
-
-    # Inicializar variables
-    num_events = 0
-    events_out_of_hours = 0
-    total_meeting_hours = 0.0
-    meeting_durations = []
-    meetings_weekend = 0
-    num_meetings_no_breaks = 0
-    num_overlapping_meetings = 0
-
-    # Convertir eventos a lista de tuplas (inicio, fin)
-    parsed_events = []
-
-    for event in events:
-        try:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            end = event['end'].get('dateTime', event['end'].get('date'))
-
-            if 'T' not in start or 'T' not in end:
-                continue  # Evento sin hora, tipo "día completo" → se omite
-
-            start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
-            end_dt = datetime.fromisoformat(end.replace('Z', '+00:00'))
-
-            duration_hours = (end_dt - start_dt).total_seconds() / 3600.0
-
-            num_events += 1
-            total_meeting_hours += duration_hours
-            meeting_durations.append(duration_hours)
+    # Asegurar que fecha_desde y fecha_hasta sean datetime
+    if not isinstance(fecha_desde, datetime) or not isinstance(fecha_hasta, datetime):
+        raise ValueError("fecha_desde y fecha_hasta deben ser objetos datetime.datetime")
 
-            if start_dt.hour < hora_inicio_laboral or end_dt.hour > hora_fin_laboral:
-                events_out_of_hours += 1
+    # Calcular días totales (ambos inclusive)
+    total_dias = (fecha_hasta - fecha_desde).days + 1
 
-            if start_dt.weekday() >= 5:
-                meetings_weekend += 1
+    query_sent, query_received = gmail_queries(fecha_desde, fecha_hasta)
 
-            parsed_events.append((start_dt, end_dt))
+    # --- Correos enviados ---
+    sent_ids = list_message_ids(service, query_sent)
+    sent_internal_dates = fetch_internal_dates(service, sent_ids).values()
 
-            # print(f"🗓️ Event: {event.get('summary', 'Sin título')} | Start: {start_dt} | End: {end_dt}")
-        except Exception as e:
-            print(f"⚠️ Error procesando evento: {e}")
-            continue
+    # --- Correos recibidos (inbox) ---
+    emails_received = len(list_message_ids(service, query_received))
+
+    return compute_email_features(sent_internal_dates, emails_received, total_dias, hora_inicio_laboral, hora_fin_laboral)
+
+def list_events(service, time_min, time_max):
+    """Devuelve todos los eventos (expandidos) entre time_min y time_max, recorriendo todas las páginas."""
+    events = []
+    page_token = None
+    while True:
+        events_result = service.events().list(
+            calendarId='primary',
+            timeMin=time_min,
+            timeMax=time_max,
+            singleEvents=True,
+            orderBy='startTime',
+            maxResults=2500,
+            pageToken=page_token
+        ).execute()
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return events
+
+def parse_event_times(event):
+    """Devuelve (inicio, fin) del evento como datetime, o None si es de día completo."""
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    end = event['end'].get('dateTime', event['end'].get('date'))
+
+    if 'T' not in start or 'T' not in end:
+        return None  # Evento sin hora, tipo "día completo" → se omite
+
+    start_dt = datetime.fromisoformat(start.replace('Z', '+00:00'))
+    end_dt = datetime.fromisoformat(end.replace('Z', '+00:00'))
+    return start_dt, end_dt
+
+def compute_calendar_features_by_week(events_by_week, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """
+    Features de calendario de varias semanas (o usuarios) a la vez: recibe una
+    lista de listas de eventos tal como los devuelve la API y calcula todo
+    junto con el motor de intervalos compartido (ekilibria.features.intervals).
+    """
+    starts, ends, starts_utc, ends_utc, group = [], [], [], [], []
+
+    for i, events in enumerate(events_by_week):
+        for event in events:
+            try:
+                times = parse_event_times(event)
+                if times is None:
+                    continue
+                start_dt, end_dt = times
+                # print(f"🗓️ Event: {event.get('summary', 'Sin título')} | Start: {start_dt} | End: {end_dt}")
+            except Exception as e:
+                print(f"⚠️ Error procesando evento: {e}")
+                continue
+
+            starts.append(start_dt)
+            ends.append(end_dt)
+            starts_utc.append(start_dt.astimezone(timezone.utc) if start_dt.tzinfo else start_dt)
+            ends_utc.append(end_dt.astimezone(timezone.utc) if end_dt.tzinfo else end_dt)
+            group.append(i)
+
+    # Hora de pared de cada evento para clasificar; UTC para el barrido de solapamientos
+    local_start = intervals.to_datetime64(starts)
+    local_end = intervals.to_datetime64(ends)
+    out_of_hours = (intervals.hour_of_day(local_start) < hora_inicio_laboral) | (intervals.hour_of_day(local_end) > hora_fin_laboral)
+    weekend = intervals.weekday(local_start) >= 5
+
+    features = intervals.meeting_features(
+        intervals.to_datetime64(starts_utc), intervals.to_datetime64(ends_utc),
+        group=np.array(group, dtype=np.int64), n_groups=len(events_by_week),
+        out_of_hours=out_of_hours, weekend=weekend
+    )
 
-    # Ordenar eventos por inicio para detectar solapamientos y falta de pausas
-    parsed_events.sort(key=lambda x: x[0])
+    result = []
+    for i in range(len(events_by_week)):
+        week = intervals.features_of_group(features, i)
+        week['total_meeting_hours'] = round(week['total_meeting_hours'], 2)
+        week['avg_meeting_duration'] = round(week['avg_meeting_duration'], 2)
+        result.append(week)
+    return result
 
-    for i in range(1, len(parsed_events)):
-        prev_end = parsed_events[i - 1][1]
-        current_start = parsed_events[i][0]
+def compute_calendar_features(events, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """Features de calendario a partir de la lista de eventos tal como la devuelve la API."""
+    return compute_calendar_features_by_week([events], hora_inicio_laboral, hora_fin_laboral)[0]
 
-        if current_start < prev_end:
-            num_overlapping_meetings += 1
-            continue  # Si se solapan, no evalúes si hay descanso
-        elif (current_start - prev_end).total_seconds() / 60.0 < 15:
-            num_meetings_no_breaks += 1
+def calendar_time_range(fecha_desde, fecha_hasta):
+    """Rango (timeMin, timeMax) en UTC para consultar el calendario, inclusive fecha_hasta."""
+    start_time = fecha_desde.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
+    end_time = (fecha_hasta + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
+    return start_time, end_time
 
-    avg_meeting_duration = (sum(meeting_durations) / len(meeting_durations)) * 60 if meeting_durations else 0  # en minutos
+def extract_calendar_features(session, fecha_desde, fecha_hasta, hora_inicio_laboral=9, hora_fin_laboral=18):
+    # `session` puede ser una GoogleWorkspaceSession o la ruta al token
+    service = get_session(session).calendar
 
-    return {
-        'num_events': num_events,
-        'num_events_outside_hours': events_out_of_hours,
-        'total_meeting_hours': round(total_meeting_hours, 2),
-        'avg_meeting_duration': round(avg_meeting_duration, 2),
-        'meetings_weekend': meetings_weekend,
-        'num_meetings_no_breaks': num_meetings_no_breaks,
-        'num_overlapping_meetings': num_overlapping_meetings
-    }
+    # Formatear rangos para consulta
+    start_time, end_time = calendar_time_range(fecha_desde, fecha_hasta)
 
-def extract_drive_features(token_file, fecha_desde, fecha_hasta):
-    # Cargar credenciales desde token
-    with open(token_file, 'r') as token:
-        token_data = json.load(token)
-
-    creds = Credentials(
-        token=token_data['access_token'],
-        refresh_token=token_data.get('refresh_token'),
-        token_uri='https://oauth2.googleapis.com/token',
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
-    )
-    # Crear servicio de Google Drive
-    service = build('drive', 'v3', credentials=creds)
+    # print(f"\n🔎 Querying events from {start_time} to {end_time}\n")
 
-    # Convertir fechas a formato RFC3339 (UTC ISO format)
-    time_min = fecha_desde.isoformat()
-    time_max = fecha_hasta.isoformat()
+    # Obtener eventos
+    events = list_events(service, start_time, end_time)
+    # print(f"📒 Total events fetched from calendar: {len(events)}")
 
-    # print(f"🔍 Querying Drive files from {time_min} to {time_max}")
+    return compute_calendar_features(events, hora_inicio_laboral, hora_fin_laboral)
 
-    # Obtener información del usuario autenticado
+def get_drive_user_email(service):
+    """Email del usuario autenticado en Drive."""
     user_info = service.about().get(fields="user(emailAddress)").execute()
-    user_email = user_info['user']['emailAddress']
-
-    # Buscar archivos modificados en el rango de fechas
-    results = service.files().list(
-        q=f"modifiedTime >= '{time_min}' and modifiedTime < '{time_max}' and trashed = false",
-        fields="files(id, name, createdTime, modifiedTime, owners, lastModifyingUser)",
-        pageSize=1000
-    ).execute()
-
-    files = results.get('files', [])
-
+    return user_info['user']['emailAddress']
+
+def list_modified_files(service, time_min, time_max):
+    """Devuelve los archivos modificados en el rango, recorriendo todas las páginas."""
+    files = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=f"modifiedTime >= '{time_min}' and modifiedTime < '{time_max}' and trashed = false",
+            fields="nextPageToken, files(id, name, createdTime, modifiedTime, owners, lastModifyingUser)",
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+def compute_drive_features(files, user_email, time_min, time_max):
+    """Features de Drive para los archivos modificados entre time_min y time_max (strings RFC3339)."""
     archivos_creados = []
     archivos_editados = []
 
@@ -213,6 +274,10 @@ def extract_drive_features(token_file, fecha_desde, fecha_hasta):
         owner_email = file.get('owners')[0]['emailAddress'] if file.get('owners') else None
         last_editor_email = file.get('lastModifyingUser', {}).get('emailAddress')
 
+        # Solo los archivos modificados en el rango (la query ya los filtra en el modo semanal)
+        if not (modified >= time_min and modified < time_max):
+            continue
+
         # Validar creación por el usuario autenticado
         if created >= time_min and created < time_max and owner_email == user_email:
             archivos_creados.append(file['name'])
@@ -231,13 +296,208 @@ def extract_drive_features(token_file, fecha_desde, fecha_hasta):
         'docs_edited': len(archivos_editados)
     }
 
-def extract_all_features(token_file, fecha_desde, fecha_hasta):
+def extract_drive_features(session, fecha_desde, fecha_hasta):
+    # `session` puede ser una GoogleWorkspaceSession o la ruta al token
+    service = get_session(session).drive
+
+    # Convertir fechas a formato RFC3339 (UTC ISO format)
+    time_min = fecha_desde.isoformat()
+    time_max = fecha_hasta.isoformat()
+
+    # print(f"🔍 Querying Drive files from {time_min} to {time_max}")
+
+    # Obtener información del usuario autenticado
+    user_email = get_drive_user_email(service)
+
+    # Buscar archivos modificados en el rango de fechas
+    files = list_modified_files(service, time_min, time_max)
+
+    return compute_drive_features(files, user_email, time_min, time_max)
+
+def extract_all_features(session, fecha_desde, fecha_hasta, max_workers=GOOGLE_MAX_WORKERS):
+    # Una sola sesión (credenciales + servicios) para los tres extractores, que corren en paralelo
+    session = get_session(session)
+    tasks = {
+        'email': ('email', partial(extract_email_features, session, fecha_desde, fecha_hasta)),
+        'calendar': ('calendar', partial(extract_calendar_features, session, fecha_desde, fecha_hasta)),
+        'drive': ('drive', partial(extract_drive_features, session, fecha_desde, fecha_hasta)),
+    }
+    results, errors = run_tasks(tasks, max_workers=max_workers)
+    for error in errors.values():
+        raise error
+
     features = {}
-    features.update(extract_email_features(token_file, fecha_desde, fecha_hasta))
-    features.update(extract_calendar_features(token_file, fecha_desde, fecha_hasta))
-    features.update(extract_drive_features(token_file, fecha_desde, fecha_hasta))
+    for source in tasks:
+        features.update(results[source])
     return features
 
+def week_datetimes(week_ranges):
+    """Convierte rangos (date, date) a (datetime inicio del día, datetime fin del día)."""
+    return [
+        (datetime.combine(date_from, datetime.min.time()), datetime.combine(date_to, datetime.max.time()))
+        for date_from, date_to in week_ranges
+    ]
+
+def bucket_by_week(items, weeks, get_datetime):
+    """
+    Reparte `items` en una lista por semana según la fecha que devuelve
+    `get_datetime(item)` (naive, comparable con los límites de `weeks`).
+    Los items fuera de todas las semanas (o sin fecha) se descartan.
+    """
+    starts = [desde for desde, _ in weeks]
+    buckets = [[] for _ in weeks]
+    for item in items:
+        dt = get_datetime(item)
+        if dt is None:
+            continue
+        i = bisect_right(starts, dt) - 1
+        if i >= 0 and dt <= weeks[i][1]:
+            buckets[i].append(item)
+    return buckets
+
+def _event_start_utc(event):
+    times = parse_event_times(event)
+    if times is None:
+        return None
+    start_dt = times[0]
+    if start_dt.tzinfo is not None:
+        start_dt = start_dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return start_dt
+
+def range_email_features(session, weeks, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """
+    Features de email por semana: los enviados (hace falta su hora) con una sola
+    consulta para toda la ventana; los recibidos solo se cuentan, con una
+    consulta de ids por semana en lugar de pedir la fecha de cada mensaje.
+    """
+    gmail = get_session(session).gmail
+    query_sent, _ = gmail_queries(weeks[0][0], weeks[-1][1])
+    sent_dates = list(fetch_internal_dates(gmail, list_message_ids(gmail, query_sent)).values())
+
+    local_datetime = lambda internal_date: datetime.fromtimestamp(internal_date / 1000)
+    sent_by_week = bucket_by_week(sent_dates, weeks, local_datetime)
+    received_by_week = [
+        len(list_message_ids(gmail, gmail_queries(fecha_desde, fecha_hasta)[1]))
+        for fecha_desde, fecha_hasta in weeks
+    ]
+
+    return [
+        compute_email_features(
+            sent_by_week[i], received_by_week[i], (fecha_hasta - fecha_desde).days + 1,
+            hora_inicio_laboral, hora_fin_laboral
+        )
+        for i, (fecha_desde, fecha_hasta) in enumerate(weeks)
+    ]
+
+def range_calendar_features(session, weeks, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """Features de calendario por semana: todos los eventos de la ventana, repartidos por inicio (UTC)."""
+    events = list_events(get_session(session).calendar, *calendar_time_range(weeks[0][0], weeks[-1][1]))
+    events_by_week = bucket_by_week(events, weeks, _event_start_utc)
+    return compute_calendar_features_by_week(events_by_week, hora_inicio_laboral, hora_fin_laboral)
+
+def range_drive_features(session, weeks):
+    """Features de Drive por semana: archivos modificados en la ventana, cada semana filtra por su rango."""
+    drive = get_session(session).drive
+    user_email = get_drive_user_email(drive)
+    files = list_modified_files(drive, weeks[0][0].isoformat(), weeks[-1][1].isoformat())
+    return [
+        compute_drive_features(files, user_email, fecha_desde.isoformat(), fecha_hasta.isoformat())
+        for fecha_desde, fecha_hasta in weeks
+    ]
+
+def extract_weeks_features(session, week_ranges, mode="range", max_workers=GOOGLE_MAX_WORKERS, timeouts=None,
+                           hora_inicio_laboral=9, hora_fin_laboral=18):
+    """
+    Extrae las features de varias semanas corriendo Gmail, Calendar y Drive
+    (y, en modo "weekly", cada semana) en paralelo, con timeout por fuente.
+
+    `week_ranges` es una lista de tuplas (fecha_desde, fecha_hasta) de tipo date,
+    contiguas y ordenadas (ver utils.get_week_ranges_until). En modo "range"
+    se hace una sola consulta por fuente para toda la ventana; en modo
+    "weekly", una por semana; en modo "sync" solo se piden los cambios desde
+    la última sincronización y las features salen del registro local del
+    usuario (ver sync_store.GoogleSyncStore).
+
+    Devuelve (features_by_week, errors_by_week): por cada semana, el dict de
+    features de las fuentes que respondieron y {fuente: excepción} de las que
+    fallaron o vencieron.
+    """
+    session = get_session(session)
+    weeks = week_datetimes(week_ranges)
+    features_by_week = [{} for _ in weeks]
+    errors_by_week = [{} for _ in weeks]
+    if not weeks:
+        return features_by_week, errors_by_week
+
+    store = None
+    if mode == "range":
+        tasks = {
+            'email': ('email', lambda: range_email_features(session, weeks, hora_inicio_laboral, hora_fin_laboral)),
+            'calendar': ('calendar', lambda: range_calendar_features(session, weeks, hora_inicio_laboral, hora_fin_laboral)),
+            'drive': ('drive', lambda: range_drive_features(session, weeks)),
+        }
+    elif mode == "sync":
+        # Import diferido: sync_store usa las funciones de este módulo
+        from ekilibria.google_suite.services.sync_store import GoogleSyncStore, synced_source_features
+
+        store = GoogleSyncStore.for_token(session.token_file)
+        tasks = {
+            source: (source, partial(synced_source_features, session, store, source, weeks, hora_inicio_laboral, hora_fin_laboral))
+            for source in SOURCES
+        }
+
+    if mode in ("range", "sync"):
+        try:
+            results, errors = run_tasks(tasks, max_workers=max_workers, timeouts=timeouts)
+        finally:
+            # Una conexión SQLite por request: se cierra aunque alguna fuente falle
+            if store is not None:
+                store.close()
+        for source, per_week in results.items():
+            for features, week_features in zip(features_by_week, per_week):
+                features.update(week_features)
+        for source, error in errors.items():
+            for week_errors in errors_by_week:
+                week_errors[source] = error
+        return features_by_week, errors_by_week
+
+    if mode != "weekly":
+        raise ValueError(f"Modo de extracción desconocido: '{mode}'")
+
+    tasks = {}
+    for i, (fecha_desde, fecha_hasta) in enumerate(weeks):
+        tasks[(i, 'email')] = ('email', partial(extract_email_features, session, fecha_desde, fecha_hasta, hora_inicio_laboral, hora_fin_laboral))
+        tasks[(i, 'calendar')] = ('calendar', partial(extract_calendar_features, session, fecha_desde, fecha_hasta, hora_inicio_laboral, hora_fin_laboral))
+        tasks[(i, 'drive')] = ('drive', partial(extract_drive_features, session, fecha_desde, fecha_hasta))
+
+    results, errors = run_tasks(tasks, max_workers=max_workers, timeouts=timeouts)
+    # Se recorre en el orden de las tareas para que las features queden siempre en el mismo orden
+    for (i, source) in tasks:
+        if (i, source) in results:
+            features_by_week[i].update(results[(i, source)])
+        else:
+            errors_by_week[i][source] = errors[(i, source)]
+    return features_by_week, errors_by_week
+
+def extract_all_features_range(session, week_ranges, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """
+    Extrae las features de varias semanas con una sola consulta por fuente
+    para toda la ventana y reparte localmente mensajes, eventos y archivos
+    en cada rango lunes–domingo (ver utils.get_week_ranges_until).
+
+    `week_ranges` es una lista de tuplas (fecha_desde, fecha_hasta) de tipo date,
+    contiguas y ordenadas. Devuelve un dict de features por semana, en el mismo
+    orden; si alguna fuente falla se levanta su error.
+    """
+    features_by_week, errors_by_week = extract_weeks_features(
+        session, week_ranges, mode="range", max_workers=1,
+        hora_inicio_laboral=hora_inicio_laboral, hora_fin_laboral=hora_fin_laboral
+    )
+    for week_errors in errors_by_week:
+        for error in week_errors.values():
+            raise error
+    return features_by_week
+
 
 if __name__ == "__main__":
     # fecha_desde = datetime(2025, 6, 16)
@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import random
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# false: las llamadas van directo a Google, sin límites ni reintentos
+GOOGLE_SCHEDULER = os.getenv("GOOGLE_SCHEDULER", "true").lower() == "true"
+
+# Cuota del proyecto (todas las sesiones del proceso) y de cada usuario, en requests por segundo.
+# Un batch cuenta tantas unidades como sub-requests tenga
+GOOGLE_PROJECT_RATE = float(os.getenv("GOOGLE_PROJECT_RATE", "1000"))
+GOOGLE_PROJECT_BURST = float(os.getenv("GOOGLE_PROJECT_BURST", "2000"))
+GOOGLE_USER_RATE = float(os.getenv("GOOGLE_USER_RATE", "50"))
+GOOGLE_USER_BURST = float(os.getenv("GOOGLE_USER_BURST", "250"))
+
+# Reintentos ante 429/5xx: espera base * 2^intento con jitter, con tope
+GOOGLE_MAX_RETRIES = int(os.getenv("GOOGLE_MAX_RETRIES", "5"))
+GOOGLE_BACKOFF_BASE = float(os.getenv("GOOGLE_BACKOFF_BASE", "0.5"))
+GOOGLE_BACKOFF_MAX = float(os.getenv("GOOGLE_BACKOFF_MAX", "32"))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Motivos con los que Google devuelve un 403 que en realidad es de cuota
+RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+
+class TokenBucket:
+    """Balde de tokens: se rellena a `rate` tokens por segundo hasta `capacity`. No es thread-safe por sí mismo."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, reserve=0.0):
+        """Segundos hasta que haya `cost` tokens (dejando `reserve` sin tocar); 0 si ya los hay."""
+        # Un pedido más grande que el balde se deja pasar con el balde lleno
+        needed = min(cost + reserve, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class QuotaScheduler:
+    """
+    Limita y reintenta las llamadas a las APIs de Google de todo el proceso.
+
+    Cada llamada pide `cost` tokens al balde del proyecto y al de su usuario y
+    espera si no alcanzan. Las llamadas "interactive" (un usuario esperando en
+    el dashboard) tienen prioridad: mientras haya alguna esperando, las
+    "background" solo toman tokens del proyecto si sobran para todas ellas.
+    Ante 429, 5xx o 403 por cuota se espera con backoff exponencial y jitter
+    (o lo que indique Retry-After) y se reintenta.
+    """
+
+    def __init__(self, project_rate=GOOGLE_PROJECT_RATE, project_burst=GOOGLE_PROJECT_BURST,
+                 user_rate=GOOGLE_USER_RATE, user_burst=GOOGLE_USER_BURST, max_retries=GOOGLE_MAX_RETRIES,
+                 backoff_base=GOOGLE_BACKOFF_BASE, backoff_max=GOOGLE_BACKOFF_MAX):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._cond = threading.Condition()
+        self._project = TokenBucket(project_rate, project_burst)
+        self._users = {}
+        self._waiting = Counter()
+        self._metrics = Counter()
+        self._wait_seconds = Counter()
+
+    def _user_bucket(self, user):
+        bucket = self._users.get(user)
+        if bucket is None:
+            bucket = self._users[user] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def acquire(self, user, priority=INTERACTIVE, cost=1):
+        """Bloquea hasta poder gastar `cost` tokens del proyecto y del usuario."""
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._project.refill(now)
+                    user_bucket = self._user_bucket(user)
+                    user_bucket.refill(now)
+
+                    # Las background dejan en el balde del proyecto un token por cada interactive que espera
+                    reserve = self._waiting[INTERACTIVE] if priority == BACKGROUND else 0
+                    wait = max(self._project.wait_time(cost, reserve), user_bucket.wait_time(cost))
+                    if wait <= 0:
+                        self._project.tokens -= cost
+                        user_bucket.tokens -= cost
+                        break
+                    self._cond.wait(timeout=min(wait, 1.0))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self._metrics[f"{priority}_requests"] += 1
+            self._metrics[f"{priority}_units"] += cost
+            if waited > 0.001:
+                self._metrics[f"{priority}_throttled"] += 1
+                self._wait_seconds[priority] += waited
+
+    def retry_delay(self, attempt, retry_after=None):
+        """Espera antes del reintento número `attempt` (0, 1, ...): Retry-After si viene, si no backoff con jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def record(self, name, value=1):
+        with self._cond:
+            self._metrics[name] += value
+
+    def stats(self):
+        """Métricas acumuladas y estado actual de los baldes."""
+        with self._cond:
+            now = time.monotonic()
+            self._project.refill(now)
+            return {
+                **self._metrics,
+                "wait_seconds": {priority: round(seconds, 3) for priority, seconds in self._wait_seconds.items()},
+                "waiting": {priority: self._waiting[priority] for priority in PRIORITIES},
+                "project_tokens": round(self._project.tokens, 1),
+                "users": len(self._users),
+            }
+
+
+def is_retryable(status, content=b""):
+    """True para 429, 5xx y 403 por límite de cuota."""
+    if status == 429 or status >= 500:
+        return True
+    return status == 403 and any(reason in (content or b"") for reason in RATE_LIMIT_REASONS)
+
+
+def parse_retry_after(headers):
+    value = headers.get("retry-after") if headers else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class ScheduledHttp:
+    """
+    Envoltorio de un objeto http de googleapiclient (AuthorizedHttp) que pasa
+    cada request por el QuotaScheduler: espera tokens antes de enviarla y la
+    reintenta ante 429/5xx. Un batch consume un token por sub-request.
+    """
+
+    def __init__(self, http, user, priority=INTERACTIVE, scheduler=None):
+        self.http = http
+        self.user = user
+        self.priority = priority
+        self.scheduler = scheduler or quota_scheduler
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        cost = _batch_size(body, headers) or 1
+        for attempt in range(self.scheduler.max_retries + 1):
+            self.scheduler.acquire(self.user, self.priority, cost)
+            resp, content = self.http.request(uri, method=method, body=body, headers=headers, **kwargs)
+
+            if not is_retryable(resp.status, content):
+                return resp, content
+            self.scheduler.record("rate_limited" if resp.status in (403, 429) else "server_errors")
+            if attempt == self.scheduler.max_retries:
+                self.scheduler.record("failed")
+                return resp, content
+
+            self.scheduler.record("retries")
+            time.sleep(self.scheduler.retry_delay(attempt, parse_retry_after(resp)))
+
+    def __getattr__(self, name):
+        # credentials, timeout, etc. los sigue resolviendo el http original
+        return getattr(self.http, name)
+
+
+def _batch_size(body, headers):
+    content_type = (headers or {}).get("content-type", "")
+    if not body or not content_type.startswith("multipart/mixed"):
+        return 0
+    data = body if isinstance(body, bytes) else body.encode()
+    return len(re.findall(rb"(?im)^content-id:", data))
+
+
+# Scheduler compartido por todas las sesiones del proceso
+quota_scheduler = QuotaScheduler()
@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+from datetime import datetime, timezone
+from googleapiclient.discovery import build
+from googleapiclient.http import BatchHttpRequest, build_http
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from dotenv import load_dotenv
+
+from ekilibria.google_suite.services.scheduler import GOOGLE_SCHEDULER, INTERACTIVE, ScheduledHttp
+
+load_dotenv()
+
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+# Nombre y versión de cada API de Google Workspace que usamos
+SERVICES = {
+    'gmail': 'v1',
+    'calendar': 'v3',
+    'drive': 'v3',
+}
+
+# Base URL alternativa para todas las APIs de Google (p. ej. el servidor falso de
+# ekilibria.benchmarks.fake_workspace). Vacío = las URLs reales de Google
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL")
+
+# servicePath y batchPath de cada API según sus documentos de discovery,
+# necesarios para armar las URLs cuando se usa GOOGLE_API_BASE_URL
+SERVICE_PATHS = {
+    'gmail': ('', 'batch'),
+    'calendar': ('calendar/v3/', 'batch/calendar/v3'),
+    'drive': ('drive/v3/', 'batch/drive/v3'),
+}
+
+
+class GoogleWorkspaceSession:
+    """
+    Sesión de Google Workspace de un usuario: lee el token una sola vez,
+    lo refresca si venció (y lo guarda de vuelta en el archivo) y reutiliza
+    los servicios de Gmail, Calendar y Drive construidos con los documentos
+    de discovery estáticos que trae googleapiclient.
+
+    Se puede compartir entre los tres extractores y entre todas las semanas
+    de un mismo request, también desde varios threads: como httplib2 no es
+    thread-safe, cada thread construye y reutiliza sus propios servicios.
+
+    Todas las llamadas pasan por el scheduler de cuota compartido
+    (scheduler.quota_scheduler) como usuario del token y con `priority`
+    ("interactive" o "background").
+    """
+
+    def __init__(self, token_file, priority=INTERACTIVE):
+        self.token_file = token_file
+        self.user = os.path.splitext(os.path.basename(token_file))[0]
+        self.priority = priority
+
+        # Cargar token
+        with open(token_file, 'r') as token:
+            self.token_data = json.load(token)
+
+        expires_at = self.token_data.get('expires_at')
+        self.credentials = Credentials(
+            token=self.token_data['access_token'],
+            refresh_token=self.token_data.get('refresh_token'),
+            token_uri=TOKEN_URI,
+            client_id=os.getenv("GOOGLE_CLIENT_ID"),
+            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+            # google-auth espera la expiración como datetime UTC sin zona horaria
+            expiry=datetime.fromtimestamp(expires_at, tz=timezone.utc).replace(tzinfo=None) if expires_at else None
+        )
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+
+        self.refresh_if_needed()
+
+    def refresh_if_needed(self):
+        """Refresca el access token si venció y lo persiste en el archivo del token."""
+        with self._refresh_lock:
+            if not self.credentials.expired or not self.credentials.refresh_token:
+                return
+
+            self.credentials.refresh(Request())
+            self.token_data['access_token'] = self.credentials.token
+            if self.credentials.expiry:
+                self.token_data['expires_at'] = int(self.credentials.expiry.replace(tzinfo=timezone.utc).timestamp())
+
+            with open(self.token_file, 'w') as token:
+                json.dump(self.token_data, token)
+
+    def service(self, name):
+        """Devuelve el servicio `name` ('gmail', 'calendar' o 'drive'), construyéndolo una sola vez por thread."""
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        if name not in services:
+            http = AuthorizedHttp(self.credentials, http=build_http())
+            if GOOGLE_SCHEDULER:
+                http = ScheduledHttp(http, self.user, self.priority)
+            services[name] = build_service(name, http)
+        return services[name]
+
+    @property
+    def gmail(self):
+        return self.service('gmail')
+
+    @property
+    def calendar(self):
+        return self.service('calendar')
+
+    @property
+    def drive(self):
+        return self.service('drive')
+
+
+def build_service(name, http, base_url=GOOGLE_API_BASE_URL):
+    """Construye el servicio `name` con el discovery estático sobre `http`, apuntando a `base_url` si se indica."""
+    if not base_url:
+        return build(name, SERVICES[name], http=http, static_discovery=True, cache_discovery=False)
+
+    service_path, batch_path = SERVICE_PATHS[name]
+    base_url = base_url.rstrip('/')
+    service = build(
+        name,
+        SERVICES[name],
+        http=http,
+        static_discovery=True,
+        cache_discovery=False,
+        client_options={'api_endpoint': f"{base_url}/{service_path}"}
+    )
+    # El batch usa rootUrl del discovery, que api_endpoint no cambia
+    batch_uri = f"{base_url}/{batch_path}"
+    service.new_batch_http_request = lambda callback=None: BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+    return service
+
+
+def get_session(session_or_token_file):
+    """Acepta una GoogleWorkspaceSession ya creada o la ruta a un token y devuelve la sesión."""
+    if isinstance(session_or_token_file, GoogleWorkspaceSession):
+        return session_or_token_file
+    return GoogleWorkspaceSession(session_or_token_file)
@@ -0,0 +1,395 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from googleapiclient.errors import HttpError
+from dotenv import load_dotenv
+
+from ekilibria.google_suite.services.session import get_session
+from ekilibria.google_suite.services.extract_features import (
+    gmail_queries, list_message_ids, fetch_internal_dates, compute_email_features,
+    compute_calendar_features_by_week, get_drive_user_email, list_modified_files,
+    compute_drive_features, bucket_by_week, _event_start_utc
+)
+
+load_dotenv()
+
+# Directorio con una base SQLite por usuario con su actividad sincronizada
+SYNC_DIR = os.getenv("SYNC_DIR", "google_suite/sync")
+
+# Días hacia adelante que cubre el registro de Calendar (los eventos recurrentes no tienen fin)
+CALENDAR_DAYS_AHEAD = 30
+
+# Etiquetas de Gmail que excluyen un mensaje de "category:primary"
+NON_PRIMARY_CATEGORIES = {'CATEGORY_SOCIAL', 'CATEGORY_PROMOTIONS', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS'}
+
+DRIVE_CHANGE_FIELDS = (
+    "nextPageToken, newStartPageToken, "
+    "changes(fileId, removed, file(id, name, createdTime, modifiedTime, owners, lastModifyingUser, trashed))"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY, internal_date INTEGER NOT NULL, sent INTEGER NOT NULL, received INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, start_time TEXT, event TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (id TEXT PRIMARY KEY, modified_time TEXT, file TEXT NOT NULL);
+"""
+
+
+def is_sync_expired(error):
+    """True si la API rechazó el token de sincronización (hay que volver a sincronizar todo)."""
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
+
+class GoogleSyncStore:
+    """
+    Registro local de la actividad de un usuario (mensajes, eventos y archivos)
+    más los tokens para pedir a Google solo lo que cambió desde la última vez:
+    historyId de Gmail, syncToken de Calendar y el page token de cambios de Drive.
+
+    Cada fuente guarda también desde qué fecha tiene el registro completo; si
+    se piden semanas anteriores, esa fuente se vuelve a sincronizar desde cero.
+
+    Los cambios de cada sincronización y su token nuevo se guardan en una sola
+    transacción, y solo si el token guardado sigue siendo aquel desde el que
+    se sincronizó: si otro worker o request ya lo avanzó, se descarta.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def for_token(cls, token_file, sync_dir=SYNC_DIR):
+        """Base del usuario dueño del token (una por archivo de token)."""
+        return cls(Path(sync_dir) / f"{Path(token_file).stem}.sqlite3")
+
+    # --- Estado ---
+
+    def get_state(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def covers(self, source, window_start, window_end=None):
+        """
+        True si la fuente ya está sincronizada y su registro arranca en
+        `window_start` o antes (y, si el registro tiene fin, llega a `window_end`).
+        """
+        token = self.get_state(f"{source}_token")
+        start = self.get_state(f"{source}_window_start")
+        if token is None or start is None or start > window_start.isoformat():
+            return False
+        end = self.get_state(f"{source}_window_end")
+        return window_end is None or (end is not None and end >= window_end.isoformat())
+
+    def commit(self, table, columns, upserts, deletes, source, base_token, state, reset=False):
+        """
+        Aplica los cambios de una sincronización de `source` y guarda `state`
+        ({clave: valor} con el token nuevo) en una transacción. Con `reset` se
+        borra antes todo el registro (sincronización completa). Devuelve False
+        sin tocar nada si el token guardado ya no es `base_token`.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM state WHERE key = ?", (f"{source}_token",)).fetchone()
+                if (row[0] if row else None) != base_token:
+                    self._conn.rollback()
+                    return False
+                if reset:
+                    self._conn.execute(f"DELETE FROM {table}")
+                self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(row_id,) for row_id in deletes])
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    upserts
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                    [(key, None if value is None else str(value)) for key, value in state.items()]
+                )
+                self._conn.commit()
+                return True
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Gmail ---
+
+    def sync_gmail(self, service, window_start):
+        """Trae los mensajes nuevos/borrados desde el último historyId (o todo si no hay o venció)."""
+        history_id = self.get_state("gmail_token")
+        if history_id and self.covers("gmail", window_start):
+            try:
+                return self._sync_gmail_history(service, history_id)
+            except HttpError as e:
+                if not is_sync_expired(e):
+                    raise
+        return self._sync_gmail_full(service, window_start, history_id)
+
+    def _sync_gmail_full(self, service, window_start, base_token):
+        # El historyId se toma antes de listar para no perder lo que llegue mientras tanto
+        history_id = service.users().getProfile(userId='me', fields='historyId').execute()['historyId']
+
+        query_sent, _ = gmail_queries(window_start, datetime.now())
+        sent_ids = set(list_message_ids(service, query_sent))
+        internal_dates = fetch_internal_dates(service, sorted(sent_ids))
+
+        # De los recibidos solo se cuentan cuántos hay por semana: alcanza con la semana,
+        # que sale de una consulta de ids por semana en lugar de pedir la fecha de cada mensaje
+        received_weeks = _received_ids_by_week(service, window_start, datetime.now())
+        received_ids = {msg_id for ids in received_weeks.values() for msg_id in ids}
+        for week_ms, ids in received_weeks.items():
+            for msg_id in ids:
+                internal_dates.setdefault(msg_id, week_ms)
+
+        applied = self.commit("messages", ("id", "internal_date", "sent", "received"), [
+            (msg_id, internal_date, msg_id in sent_ids, msg_id in received_ids)
+            for msg_id, internal_date in internal_dates.items()
+        ], (), "gmail", base_token, {
+            "gmail_token": history_id, "gmail_window_start": window_start.isoformat()
+        }, reset=True)
+        return len(internal_dates) if applied else 0
+
+    def _sync_gmail_history(self, service, history_id):
+        labels = {}
+        deleted = set()
+        page_token = None
+
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=history_id,
+                historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for change in record.get(key, []):
+                        message = change['message']
+                        labels[message['id']] = set(message.get('labelIds', []))
+                        deleted.discard(message['id'])
+                for change in record.get('messagesDeleted', []):
+                    deleted.add(change['message']['id'])
+                    labels.pop(change['message']['id'], None)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                new_history_id = response.get('historyId', history_id)
+                break
+
+        # Solo interesan los enviados y los recibidos en la bandeja principal
+        relevant = {
+            msg_id: ('SENT' in msg_labels, 'INBOX' in msg_labels and not msg_labels & NON_PRIMARY_CATEGORIES)
+            for msg_id, msg_labels in labels.items()
+        }
+        deleted |= {msg_id for msg_id, (sent, received) in relevant.items() if not sent and not received}
+        relevant = {msg_id: flags for msg_id, flags in relevant.items() if any(flags)}
+
+        internal_dates = fetch_internal_dates(service, sorted(relevant))
+        applied = self.commit("messages", ("id", "internal_date", "sent", "received"), [
+            (msg_id, internal_date, *relevant[msg_id])
+            for msg_id, internal_date in internal_dates.items()
+        ], deleted, "gmail", history_id, {"gmail_token": new_history_id})
+        return len(internal_dates) + len(deleted) if applied else 0
+
+    def email_features(self, weeks, hora_inicio_laboral=9, hora_fin_laboral=18):
+        """Features de email por semana calculadas desde el registro local."""
+        start_ms = int(weeks[0][0].timestamp() * 1000)
+        end_ms = int(weeks[-1][1].timestamp() * 1000)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT internal_date, sent, received FROM messages WHERE internal_date BETWEEN ? AND ?",
+                (start_ms, end_ms)
+            ).fetchall()
+
+        local_datetime = lambda internal_date: datetime.fromtimestamp(internal_date / 1000)
+        sent_by_week = bucket_by_week([row[0] for row in rows if row[1]], weeks, local_datetime)
+        received_by_week = bucket_by_week([row[0] for row in rows if row[2]], weeks, local_datetime)
+
+        return [
+            compute_email_features(
+                sent_by_week[i], len(received_by_week[i]), (fecha_hasta - fecha_desde).days + 1,
+                hora_inicio_laboral, hora_fin_laboral
+            )
+            for i, (fecha_desde, fecha_hasta) in enumerate(weeks)
+        ]
+
+    # --- Calendar ---
+
+    def sync_calendar(self, service, window_start, window_end):
+        """
+        Trae los eventos cambiados desde el último syncToken (o todo si no hay o
+        venció con 410). La sincronización completa cubre desde `window_start`
+        hasta CALENDAR_DAYS_AHEAD días desde hoy; si se piden semanas más allá,
+        se vuelve a sincronizar.
+        """
+        sync_token = self.get_state("calendar_token")
+        full = not (sync_token and self.covers("calendar", window_start, window_end))
+        record_end = (datetime.now() + timedelta(days=CALENDAR_DAYS_AHEAD)).replace(microsecond=0)
+        changed = {}
+        page_token = None
+
+        while True:
+            params = dict(calendarId='primary', singleEvents=True, maxResults=2500, pageToken=page_token)
+            if full:
+                params['timeMin'] = window_start.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
+                params['timeMax'] = record_end.isoformat() + 'Z'
+            else:
+                params['syncToken'] = sync_token
+            try:
+                response = service.events().list(**params).execute()
+            except HttpError as e:
+                if full or not is_sync_expired(e):
+                    raise
+                # El syncToken venció: sincronización completa
+                full, changed, page_token = True, {}, None
+                continue
+
+            for event in response.get('items', []):
+                changed[event['id']] = event
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                next_sync_token = response.get('nextSyncToken')
+                break
+
+        deleted = [event_id for event_id, event in changed.items() if event.get('status') == 'cancelled']
+        rows = [
+            (event_id, _start_text(event), json.dumps({'start': event['start'], 'end': event['end']}))
+            for event_id, event in changed.items()
+            if event.get('status') != 'cancelled' and 'start' in event and 'end' in event
+        ]
+        state = {"calendar_token": next_sync_token}
+        if full:
+            state.update(calendar_window_start=window_start.isoformat(), calendar_window_end=record_end.isoformat())
+        applied = self.commit("events", ("id", "start_time", "event"), rows, deleted, "calendar", sync_token, state,
+                              reset=full)
+        return len(changed) if applied else 0
+
+    def calendar_features(self, weeks, hora_inicio_laboral=9, hora_fin_laboral=18):
+        """Features de calendario por semana calculadas desde el registro local."""
+        with self._lock:
+            events = [json.loads(row[0]) for row in self._conn.execute("SELECT event FROM events ORDER BY start_time")]
+        events_by_week = bucket_by_week(events, weeks, _event_start_utc)
+        return compute_calendar_features_by_week(events_by_week, hora_inicio_laboral, hora_fin_laboral)
+
+    # --- Drive ---
+
+    def sync_drive(self, service, window_start):
+        """Aplica el feed de cambios de Drive desde el último page token (o lista todo si no hay)."""
+        page_token = self.get_state("drive_token")
+        if page_token and self.covers("drive", window_start):
+            try:
+                return self._sync_drive_changes(service, page_token)
+            except HttpError as e:
+                if not is_sync_expired(e):
+                    raise
+        return self._sync_drive_full(service, window_start, page_token)
+
+    def _sync_drive_full(self, service, window_start, base_token):
+        # El token de cambios se pide antes de listar para no perder lo que cambie mientras tanto
+        start_page_token = service.changes().getStartPageToken().execute()['startPageToken']
+        user_email = get_drive_user_email(service)
+        files = list_modified_files(service, window_start.isoformat(), datetime.now(timezone.utc).isoformat())
+
+        applied = self.commit("files", ("id", "modified_time", "file"), [
+            (file['id'], file.get('modifiedTime'), json.dumps(file)) for file in files
+        ], (), "drive", base_token, {
+            "drive_token": start_page_token, "drive_window_start": window_start.isoformat(), "drive_user": user_email
+        }, reset=True)
+        return len(files) if applied else 0
+
+    def _sync_drive_changes(self, service, base_token):
+        page_token = base_token
+        upserts = {}
+        deleted = set()
+
+        while True:
+            response = service.changes().list(
+                pageToken=page_token,
+                fields=DRIVE_CHANGE_FIELDS,
+                pageSize=1000,
+                includeRemoved=True,
+                spaces='drive'
+            ).execute()
+            for change in response.get('changes', []):
+                file = change.get('file')
+                if change.get('removed') or not file or file.get('trashed'):
+                    deleted.add(change['fileId'])
+                    upserts.pop(change['fileId'], None)
+                else:
+                    file.pop('trashed', None)
+                    upserts[file['id']] = file
+                    deleted.discard(file['id'])
+            if 'newStartPageToken' in response:
+                page_token = response['newStartPageToken']
+                break
+            page_token = response['nextPageToken']
+
+        applied = self.commit("files", ("id", "modified_time", "file"), [
+            (file_id, file.get('modifiedTime'), json.dumps(file)) for file_id, file in upserts.items()
+        ], deleted, "drive", base_token, {"drive_token": page_token})
+        return len(upserts) + len(deleted) if applied else 0
+
+    def drive_features(self, weeks):
+        """Features de Drive por semana calculadas desde el registro local."""
+        time_min, time_max = weeks[0][0].isoformat(), weeks[-1][1].isoformat()
+        with self._lock:
+            files = [
+                json.loads(row[0]) for row in self._conn.execute(
+                    "SELECT file FROM files WHERE modified_time >= ? AND modified_time < ?", (time_min, time_max)
+                )
+            ]
+        user_email = self.get_state("drive_user")
+        return [
+            compute_drive_features(files, user_email, fecha_desde.isoformat(), fecha_hasta.isoformat())
+            for fecha_desde, fecha_hasta in weeks
+        ]
+
+
+def _received_ids_by_week(service, fecha_desde, fecha_hasta):
+    """
+    {inicio de la semana (ms, hora local): ids de los recibidos en la bandeja
+    principal esa semana}, con semanas lunes–domingo como las de
+    utils.get_week_ranges_until: una consulta por semana, como range_email_features.
+    """
+    weeks = {}
+    week = fecha_desde.replace(hour=0, minute=0, second=0, microsecond=0)
+    week -= timedelta(days=week.weekday())
+    while week <= fecha_hasta:
+        _, query_received = gmail_queries(week, week + timedelta(days=6))
+        weeks[int(week.timestamp() * 1000)] = list_message_ids(service, query_received)
+        week += timedelta(days=7)
+    return weeks
+
+
+def _start_text(event):
+    return event['start'].get('dateTime', event['start'].get('date'))
+
+
+def synced_source_features(session, store, source, weeks, hora_inicio_laboral=9, hora_fin_laboral=18):
+    """Sincroniza `source` ('email', 'calendar' o 'drive') y devuelve sus features por semana."""
+    session = get_session(session)
+    window_start = weeks[0][0]
+    if source == 'email':
+        store.sync_gmail(session.gmail, window_start)
+        return store.email_features(weeks, hora_inicio_laboral, hora_fin_laboral)
+    if source == 'calendar':
+        store.sync_calendar(session.calendar, window_start, weeks[-1][1])
+        return store.calendar_features(weeks, hora_inicio_laboral, hora_fin_laboral)
+    if source == 'drive':
+        store.sync_drive(session.drive, window_start)
+        return store.drive_features(weeks)
+    raise ValueError(f"Fuente desconocida: '{source}'")
@@ -1,19 +1,49 @@
 import os
-from utils import build_windows_to_iana_map
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import json
+import asyncio
+from datetime import datetime, time, timedelta, timezone
+import numpy as np
 from azure.core.credentials import AccessToken
 from msgraph.generated.users.item.messages.messages_request_builder import MessagesRequestBuilder
 from msgraph.generated.users.item.events.events_request_builder import EventsRequestBuilder
+from msgraph.generated.drives.item.items.item.delta.delta_request_builder import DeltaRequestBuilder
 from kiota_abstractions.base_request_configuration import RequestConfiguration
 from kiota_abstractions.headers_collection import HeadersCollection
 from msgraph import GraphServiceClient
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+
+from ekilibria.features import intervals, timezones
+from ekilibria.microsoft_suite.drive_index import DELTA_SELECT, DeltaExpired, DriveIndex, sync_drive_index
 
 # Link for consent to access Microsoft Graph API:
 # https://login.microsoftonline.com/common/adminconsent?client_id=845ac38e-8122-4897-939d-0532d48feb95
 
 CLIENT_ID_MICROSOFT = os.getenv("CLIENT_ID_MICROSOFT")
 
+# Alternative Microsoft Graph base URL (e.g. ekilibria.benchmarks.fake_workspace). Empty = the real Graph API
+GRAPH_API_BASE_URL = os.getenv("GRAPH_API_BASE_URL")
+
+# Maximum Graph calls in flight per extraction (sources x weeks run concurrently)
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "8"))
+
+# Page size ($top) of the message, event and drive listings
+GRAPH_PAGE_SIZE = int(os.getenv("GRAPH_PAGE_SIZE", "500"))
+
+# true: mail features come from server-side counts ($count) instead of downloading the messages
+GRAPH_MAIL_COUNTS = os.getenv("GRAPH_MAIL_COUNTS", "true").lower() == "true"
+
+# true: mail and calendar features come from a local store per user kept current with delta queries
+GRAPH_SYNC_STORE = os.getenv("GRAPH_SYNC_STORE", "false").lower() == "true"
+
+# $count on messages requires advanced query headers
+COUNT_HEADERS = {'ConsistencyLevel': 'eventual'}
+
+# Day names as used by mailbox settings working hours, indexed by weekday (0 = Monday)
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Time zone names Graph uses for event times already in UTC
+UTC_NAMES = {'utc', 'etc/utc', 'coordinated universal time'}
+
 # Function to get Microsoft Graph API token
 async def get_microsoft_graph_api_token(token_dict):
 
@@ -34,7 +64,11 @@ def create_graph_client_from_token(token_dict):
     class SimpleCredential:
         def get_token(self, *scopes, **kwargs):
             return AccessToken(token_dict['token'], token_dict['expires_on'])
-    return GraphServiceClient(credentials=SimpleCredential())
+    client = GraphServiceClient(credentials=SimpleCredential())
+    if GRAPH_API_BASE_URL:
+        # Point the client to another Graph-compatible server (e.g. the local fake one)
+        client.request_adapter.base_url = GRAPH_API_BASE_URL.rstrip('/')
+    return client
 
 # Get the user's working hours and time zone
 async def user(client):
@@ -51,40 +85,143 @@ async def user(client):
     }
     return working_hours_res
 
-# Get emails from the user's mailbox for a specific date range
-async def get_mails(client, user_time_zone,iana_time_zone,from_date, to_date, folder="Inbox"):
-
-    # Format dates to ISO 8601 with Z (UTC)
-    from_date_fotmated = from_date.strftime("%Y-%m-%dT%H:%M:%SZ")
-    to_date_fotmated = to_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+# Iterate over the messages (raw JSON) of a folder received in a date range, requesting only
+# `select` and following @odata.nextLink lazily, one page of up to `page_size` messages at a time
+async def iter_messages(client, from_date, to_date, folder="Inbox", select=("receivedDateTime",), page_size=GRAPH_PAGE_SIZE):
 
     query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
-        filter=f"receivedDateTime ge {from_date_fotmated} and receivedDateTime le {to_date_fotmated}",
-        orderby=["receivedDateTime desc"]
+        filter=received_filter(from_date, to_date),
+        orderby=["receivedDateTime desc"],
+        select=list(select),
+        top=page_size
     )
 
     request_configuration = RequestConfiguration(
         query_parameters = query_params,
     )
 
-    messages_response = await client.me.mail_folders.by_mail_folder_id(folder).messages.get(request_configuration=request_configuration)
+    messages = client.me.mail_folders.by_mail_folder_id(folder).messages
+    async for page in _iter_pages(client, messages, request_configuration):
+        for message in page:
+            yield message
+
+# Get emails from the user's mailbox for a specific date range
+async def get_mails(client, user_time_zone,iana_time_zone,from_date, to_date, folder="Inbox"):
 
-    # Set default value for working_hours
-    total_emails = len(messages_response.value)
-    working_hours_count = 0
+    total_emails = 0
+    received = []
+    async for message in iter_messages(client, from_date, to_date, folder):
+        total_emails += 1
+        if message.get('receivedDateTime'):
+            received.append(message['receivedDateTime'])
 
-    for message in messages_response.value:
-        received_time = message.received_date_time
-        if received_time:
-            # Convert received time to user's time zone
-            local_received_time = received_time.astimezone(ZoneInfo(iana_time_zone))
-            # Check if the email was received during working hours
-            if local_received_time.strftime("%A").lower() in user_time_zone["daysOfWeek"]:
-                start_hour = user_time_zone["startTime"].hour
-                end_hour = user_time_zone["endTime"].hour
-                if start_hour <= local_received_time.hour < end_hour:
-                    working_hours_count += 1
+    return count_mails(total_emails, _utc_times(received), user_time_zone, iana_time_zone, folder)
 
+# Count the messages of a folder matching `filter` on the server, without downloading them
+async def count_messages(client, folder, filter):
+    query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+        filter=filter,
+        count=True,
+        select=["id"],
+        top=1
+    )
+    headers = HeadersCollection()
+    for name, value in COUNT_HEADERS.items():
+        headers.add(name, value)
+
+    request_builder = client.me.mail_folders.by_mail_folder_id(folder).messages
+    request_info = request_builder.to_get_request_information(RequestConfiguration(headers=headers, query_parameters=query_params))
+    return (await _get_json(client, request_info))['@odata.count']
+
+# Mail features of a folder from server-side counts: the total of the week and, for SentItems,
+# one count per working day window (the user's working hours, converted to UTC).
+# Every count runs through `bounded`, so each request takes its own slot of the caller's limit
+async def get_mail_counts(client, user_time_zone, iana_time_zone, from_date, to_date, folder="Inbox", bounded=None):
+    bounded = bounded or _unbounded
+    if folder == "Inbox":
+        return mail_features(folder, await bounded(count_messages(client, folder, received_filter(from_date, to_date))))
+
+    counts = await asyncio.gather(
+        bounded(count_messages(client, folder, received_filter(from_date, to_date))),
+        *(
+            bounded(count_messages(client, folder, received_filter(start, end, upper="lt")))
+            for start, end in working_hours_windows(user_time_zone, iana_time_zone, from_date, to_date)
+        )
+    )
+    return mail_features(folder, counts[0], sum(counts[1:]))
+
+async def _unbounded(coroutine):
+    return await coroutine
+
+# $filter of the messages received between two dates (naive dates are taken as UTC)
+def received_filter(from_date, to_date, upper="le"):
+    return f"receivedDateTime ge {_utc(from_date)} and receivedDateTime {upper} {_utc(to_date)}"
+
+def _utc(value):
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+# [start, end) UTC windows of the user's working hours on each working day between two dates,
+# clipped to the range; same hour granularity as count_mails (start hour <= hour < end hour)
+def working_hours_windows(user_time_zone, iana_time_zone, from_date, to_date):
+    zone = timezones.get_zone(iana_time_zone)
+    start_hour = _seconds_of_day(user_time_zone["startTime"]) // 3600
+    end_hour = _seconds_of_day(user_time_zone["endTime"]) // 3600
+    working_weekdays = _working_weekdays(user_time_zone)
+    range_start = from_date.replace(tzinfo=from_date.tzinfo or timezone.utc)
+    range_end = to_date.replace(tzinfo=to_date.tzinfo or timezone.utc)
+
+    windows = []
+    # One day of margin on each side: the local days of the range may start before it in UTC
+    day = from_date.date() - timedelta(days=1)
+    while day <= to_date.date() + timedelta(days=1):
+        if day.weekday() in working_weekdays and start_hour < end_hour:
+            start = datetime.combine(day, time(start_hour), tzinfo=zone).astimezone(timezone.utc)
+            end = (datetime.combine(day, time(0), tzinfo=zone) + timedelta(hours=end_hour)).astimezone(timezone.utc)
+            start, end = max(start, range_start), min(end, range_end + timedelta(seconds=1))
+            if start < end:
+                windows.append((start, end))
+        day += timedelta(days=1)
+    return windows
+
+# Pages (lists of raw JSON items) of a collection request, following @odata.nextLink.
+# The JSON is read directly: deserializing into SDK models costs several milliseconds per item
+async def _iter_pages(client, request_builder, request_configuration):
+    request_info = request_builder.to_get_request_information(request_configuration)
+    while request_info:
+        page = await _get_json(client, request_info)
+        yield page.get('value', [])
+
+        next_link = page.get('@odata.nextLink')
+        # The next link carries the query parameters, but headers (e.g. Prefer) must be sent again
+        request_info = request_builder.with_url(next_link).to_get_request_information(
+            RequestConfiguration(headers=request_configuration.headers)
+        ) if next_link else None
+
+# Send a request and return its raw JSON body
+async def _get_json(client, request_info):
+    content = await client.request_adapter.send_primitive_async(request_info, "bytes", {"XXX": ODataError})
+    return json.loads(content) if content else {}
+
+# "2024-01-01T09:00:00.000Z" (UTC, as Graph returns received/created times) -> datetime64
+def _utc_times(values):
+    return np.array([value[:19] for value in values], dtype='datetime64[s]')
+
+# Mail features from the received times (aware datetimes or UTC datetime64) of a folder
+def count_mails(total_emails, received, user_time_zone, iana_time_zone, folder="Inbox"):
+
+    # Classify all received times at once in the user's time zone
+    weekday, hour, _ = timezones.local_weekday_hour(received, iana_time_zone)
+    start_hour = _seconds_of_day(user_time_zone["startTime"]) // 3600
+    end_hour = _seconds_of_day(user_time_zone["endTime"]) // 3600
+    in_working_hours = np.isin(weekday, _working_weekdays(user_time_zone)) & (start_hour <= hour) & (hour < end_hour)
+    working_hours_count = int(in_working_hours.sum())
+
+    return mail_features(folder, total_emails, working_hours_count)
+
+# Mail features of a folder from its total and the messages inside working hours
+def mail_features(folder, total_emails, working_hours_count=0):
     if folder == "Inbox":
         ## Average emails received per day
         result = {
@@ -97,8 +234,9 @@ async def get_mails(client, user_time_zone,iana_time_zone,from_date, to_date, fo
         }
     return result
 
-# Get events from the user's calendar for a specific date range
-async def get_events(client, user_time_zone, iana_time_zone, from_date, to_date):
+# Iterate over the events (raw JSON) in a date range, with times in the user's time zone, requesting
+# only `select` and following @odata.nextLink lazily, one page of up to `page_size` events at a time
+async def iter_events(client, user_time_zone, from_date, to_date, select=("start", "end"), page_size=GRAPH_PAGE_SIZE):
     # Format dates to ISO 8601 with Z (UTC)
     from_date_str = from_date.strftime("%Y-%m-%dT%H:%M:%SZ")
     to_date_str = to_date.strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -109,7 +247,8 @@ async def get_events(client, user_time_zone, iana_time_zone, from_date, to_date)
     query_params = EventsRequestBuilder.EventsRequestBuilderGetQueryParameters(
         filter=f"start/dateTime ge '{from_date_str}' and end/dateTime le '{to_date_str}'",
         orderby=["start/dateTime asc"],
-        select=["subject", "start", "end", "location"]
+        select=list(select),
+        top=page_size
     )
 
     # Set the preferred time zone for the request
@@ -118,164 +257,197 @@ async def get_events(client, user_time_zone, iana_time_zone, from_date, to_date)
     headers = HeadersCollection()
     headers.add('prefer', f'outlook.timezone="{user_time_zone["timeZone"].name}"')
 
-
     request_configuration = RequestConfiguration(
         headers=headers,
         query_parameters=query_params,
     )
 
     # Make the request to get the user's events
-    events_response = await client.me.events.get(request_configuration=request_configuration)
+    async for page in _iter_pages(client, client.me.events, request_configuration):
+        for event in page:
+            yield event
 
-    if not events_response.value:
-        print("No events found for the specified date range.")
+# Get events from the user's calendar for a specific date range
+async def get_events(client, user_time_zone, iana_time_zone, from_date, to_date):
+    events = [event async for event in iter_events(client, user_time_zone, from_date, to_date)]
 
-    # Initialize counters for various metrics
-    total_events = len(events_response.value)
-    total_duration_hours = 0
-    events_outside_working_hours = 0
-    events_weekend = 0
-    events_in_working_hours = 0
-    meetings_without_breaks = 0
-    overlapping_meetings = 0
-    past_end_time = None  # To track the end time of the previous event
-
-    for event in events_response.value:
-
-        # Convert start and end times to user's time zone
-        start_time = event.start.date_time
-        end_time = event.end.date_time
-        start_dt = datetime.fromisoformat(start_time.replace(':00.0000000', ''))
-        end_dt = datetime.fromisoformat(end_time.replace(':00.0000000', ''))
-        local_start_time = start_dt.astimezone(ZoneInfo(iana_time_zone))
-        local_end_time = end_dt.astimezone(ZoneInfo(iana_time_zone))
-
-
-        if start_time and end_time:
-            # Check if the event is at least 15 apart from the previous event
-            if past_end_time and start_time:
-                    time_diff = local_start_time - past_end_time
-                    if time_diff.total_seconds() < 0:
-                        overlapping_meetings += 1
-                    elif time_diff.total_seconds() <= 15 * 60:
-                        meetings_without_breaks += 1
-
-            # Calculate duration in hours
-            duration_hours = (end_dt - start_dt).total_seconds() / 3600
-            total_duration_hours += duration_hours
-
-            # Check if the event is outside working hours
-            day_of_week = local_start_time.strftime('%A').lower()
-            if day_of_week not in user_time_zone['daysOfWeek']:
-                events_weekend += 1
-            elif not (user_time_zone['startTime'] <= local_end_time.time() <= user_time_zone['endTime']):
-                events_outside_working_hours += 1
-            else:
-                events_in_working_hours += 1
-
-
-        past_end_time = local_end_time
-
-    result = {
-        "num_events": events_in_working_hours,
-        "num_events_outside_hours": events_outside_working_hours,
-        "total_meeting_hours": total_duration_hours,
-        "avg_meeting_duration" : total_duration_hours / total_events if total_events > 0 else 0,
-        "meetings_weekend": events_weekend,
-        "num_meetings_no_breaks": meetings_without_breaks,
-        "num_overlapping_meetings": overlapping_meetings
-    }
+    if not events:
+        print("No events found for the specified date range.")
 
-    return result
+    return compute_event_features([events], user_time_zone, iana_time_zone)[0]
+
+# Compute calendar features for several weeks (or users) at once with the shared interval engine
+def compute_event_features(events_by_week, user_time_zone, iana_time_zone):
+    starts, ends, is_utc, group = [], [], [], []
+
+    for i, events in enumerate(events_by_week):
+        for event in events:
+            start_time, end_time, time_zone = _event_times(event)
+            if not (start_time and end_time):
+                continue
+
+            # Graph returns "2024-01-01T09:00:00.0000000" plus a separate time zone name
+            starts.append(start_time[:19])
+            ends.append(end_time[:19])
+            is_utc.append(str(time_zone or 'UTC').lower() in UTC_NAMES)
+            group.append(i)
+
+    # Times come in the user's time zone (Prefer header) unless Graph answered in UTC;
+    # those are converted in bulk to the user's wall time
+    local_start = np.array(starts, dtype='datetime64[s]')
+    local_end = np.array(ends, dtype='datetime64[s]')
+    is_utc = np.array(is_utc, dtype=bool)
+    if is_utc.any():
+        local_start[is_utc] = timezones.to_local(local_start[is_utc], iana_time_zone)
+        local_end[is_utc] = timezones.to_local(local_end[is_utc], iana_time_zone)
+
+    # An event is on a non-working day if its day is not in the user's working days;
+    # otherwise it is outside working hours if it ends outside the working time range
+    weekend = ~np.isin(intervals.weekday(local_start), _working_weekdays(user_time_zone))
+    end_seconds = intervals.seconds_of_day(local_end)
+    in_hours_time = (end_seconds >= _seconds_of_day(user_time_zone['startTime'])) & (end_seconds <= _seconds_of_day(user_time_zone['endTime']))
+    out_of_hours = ~weekend & ~in_hours_time
+
+    group = np.array(group, dtype=np.int64)
+    n_weeks = len(events_by_week)
+    # Microsoft keeps its original definitions (they are model inputs): a gap of up to
+    # 15 minutes inclusive is "no break", and the average duration is in hours
+    features = intervals.meeting_features(
+        local_start, local_end, group=group, n_groups=n_weeks,
+        out_of_hours=out_of_hours, weekend=weekend, no_break_inclusive=True
+    )
+    features['avg_meeting_duration'] = features['avg_meeting_duration'] / 60
+    # num_events only counts the events inside working days and hours
+    features['num_events'] = intervals.group_sum(~weekend & in_hours_time, group, n_weeks).astype(np.int64)
+
+    return [intervals.features_of_group(features, i) for i in range(n_weeks)]
+
+# Start, end and time zone of an event, either an SDK model or the raw JSON of a $batch response
+def _event_times(event):
+    if isinstance(event, dict):
+        start, end = event.get('start') or {}, event.get('end') or {}
+        return start.get('dateTime'), end.get('dateTime'), start.get('timeZone')
+    return event.start.date_time, event.end.date_time, event.start.time_zone
+
+# Weekday numbers (0 = Monday) of the user's working days
+def _working_weekdays(user_time_zone):
+    working_days = {str(getattr(day, 'value', day)).lower() for day in user_time_zone['daysOfWeek']}
+    return [i for i, name in enumerate(WEEKDAYS) if name in working_days]
+
+# Seconds since midnight of a working hours boundary (datetime.time or "HH:MM:SS")
+def _seconds_of_day(value):
+    if isinstance(value, str):
+        # Graph sends "09:00:00.0000000"
+        value = time.fromisoformat(value[:8])
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+# Bring the user's OneDrive index up to date with delta queries (only the changes since the last sync)
+async def sync_drive(client):
+    drive = await client.me.drive.get()
+    index = DriveIndex.for_drive(drive.id)
 
-# Recursively list all files in a folder and its subfolders
-async def list_all_files_in_folder(client,drive_id, folder_id="root", path=""):
+    delta = client.drives.by_drive_id(drive.id).items.by_drive_item_id("root").delta
+    first_page = RequestConfiguration(
+        query_parameters=DeltaRequestBuilder.DeltaRequestBuilderGetQueryParameters(select=DELTA_SELECT.split(','))
+    )
 
-    children = await client.drives.by_drive_id(drive_id).items.by_drive_item_id(folder_id).children.get()
+    async def get_page(url):
+        # The next and delta links already carry the query parameters
+        request_builder, request_configuration = (delta.with_url(url), RequestConfiguration()) if url else (delta, first_page)
+        try:
+            return await _get_json(client, request_builder.to_get_request_information(request_configuration))
+        except ODataError as e:
+            if e.response_status_code == 410:
+                raise DeltaExpired() from e
+            raise
 
-    files = []
-    for item in children.value:
-        item_path = f"{path}/{item.name}" if path else item.name
-        if item.folder:
-            # It's a folder, recurse into it
-            files += await list_all_files_in_folder(client,drive_id, item.id, item_path)
-        else:
-            # It's a file
-            files.append(item)
-    return files
+    try:
+        await sync_drive_index(index, get_page)
+    except BaseException:
+        index.close()
+        raise
+    return index
 
 # Get files from the user's OneDrive for a specific date range
 async def get_files(client, user_time_zone, iana_time_zone, from_date, to_date):
-
-    drive = await client.me.drive.get()
-
-    files = await list_all_files_in_folder(client, drive.id)
-
-
-    if not files:
-        print("No files found in OneDrive.")
-        return []
-
-    total_files = 0
-    created = 0
-    modified = 0
-
-    for file in files:
-
-        created_time = file.created_date_time
-        last_modified_time = file.last_modified_date_time
-
-        ## Convert to user's timezone
-        created_time = created_time.astimezone(ZoneInfo(iana_time_zone))
-        last_modified_time = last_modified_time.astimezone(ZoneInfo(iana_time_zone))
-        ## created_time and last_modified_time to native datetime objects
-        created_time = created_time.replace(tzinfo=None)
-        last_modified_time = last_modified_time.replace(tzinfo=None)
-
-        ## Count files created this week
-        if created_time:
-            if from_date <= created_time <= to_date:
-                created += 1
-            else:
-                ## Count files modified this week
-                if last_modified_time:
-                    if from_date <= last_modified_time <= to_date:
-                        modified += 1
-
-        total_files += 1
-
-    result = {
-        "docs_created": created,
-        "docs_edited": modified
-    }
-
-    return result
+    index = await sync_drive(client)
+    try:
+        return await asyncio.to_thread(index.count, iana_time_zone, from_date, to_date)
+    finally:
+        index.close()
 
 # Function to get data from Microsoft Graph API for a specific date range
 async def get_data(client,from_date, to_date):
+    features_by_week, errors_by_week = await get_weeks_data(client, [(from_date, to_date)])
+    if errors_by_week[0]:
+        raise next(iter(errors_by_week[0].values()))
+    return features_by_week[0]
+
+# Get data for several weeks at once: mailbox settings are fetched once, then every
+# source of every week runs concurrently, with at most `max_concurrency` sources in flight.
+# Returns (features_by_week, errors_by_week); a failing source does not cancel the others.
+# With `sync`, the features come from the local store after a delta refresh instead
+async def get_weeks_data(client, week_ranges, max_concurrency=GRAPH_MAX_CONCURRENCY, sync=GRAPH_SYNC_STORE):
+    if not week_ranges:
+        return [], []
+    if sync:
+        # Imported here: the store builds on this module
+        from ekilibria.microsoft_suite.sync_store import get_weeks_data_synced
+        return await get_weeks_data_synced(client, week_ranges)
 
     # Get the user's working hours and time zone
     user_time_zone = await (user(client))
-    if not user_time_zone:
-        print("❌ Unable to fetch user time zone information.")
-        return
-
-    time_zones = build_windows_to_iana_map()
-    iana_time_zone = time_zones.get(user_time_zone["timeZone"].name, 'UTC')
-   
-    emails_inbox = await (get_mails(client,user_time_zone,iana_time_zone, from_date, to_date,"Inbox"))
-    emails_sent = await (get_mails(client,user_time_zone,iana_time_zone, from_date, to_date,"SentItems"))
-    events = await (get_events(client, user_time_zone, iana_time_zone, from_date, to_date))
-    files = await (get_files(client, user_time_zone, iana_time_zone, from_date, to_date))
-
-    # Merge results into a single dictionary, keeping the original keys
-    result = emails_inbox.copy()
-    result.update(emails_sent)
-    result.update(events)
-    result.update(files)
-
-    return result
+    iana_time_zone = timezones.iana_zone(user_time_zone["timeZone"].name)
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    # The OneDrive index is refreshed once and counted per week
+    drive_index = asyncio.ensure_future(bounded(sync_drive(client)))
+
+    async def week_files(from_date, to_date):
+        index = await asyncio.shield(drive_index)
+        return await asyncio.to_thread(index.count, iana_time_zone, from_date, to_date)
+
+    # Mail features from server-side counts (each $count query takes its own slot),
+    # or from the received times of every message
+    def mails(folder):
+        if GRAPH_MAIL_COUNTS:
+            return lambda from_date, to_date: get_mail_counts(client, user_time_zone, iana_time_zone, from_date, to_date, folder, bounded)
+        return lambda from_date, to_date: bounded(get_mails(client, user_time_zone, iana_time_zone, from_date, to_date, folder))
+
+    sources = {
+        'emails_inbox': mails("Inbox"),
+        'emails_sent': mails("SentItems"),
+        'events': lambda from_date, to_date: bounded(get_events(client, user_time_zone, iana_time_zone, from_date, to_date)),
+        'files': week_files,
+    }
+    keys = [(i, source) for i in range(len(week_ranges)) for source in sources]
+    try:
+        results = await asyncio.gather(
+            *(sources[source](*week_ranges[i]) for i, source in keys),
+            return_exceptions=True
+        )
+    finally:
+        # If the gather was cancelled the walk would keep running with nobody awaiting it;
+        # its outcome is collected so a failure is not reported as never retrieved
+        drive_index.cancel()
+        await asyncio.gather(drive_index, return_exceptions=True)
+        if not drive_index.cancelled() and drive_index.exception() is None:
+            drive_index.result().close()
+
+    # Merge results into a single dictionary per week, keeping the original keys
+    features_by_week = [{} for _ in week_ranges]
+    errors_by_week = [{} for _ in week_ranges]
+    for (i, source), result in zip(keys, results):
+        if isinstance(result, Exception):
+            errors_by_week[i][source] = result
+        else:
+            features_by_week[i].update(result)
 
+    return features_by_week, errors_by_week
 
 if __name__ == "__main__":
    print("This module is not meant to be run directly. Use it as part of the Microsoft Graph API integration.")
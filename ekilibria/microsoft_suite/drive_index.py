@@ -0,0 +1,159 @@
+import os
+import re
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from dotenv import load_dotenv
+
+from ekilibria.features import timezones
+
+load_dotenv()
+
+# Directory with one SQLite database per user (shared with the Google sync store)
+SYNC_DIR = os.getenv("SYNC_DIR", "google_suite/sync")
+
+# Only the fields the index keeps (plus the facets that tell files, folders and deletions apart)
+DELTA_SELECT = "id,file,folder,deleted,createdDateTime,lastModifiedDateTime,lastModifiedBy"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY, created INTEGER NOT NULL, last_modified INTEGER NOT NULL, last_modified_by TEXT
+);
+CREATE INDEX IF NOT EXISTS files_created ON files (created);
+CREATE INDEX IF NOT EXISTS files_last_modified ON files (last_modified);
+"""
+
+
+class DeltaExpired(Exception):
+    """Graph no longer accepts the saved delta link (410 Gone): the index has to be rebuilt."""
+
+
+class DriveIndex:
+    """
+    Local index of the files of a OneDrive (id, created, lastModified and
+    lastModifiedBy) plus the delta link that returns only what changed since
+    the last sync. Weekly document counts are range queries on it.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    # One database per drive (the drive id identifies the user's OneDrive)
+    @classmethod
+    def for_drive(cls, drive_id, sync_dir=SYNC_DIR):
+        return cls(Path(sync_dir) / f"onedrive_{re.sub(r'[^A-Za-z0-9_-]', '_', drive_id)}.sqlite3")
+
+    @property
+    def delta_link(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = 'delta_link'").fetchone()
+        return row[0] if row else None
+
+    # Apply a complete delta walk started from `base_link` (None = full sync, which empties the
+    # index first) and save its new delta link, in one write transaction. BEGIN IMMEDIATE
+    # serializes the syncs of this drive across threads and workers; if another one already
+    # moved the index past `base_link`, this walk is discarded. Returns True if applied.
+    # It can wait up to the busy timeout for another worker: call it off the event loop
+    def commit_delta(self, base_link, upserts, deletes, delta_link, reset=False):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM state WHERE key = 'delta_link'").fetchone()
+                if (row[0] if row else None) != base_link:
+                    self._conn.rollback()
+                    return False
+                if reset:
+                    self._conn.execute("DELETE FROM files")
+                self._conn.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in deletes])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (id, created, last_modified, last_modified_by) VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+                self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('delta_link', ?)", (delta_link,))
+                self._conn.commit()
+                return True
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    # Files created, and otherwise modified, in a date range (naive dates in the user's time zone).
+    # Blocking like commit_delta: async callers run it with asyncio.to_thread
+    def count(self, iana_time_zone, from_date, to_date):
+        zone = timezones.get_zone(iana_time_zone)
+        start = from_date.replace(tzinfo=zone).timestamp()
+        end = to_date.replace(tzinfo=zone).timestamp()
+
+        with self._lock:
+            created = self._conn.execute(
+                "SELECT COUNT(*) FROM files WHERE created BETWEEN ? AND ?", (start, end)
+            ).fetchone()[0]
+            edited = self._conn.execute(
+                "SELECT COUNT(*) FROM files WHERE last_modified BETWEEN ? AND ? AND created NOT BETWEEN ? AND ?",
+                (start, end, start, end)
+            ).fetchone()[0]
+
+        return {
+            "docs_created": created,
+            "docs_edited": edited
+        }
+
+    def close(self):
+        # Under the lock: a count still running in a worker thread finishes first
+        with self._lock:
+            self._conn.close()
+
+
+# Bring the index up to date: follow the saved delta link, or run a full delta when there is none
+# or Graph rejected it. `get_page(url)` returns the JSON of a delta page (url None = first page of
+# a full sync) and raises DeltaExpired on 410. Returns the number of changes applied
+async def sync_drive_index(index, get_page):
+    delta_link = index.delta_link
+    if delta_link:
+        try:
+            return await _follow_delta(index, get_page, delta_link, reset=False)
+        except DeltaExpired:
+            pass
+    return await _follow_delta(index, get_page, None, reset=True, base_link=delta_link)
+
+
+# Walk every page first and commit them together with the new delta link
+async def _follow_delta(index, get_page, url, reset, base_link=None):
+    base_link = url if url is not None else base_link
+    upserts, deletes = {}, set()
+    while True:
+        page = await get_page(url)
+        for item in page.get('value', []):
+            if item.get('deleted'):
+                deletes.add(item['id'])
+                upserts.pop(item['id'], None)
+            elif item.get('file') is not None and item.get('createdDateTime') and item.get('lastModifiedDateTime'):
+                upserts[item['id']] = (
+                    item['id'],
+                    _epoch(item['createdDateTime']),
+                    _epoch(item['lastModifiedDateTime']),
+                    ((item.get('lastModifiedBy') or {}).get('user') or {}).get('email')
+                )
+                deletes.discard(item['id'])
+
+        if page.get('@odata.nextLink'):
+            url = page['@odata.nextLink']
+        else:
+            # In a worker thread: waiting for the write lock must not stall the event loop
+            applied = await asyncio.to_thread(
+                index.commit_delta, base_link, list(upserts.values()), deletes, page.get('@odata.deltaLink'), reset=reset
+            )
+            return len(upserts) + len(deletes) if applied else 0
+
+
+def _epoch(value):
+    # "2024-01-01T09:00:00Z" / "2024-01-01T09:00:00.123Z" (UTC)
+    return int(datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc).timestamp())
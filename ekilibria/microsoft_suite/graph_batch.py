@@ -0,0 +1,332 @@
+import os
+import random
+import asyncio
+from urllib.parse import urlsplit
+
+import httpx
+
+from ekilibria.features import timezones
+from ekilibria.microsoft_suite.drive_index import DELTA_SELECT, DeltaExpired, DriveIndex, sync_drive_index
+from ekilibria.microsoft_suite.api_microsoft_org import (
+    COUNT_HEADERS, GRAPH_API_BASE_URL, GRAPH_MAIL_COUNTS, GRAPH_MAX_CONCURRENCY, GRAPH_PAGE_SIZE, _utc, _utc_times,
+    compute_event_features, count_mails, mail_features, received_filter, working_hours_windows
+)
+
+# JSON $batch of Microsoft Graph: several requests in a single HTTPS call
+# https://learn.microsoft.com/graph/json-batching
+
+GRAPH_BASE_URL = (GRAPH_API_BASE_URL or "https://graph.microsoft.com/v1.0").rstrip('/')
+
+# Graph accepts at most 20 requests per $batch
+GRAPH_BATCH_SIZE = 20
+
+# Retries of throttled (429) or failed (5xx) sub-requests: Retry-After if present,
+# otherwise exponential backoff with jitter
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", "0.5"))
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", "32"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+DEFAULT_WORKING_HOURS = {
+    'daysOfWeek': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+    'startTime': '09:00:00',
+    'endTime': '17:00:00',
+}
+
+
+class GraphBatchError(Exception):
+    def __init__(self, response):
+        self.status = response.get('status')
+        error = (response.get('body') or {}).get('error') or {}
+        super().__init__(f"{self.status} {error.get('code', '')} {error.get('message', '')}".strip())
+
+
+class GraphBatchClient:
+    """
+    Sends Graph GET requests packed in $batch calls of up to `batch_size`
+    requests, with at most `max_concurrency` batches in flight. Sub-requests
+    answered with 429/5xx, missing from the reply (or whose whole batch
+    failed) are retried in the next round.
+    """
+
+    def __init__(self, token, base_url=GRAPH_BASE_URL, batch_size=GRAPH_BATCH_SIZE,
+                 max_retries=GRAPH_MAX_RETRIES, timeout=60.0, max_concurrency=GRAPH_MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        self.batch_calls = 0
+        self.retries = 0
+        self.http = httpx.AsyncClient(
+            headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+            timeout=timeout
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.http.aclose()
+
+    # Send the requests ({"url", "headers"}) and return their responses ({"status", "headers", "body"}) in order
+    async def send(self, requests):
+        pending = {str(i): request for i, request in enumerate(requests)}
+        responses = {}
+
+        for attempt in range(self.max_retries + 1):
+            ids = list(pending)
+            chunks = [ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+            results = await asyncio.gather(*(self._post_batch({id: pending[id] for id in chunk}) for chunk in chunks))
+
+            retry_after = None
+            for result in results:
+                for id, response in result.items():
+                    if response['status'] in RETRYABLE_STATUS and attempt < self.max_retries:
+                        after = _retry_after(response.get('headers'))
+                        if after is not None:
+                            retry_after = max(retry_after or 0.0, after)
+                        continue
+                    responses[id] = response
+                    del pending[id]
+
+            if not pending:
+                break
+            self.retries += len(pending)
+            await asyncio.sleep(_retry_delay(attempt, retry_after))
+
+        return [responses[str(i)] for i in range(len(requests))]
+
+    # Follow @odata.nextLink of every request until the last page; returns the items of each
+    # collection, the @odata.count of each "count" request, the body of each single resource
+    # (no "value"), or the GraphBatchError of a failed request
+    async def get_all(self, requests):
+        items = [[] for _ in requests]
+        current = list(enumerate(requests))
+
+        while current:
+            responses = await self.send([request for _, request in current])
+            following = []
+            for (i, request), response in zip(current, responses):
+                if not 200 <= response['status'] < 300:
+                    items[i] = GraphBatchError(response)
+                    continue
+                body = response.get('body') or {}
+                if request.get('count'):
+                    items[i] = body['@odata.count']
+                    continue
+                if 'value' not in body:
+                    items[i] = body
+                    continue
+                items[i].extend(body['value'])
+                if body.get('@odata.nextLink'):
+                    following.append((i, {**request, 'url': self.relative_url(body['@odata.nextLink'])}))
+            current = following
+
+        return items
+
+    async def _post_batch(self, requests):
+        payload = {'requests': [
+            {'id': id, 'method': 'GET', 'url': request['url'], **({'headers': request['headers']} if request.get('headers') else {})}
+            for id, request in requests.items()
+        ]}
+        self.batch_calls += 1
+        try:
+            async with self._semaphore:
+                response = await self.http.post(f"{self.base_url}/$batch", json=payload)
+        except httpx.TransportError as e:
+            return {id: _error_response(503, type(e).__name__, str(e)) for id in requests}
+
+        if response.status_code != 200:
+            # The whole batch failed: every sub-request gets its status (and Retry-After)
+            failed = {'status': response.status_code, 'headers': dict(response.headers), 'body': _json(response)}
+            return {id: failed for id in requests}
+
+        # A malformed reply can omit (or garble the id of) a sub-response: those are retried
+        answered = {
+            item.get('id'): item for item in _json(response).get('responses') or []
+            if isinstance(item, dict) and item.get('id') in requests and 'status' in item
+        }
+        return {
+            id: answered.get(id) or _error_response(503, 'MissingResponse', 'No response for this request in the batch')
+            for id in requests
+        }
+
+    # Sub-request URLs are relative to the version ("/me/events?...")
+    def relative_url(self, link):
+        if link.startswith(self.base_url):
+            return link[len(self.base_url):]
+        parts = urlsplit(link)
+        path = parts.path.split('/', 2)[-1] if parts.path.count('/') >= 2 else parts.path
+        return f"/{path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def _error_response(status, code, message):
+    return {'status': status, 'headers': {}, 'body': {'error': {'code': code, 'message': message}}}
+
+
+def _json(response):
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+def _retry_after(headers):
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    try:
+        return float(headers['retry-after']) if 'retry-after' in headers else None
+    except ValueError:
+        return None
+
+
+def _retry_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, GRAPH_BACKOFF_MAX)
+    return random.uniform(0, min(GRAPH_BACKOFF_MAX, GRAPH_BACKOFF_BASE * 2 ** attempt))
+
+
+# Working hours in the same shape as api_microsoft_org.user, from the raw mailbox settings
+def _working_hours(settings):
+    working_hours = settings.get('workingHours') or {}
+    time_zone = working_hours.get('timeZone') or {}
+    return {
+        'daysOfWeek': working_hours.get('daysOfWeek') or DEFAULT_WORKING_HOURS['daysOfWeek'],
+        'startTime': working_hours.get('startTime') or DEFAULT_WORKING_HOURS['startTime'],
+        'endTime': working_hours.get('endTime') or DEFAULT_WORKING_HOURS['endTime'],
+        'timeZone': time_zone.get('name') or 'UTC',
+    }
+
+
+def _messages_request(folder, from_date, to_date):
+    query = (
+        f"$filter={received_filter(from_date, to_date)}"
+        f"&$orderby=receivedDateTime desc&$select=receivedDateTime&$top={GRAPH_PAGE_SIZE}"
+    )
+    return {'url': f"/me/mailFolders/{folder}/messages?{query}"}
+
+
+def _count_request(folder, filter):
+    return {
+        'url': f"/me/mailFolders/{folder}/messages?$filter={filter}&$count=true&$select=id&$top=1",
+        'headers': COUNT_HEADERS,
+        'count': True,
+    }
+
+
+def _events_request(from_date, to_date):
+    query = (
+        f"$filter=start/dateTime ge '{_utc(from_date)}' and end/dateTime le '{_utc(to_date)}'"
+        f"&$orderby=start/dateTime asc&$select=start,end&$top={GRAPH_PAGE_SIZE}"
+    )
+    # Times in UTC: they are converted in bulk to the user's time zone
+    return {'url': f"/me/events?{query}", 'headers': {'Prefer': 'outlook.timezone="UTC"'}}
+
+
+# Bring the user's OneDrive index up to date with delta queries, one page per $batch call
+async def _sync_drive(batch, drive_id):
+    index = DriveIndex.for_drive(drive_id)
+
+    async def get_page(url):
+        url = batch.relative_url(url) if url else f"/drives/{drive_id}/items/root/delta()?$select={DELTA_SELECT}"
+        response, = await batch.send([{'url': url}])
+        if response['status'] == 410:
+            raise DeltaExpired()
+        if not 200 <= response['status'] < 300:
+            raise GraphBatchError(response)
+        return response.get('body') or {}
+
+    try:
+        await sync_drive_index(index, get_page)
+    except BaseException:
+        index.close()
+        raise
+    return index
+
+
+# Same result as api_microsoft_org.get_weeks_data, but with every Graph call packed in $batch
+# requests: mailbox settings, drive and the mails and events of all the weeks go in the first
+# round; then, at the same time, the working hours counts of SentItems (they depend on the
+# settings) and the delta refresh of the OneDrive index; plus one round per page of results
+async def get_weeks_data_batch(token_dict, week_ranges, base_url=GRAPH_BASE_URL, mail_counts=GRAPH_MAIL_COUNTS):
+    async with GraphBatchClient(token_dict['token'], base_url=base_url) as batch:
+        requests = [{'url': '/me/mailboxSettings'}, {'url': '/me/drive'}]
+        for from_date, to_date in week_ranges:
+            if mail_counts:
+                requests += [
+                    _count_request('Inbox', received_filter(from_date, to_date)),
+                    _count_request('SentItems', received_filter(from_date, to_date)),
+                ]
+            else:
+                requests += [
+                    _messages_request('Inbox', from_date, to_date),
+                    _messages_request('SentItems', from_date, to_date),
+                ]
+            requests.append(_events_request(from_date, to_date))
+        settings, drive, *responses = await batch.get_all(requests)
+
+        if isinstance(settings, Exception):
+            raise settings
+        user_time_zone = _working_hours(settings)
+        iana_time_zone = timezones.iana_zone(user_time_zone['timeZone'])
+
+        in_hours_by_week, drive_index = await asyncio.gather(
+            _sent_in_hours_by_week(batch, user_time_zone, iana_time_zone, week_ranges) if mail_counts else _none(),
+            _sync_drive(batch, drive['id']) if not isinstance(drive, Exception) else _none(),
+            return_exceptions=True
+        )
+        if isinstance(in_hours_by_week, Exception):
+            in_hours_by_week = [in_hours_by_week] * len(week_ranges)
+        if isinstance(drive, Exception):
+            drive_index = drive
+
+    features_by_week = [{} for _ in week_ranges]
+    errors_by_week = [{} for _ in week_ranges]
+    try:
+        for i, (from_date, to_date) in enumerate(week_ranges):
+            inbox, sent, events = responses[3 * i:3 * i + 3]
+            for source, folder, messages in (('emails_inbox', 'Inbox', inbox), ('emails_sent', 'SentItems', sent)):
+                if isinstance(messages, Exception):
+                    errors_by_week[i][source] = messages
+                elif not mail_counts:
+                    received = _utc_times([message['receivedDateTime'] for message in messages if message.get('receivedDateTime')])
+                    features_by_week[i].update(count_mails(len(messages), received, user_time_zone, iana_time_zone, folder))
+                elif folder == 'Inbox':
+                    features_by_week[i].update(mail_features(folder, messages))
+                elif isinstance(in_hours_by_week[i], Exception):
+                    errors_by_week[i][source] = in_hours_by_week[i]
+                else:
+                    features_by_week[i].update(mail_features(folder, messages, in_hours_by_week[i]))
+
+            if isinstance(events, Exception):
+                errors_by_week[i]['events'] = events
+            else:
+                features_by_week[i].update(compute_event_features([events], user_time_zone, iana_time_zone)[0])
+
+            if isinstance(drive_index, Exception):
+                errors_by_week[i]['files'] = drive_index
+            else:
+                features_by_week[i].update(await asyncio.to_thread(drive_index.count, iana_time_zone, from_date, to_date))
+    finally:
+        if not isinstance(drive_index, Exception):
+            drive_index.close()
+    return features_by_week, errors_by_week
+
+
+# Messages sent inside working hours per week: one count per working day window
+async def _sent_in_hours_by_week(batch, user_time_zone, iana_time_zone, week_ranges):
+    windows_by_week = [working_hours_windows(user_time_zone, iana_time_zone, *week) for week in week_ranges]
+    counts = await batch.get_all([
+        _count_request('SentItems', received_filter(start, end, upper='lt'))
+        for windows in windows_by_week for start, end in windows
+    ])
+
+    in_hours_by_week = []
+    for windows in windows_by_week:
+        week_counts, counts = counts[:len(windows)], counts[len(windows):]
+        errors = [count for count in week_counts if isinstance(count, Exception)]
+        in_hours_by_week.append(errors[0] if errors else sum(week_counts))
+    return in_hours_by_week
+
+
+async def _none():
+    return None
@@ -0,0 +1,297 @@
+import re
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from kiota_abstractions.headers_collection import HeadersCollection
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.generated.users.item.calendar_view.delta.delta_request_builder import DeltaRequestBuilder as CalendarViewDeltaRequestBuilder
+from msgraph.generated.users.item.mail_folders.item.messages.delta.delta_request_builder import DeltaRequestBuilder as MessagesDeltaRequestBuilder
+
+from ekilibria.features import timezones
+from ekilibria.microsoft_suite.drive_index import SYNC_DIR, _epoch
+from ekilibria.microsoft_suite.api_microsoft_org import (
+    _get_json, _utc, compute_event_features, count_mails, sync_drive, user
+)
+
+# Calendar events are synced up to this many days after today (calendarView delta needs a fixed window)
+CALENDAR_DAYS_AHEAD = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS messages (id TEXT PRIMARY KEY, folder TEXT NOT NULL, received INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS messages_received ON messages (folder, received);
+CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, start_time INTEGER NOT NULL, end_time INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS events_start ON events (start_time);
+"""
+
+
+class MicrosoftSyncStore:
+    """
+    Local record of a user's mail (Inbox and SentItems received times) and
+    calendar (event start and end, UTC), plus the delta links that return
+    only what changed since the last sync.
+
+    Each source also saves the date its record starts at; when older weeks
+    are requested (or Graph rejects the delta link), the source is synced
+    again from scratch.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    # One database per user, in the same directory as the OneDrive indexes and the Google stores
+    @classmethod
+    def for_user(cls, user_id, sync_dir=SYNC_DIR):
+        return cls(Path(sync_dir) / f"microsoft_{re.sub(r'[^A-Za-z0-9_-]', '_', user_id)}.sqlite3")
+
+    # --- State ---
+
+    def get_state(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # Delta link of a source if its record covers from `window_start` (and up to `window_end`, if it has an end)
+    def delta_link(self, source, window_start, window_end=None):
+        start = self.get_state(f"{source}_window_start")
+        if start is None or start > window_start.isoformat():
+            return None
+        end = self.get_state(f"{source}_window_end")
+        if window_end is not None and (end is None or end < window_end.isoformat()):
+            return None
+        return self.get_state(f"{source}_delta")
+
+    # Apply a complete delta walk of a source and save its state in one write transaction:
+    # upserts of (id, ...) rows, ids to delete and, for a full sync, `reset_where` to delete the
+    # previous record first. BEGIN IMMEDIATE serializes the syncs of this user across threads and
+    # workers; if another one already moved `link_key` past `base_link`, this walk is discarded
+    def commit(self, table, columns, upserts, deletes, link_key, base_link, state, reset_where=None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM state WHERE key = ?", (link_key,)).fetchone()
+                if (row[0] if row else None) != base_link:
+                    self._conn.rollback()
+                    return False
+                if reset_where is not None:
+                    self._conn.execute(f"DELETE FROM {table} WHERE {reset_where[0]}", reset_where[1])
+                self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(row_id,) for row_id in deletes])
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    upserts
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                    [(key, None if value is None else str(value)) for key, value in state.items()]
+                )
+                self._conn.commit()
+                return True
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    # --- Features ---
+
+    # Received times (UTC datetime64) of a folder's messages between two dates (naive dates are taken as UTC)
+    def received_times(self, folder, from_date, to_date):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT received FROM messages WHERE folder = ? AND received BETWEEN ? AND ?",
+                (folder, _utc_epoch(from_date), _utc_epoch(to_date))
+            ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64).astype('datetime64[s]')
+
+    # Events that start and end between two dates, in the shape of Graph's JSON. Naive dates are taken
+    # as UTC, like the start/dateTime filter of api_microsoft_org.iter_events
+    def events(self, from_date, to_date):
+        start, end = _utc_epoch(from_date), _utc_epoch(to_date)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start_time, end_time FROM events WHERE start_time >= ? AND end_time <= ? ORDER BY start_time",
+                (start, end)
+            ).fetchall()
+        return [
+            {'start': {'dateTime': _iso(start_time), 'timeZone': 'UTC'}, 'end': {'dateTime': _iso(end_time), 'timeZone': 'UTC'}}
+            for start_time, end_time in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Delta sync ---
+
+# Follow a delta from `request_info` to the end and return (items of every page, new delta link).
+# 410 from Graph (expired link) is raised as is for the caller to resync
+async def _follow_delta(client, request_builder, request_info):
+    items = []
+    while True:
+        page = await _get_json(client, request_info)
+        items.extend(page.get('value', []))
+        if not page.get('@odata.nextLink'):
+            return items, page.get('@odata.deltaLink')
+        request_info = request_builder.with_url(page['@odata.nextLink']).to_get_request_information(
+            RequestConfiguration(headers=request_info.headers)
+        )
+
+
+# Rows to upsert (built by `to_row`) and ids to delete from a list of delta items; the last change of an id wins
+def _changes(items, to_row):
+    upserts, deletes = {}, set()
+    for item in items:
+        if '@removed' in item:
+            deletes.add(item['id'])
+            upserts.pop(item['id'], None)
+        elif (row := to_row(item)) is not None:
+            upserts[item['id']] = row
+            deletes.discard(item['id'])
+    return list(upserts.values()), deletes
+
+
+async def _sync_source(store, source, window_start, full_request, request_builder, client, table, columns, to_row,
+                       reset_where, window_end=None, new_window_end=None):
+    link_key = f"{source}_delta"
+    delta_link = store.delta_link(source, window_start, window_end)
+    if delta_link:
+        try:
+            request_info = request_builder.with_url(delta_link).to_get_request_information(
+                RequestConfiguration(headers=full_request.headers)
+            )
+            items, link = await _follow_delta(client, request_builder, request_info)
+            await asyncio.to_thread(store.commit, table, columns, *_changes(items, to_row), link_key, delta_link, {link_key: link})
+            return
+        except ODataError as e:
+            if e.response_status_code != 410:
+                raise
+
+    base_link = store.get_state(link_key)
+    items, link = await _follow_delta(client, request_builder, full_request)
+    # In a worker thread, like DriveIndex.commit_delta: waiting for the write lock must not stall the event loop
+    await asyncio.to_thread(store.commit, table, columns, *_changes(items, to_row), link_key, base_link, {
+        link_key: link,
+        f"{source}_window_start": window_start.isoformat(),
+        f"{source}_window_end": new_window_end.isoformat() if new_window_end else None,
+    }, reset_where=reset_where)
+
+
+# Messages of a folder received since `window_start`, only their received time
+async def sync_messages(client, store, folder, window_start):
+    request_builder = client.me.mail_folders.by_mail_folder_id(folder).messages.delta
+    full_request = request_builder.to_get_request_information(RequestConfiguration(
+        query_parameters=MessagesDeltaRequestBuilder.DeltaRequestBuilderGetQueryParameters(
+            filter=f"receivedDateTime ge {_utc(window_start)}",
+            select=["receivedDateTime"]
+        )
+    ))
+
+    def to_row(item):
+        if item.get('receivedDateTime'):
+            return item['id'], folder, _epoch(item['receivedDateTime'])
+
+    await _sync_source(store, f"messages_{folder}", window_start, full_request, request_builder, client,
+                       "messages", ("id", "folder", "received"), to_row, reset_where=("folder = ?", (folder,)))
+
+
+# Calendar occurrences between `window_start` and CALENDAR_DAYS_AHEAD days from now, with times in UTC.
+# The window of a calendarView delta is fixed: once the record no longer reaches `until`, it is synced again
+async def sync_events(client, store, window_start, until):
+    window_end = datetime.now(timezone.utc) + timedelta(days=CALENDAR_DAYS_AHEAD)
+    headers = HeadersCollection()
+    headers.add('prefer', 'outlook.timezone="UTC"')
+
+    request_builder = client.me.calendar_view.delta
+    full_request = request_builder.to_get_request_information(RequestConfiguration(
+        headers=headers,
+        query_parameters=CalendarViewDeltaRequestBuilder.DeltaRequestBuilderGetQueryParameters(
+            start_date_time=_utc(window_start),
+            end_date_time=_utc(window_end)
+        )
+    ))
+
+    def to_row(item):
+        start, end = (item.get('start') or {}).get('dateTime'), (item.get('end') or {}).get('dateTime')
+        if start and end:
+            return item['id'], _epoch(start), _epoch(end)
+
+    await _sync_source(store, "events", window_start, full_request, request_builder, client,
+                       "events", ("id", "start_time", "end_time"), to_row, reset_where=("1 = 1", ()),
+                       window_end=until, new_window_end=window_end)
+
+
+# Same result as api_microsoft_org.get_weeks_data, computed from the local store after a delta
+# refresh of each source; repeat visits only transfer the activity that changed
+async def get_weeks_data_synced(client, week_ranges, sync_dir=SYNC_DIR):
+    me = await _get_json(client, client.me.to_get_request_information(RequestConfiguration()))
+    store = MicrosoftSyncStore.for_user(me['id'], sync_dir)
+    results = {}
+
+    try:
+        user_time_zone = await user(client)
+        iana_time_zone = timezones.iana_zone(user_time_zone["timeZone"].name)
+
+        # A day of margin on each side: the week bounds are local, the record window is UTC
+        window_start = min(from_date for from_date, _ in week_ranges) - timedelta(days=1)
+        window_start = datetime.combine(window_start.date(), datetime.min.time(), tzinfo=timezone.utc)
+        until = max(to_date for _, to_date in week_ranges) + timedelta(days=1)
+        until = datetime.combine(until.date(), datetime.min.time(), tzinfo=timezone.utc)
+
+        sources = {
+            'emails_inbox': sync_messages(client, store, "Inbox", window_start),
+            'emails_sent': sync_messages(client, store, "SentItems", window_start),
+            'events': sync_events(client, store, window_start, until),
+            'files': sync_drive(client),
+        }
+        results = dict(zip(sources, await asyncio.gather(*sources.values(), return_exceptions=True)))
+
+        features_by_week = [{} for _ in week_ranges]
+        errors_by_week = [{} for _ in week_ranges]
+
+        # Calendar features of all the weeks at once
+        if not isinstance(results['events'], Exception):
+            events_by_week = [store.events(from_date, to_date) for from_date, to_date in week_ranges]
+            for features, events in zip(features_by_week, compute_event_features(events_by_week, user_time_zone, iana_time_zone)):
+                features.update(events)
+
+        for i, (from_date, to_date) in enumerate(week_ranges):
+            for source, folder in (('emails_inbox', "Inbox"), ('emails_sent', "SentItems")):
+                if isinstance(results[source], Exception):
+                    errors_by_week[i][source] = results[source]
+                    continue
+                received = store.received_times(folder, from_date, to_date)
+                features_by_week[i].update(count_mails(len(received), received, user_time_zone, iana_time_zone, folder))
+
+            if isinstance(results['events'], Exception):
+                errors_by_week[i]['events'] = results['events']
+
+            if isinstance(results['files'], Exception):
+                errors_by_week[i]['files'] = results['files']
+            else:
+                features_by_week[i].update(await asyncio.to_thread(results['files'].count, iana_time_zone, from_date, to_date))
+
+        return features_by_week, errors_by_week
+    finally:
+        # Graph errors and expired delta links must not leave the SQLite connections open
+        store.close()
+        if results and not isinstance(results['files'], Exception):
+            results['files'].close()
+
+
+def _utc_epoch(value):
+    # Naive dates are taken as UTC, like api_microsoft_org.received_filter
+    return int(value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp())
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
@@ -0,0 +1,189 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+
+# Cantidad máxima de resultados en memoria (0 desactiva la caché)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+# Tiempo de vida de cada resultado, en segundos (0 = sin expiración)
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "86400"))
+# Archivo SQLite opcional para compartir resultados entre workers de la API
+PREDICTION_CACHE_DB = os.getenv("PREDICTION_CACHE_DB")
+# Cada cuántos segundos se borran del archivo SQLite los resultados expirados
+PREDICTION_CACHE_PURGE_INTERVAL = float(os.getenv("PREDICTION_CACHE_PURGE_INTERVAL", "300"))
+
+
+def feature_key(kind: str, vector, version: str) -> str:
+    """
+    Huella de un vector de features ya ordenado según expected_features,
+    del tipo de resultado (`kind`) y de la versión del modelo.
+    """
+    h = hashlib.sha256()
+    h.update(kind.encode())
+    h.update(version.encode())
+    h.update(np.ascontiguousarray(vector, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class SQLiteCacheBackend:
+    """
+    Almacén compartido entre procesos para los resultados de la caché.
+
+    La conexión se abre en el primer uso de cada proceso: un servidor que
+    importa el módulo y después forkea sus workers no les hereda un mismo
+    handle de SQLite.
+    """
+
+    def __init__(self, path: str, purge_interval=PREDICTION_CACHE_PURGE_INTERVAL):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._last_purge = 0.0
+
+    def _connection(self):
+        # Llamar con self._lock tomado
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None, None
+        return json.loads(value), expires_at
+
+    def set(self, key: str, value, expires_at):
+        self.set_many([(key, value)], expires_at)
+
+    def set_many(self, items, expires_at):
+        """Guarda varios pares (key, value) en una sola transacción (un solo commit)."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires_at) for key, value in items]
+            )
+            # Cada tanto, los resultados expirados se borran en lugar de quedar para siempre en el archivo
+            if now - self._last_purge >= self.purge_interval:
+                conn.execute("DELETE FROM predictions WHERE expires_at < ?", (now,))
+                self._last_purge = now
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM predictions")
+            conn.commit()
+
+
+class PredictionCache:
+    """
+    Caché LRU con expiración (TTL) para resultados de predicción.
+    Opcionalmente se apoya en un backend compartido (SQLite) que se consulta
+    cuando el resultado no está en memoria.
+    """
+
+    def __init__(self, maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: str):
+        """Devuelve el resultado guardado para `key` o None si no está (o expiró)."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at >= now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    # Copia: si quien llama modifica el resultado, la caché no cambia
+                    return copy.deepcopy(value)
+                del self._data[key]
+
+        if self.backend is not None:
+            value, expires_at = self.backend.get(key)
+            if value is not None:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Guarda varios pares (key, value); en el backend compartido, en una sola transacción."""
+        items = list(items)
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            for key, value in items:
+                self._store(key, value, expires_at)
+        if self.backend is not None and items:
+            self.backend.set_many(items, expires_at)
+
+    def _store(self, key, value, expires_at):
+        self._data[key] = (copy.deepcopy(value), expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "shared_backend": self.backend.path if self.backend is not None else None
+            }
+
+
+prediction_cache = PredictionCache(
+    backend=SQLiteCacheBackend(PREDICTION_CACHE_DB) if PREDICTION_CACHE_DB else None
+)
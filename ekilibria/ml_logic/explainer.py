@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import joblib
+from pathlib import Path
+
+# Ruta opcional donde persistir el explainer ya construido (se carga en lugar de reconstruirlo).
+# Se le agrega la versión del modelo, así un modelo reemplazado no reutiliza el explainer anterior
+EXPLAINER_PATH = os.getenv("EXPLAINER_PATH")
+
+# Método de atribución por defecto:
+#   "exact"       -> TreeSHAP exacto
+#   "approximate" -> atribución por camino de decisión (Saabas), mucho más rápida
+SHAP_METHOD = os.getenv("SHAP_METHOD", "exact")
+
+SHAP_METHODS = ("exact", "approximate")
+
+# Explainers ya construidos, uno por modelo
+_explainers = {}
+
+
+def explainer_path(path, version=None):
+    """Ruta del explainer de una versión del modelo: explainer.joblib -> explainer.<versión>.joblib."""
+    if not path or not version:
+        return path
+    path = Path(path)
+    return path.with_name(f"{path.stem}.{version}{path.suffix}")
+
+
+def load_or_build_explainer(model, path=EXPLAINER_PATH, version=None):
+    """
+    Devuelve un shap.TreeExplainer para el modelo. Si existe un explainer
+    serializado para `version` en `path` se carga desde disco; si no, se
+    construye y, si hay `path`, se guarda para los próximos arranques.
+    """
+    path = explainer_path(path, version)
+    if path and Path(path).exists():
+        return joblib.load(path)
+
+    import shap
+
+    explainer = shap.TreeExplainer(model)
+    if path:
+        joblib.dump(explainer, path)
+    return explainer
+
+
+def get_explainer(model, version=None):
+    """Devuelve el explainer del modelo (y su versión), construyéndolo solo la primera vez."""
+    key = (id(model), version)
+    explainer = _explainers.get(key)
+    if explainer is None:
+        explainer = load_or_build_explainer(model, version=version)
+        _explainers[key] = explainer
+    return explainer
+
+
+def shap_contributions(model, X, method=None, version=None):
+    """
+    Calcula las contribuciones de todas las filas de X en una sola llamada.
+    `version` identifica al modelo (registry.model_version) para no usar el
+    explainer de un modelo anterior.
+    Devuelve (shap_values de forma (n_filas, n_features), expected_value).
+    """
+    method = method or SHAP_METHOD
+    if method not in SHAP_METHODS:
+        raise ValueError(f"Método de atribución desconocido: '{method}'")
+
+    explainer = get_explainer(model, version)
+    shap_values = explainer.shap_values(X, approximate=(method == "approximate"))
+    expected_value = float(np.ravel(explainer.expected_value)[0])
+    return np.asarray(shap_values, dtype=float).reshape(len(X), -1), expected_value
+
+
+def contributions_percent_matrix(shap_values, expected_value):
+    """Contribución *en porcentaje* de cada feature al burnout_index de su fila, como matriz."""
+    burnout_index = expected_value + shap_values.sum(axis=1)
+    return np.round(shap_values / burnout_index[:, None] * 100, 1)
+
+
+def contributions_to_percent(shap_values, expected_value, feature_names):
+    """
+    Convierte una matriz de contribuciones en una lista de dicts con la
+    contribución *en porcentaje* de cada feature al burnout_index de su fila.
+    """
+    percents = contributions_percent_matrix(shap_values, expected_value)
+    return [
+        dict(zip(feature_names, row))
+        for row in percents.tolist()
+    ]
@@ -0,0 +1,151 @@
+import numpy as np
+
+# Filas por bloque al evaluar: limita la matriz (filas × árboles) de índices de nodo
+CHUNK_ROWS = 4096
+
+
+class FlatForest:
+    """
+    Random Forest de scikit-learn compilado a arrays planos de NumPy.
+
+    Todos los nodos de todos los árboles se empaquetan en los mismos arrays
+    (feature, threshold, children, value); las hojas apuntan a sí mismas,
+    así la evaluación avanza todos los árboles a la vez durante `max_depth`
+    pasos sin validaciones ni bucles Python por estimador.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, n_features, classes=None):
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * nodo] es el hijo izquierdo y children[2 * nodo + 1] el derecho
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compila un RandomForestClassifier o RandomForestRegressor ya entrenado."""
+        is_classifier = hasattr(model, "classes_")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            # Las hojas se apuntan a sí mismas y comparan contra la feature 0
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # En clasificadores tree_.value ya guarda la proporción de cada clase en la hoja
+            values.append(tree.value[:, 0, :] if is_classifier else tree.value[:, 0, 0])
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        children = np.empty(2 * offset, dtype=np.intp)
+        children[0::2] = np.concatenate(lefts)
+        children[1::2] = np.concatenate(rights)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            children=children,
+            value=np.concatenate(values),
+            roots=np.array(roots, dtype=np.intp),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+            classes=model.classes_ if is_classifier else None
+        )
+
+    def apply(self, X):
+        """Devuelve el índice (global) de la hoja alcanzada en cada árbol, de forma (filas, árboles)."""
+        # scikit-learn compara en float32, replicamos el mismo redondeo
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        X_flat = X.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[:, None]
+
+        nodes = np.repeat(self.roots[None, :], n_rows, axis=0)
+        for _ in range(self.max_depth):
+            go_right = X_flat[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_right]
+        return nodes
+
+    def _mean_leaf_value(self, X):
+        X = np.asarray(X)
+        chunks = []
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            leaf_values = self.value[self.apply(X[start:start + CHUNK_ROWS]).T]
+            # Suma secuencial árbol por árbol, en el mismo orden que scikit-learn,
+            # para obtener exactamente el mismo redondeo (y los mismos desempates)
+            total = np.add.accumulate(leaf_values, axis=0)[-1]
+            chunks.append(total / len(self.roots))
+        if not chunks:
+            return self.value[:0]
+        return np.concatenate(chunks)
+
+    def predict_proba(self, X):
+        if self.classes_ is None:
+            raise AttributeError("predict_proba solo está disponible para clasificadores")
+        return self._mean_leaf_value(X)
+
+    def predict(self, X):
+        if self.classes_ is None:
+            return self._mean_leaf_value(X)
+        return self.classes_[np.argmax(self._mean_leaf_value(X), axis=1)]
+
+
+def compile_forest(model) -> FlatForest:
+    """Atajo para FlatForest.from_sklearn."""
+    return FlatForest.from_sklearn(model)
+
+
+if __name__ == "__main__":
+    # Comprueba que el evaluador compilado coincide con scikit-learn y mide latencias
+    import time
+    import warnings
+    from ekilibria.ml_logic.registry import MODEL_PATHS, get_model
+
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    def percentiles(fn, X, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(X)
+            times.append((time.perf_counter() - start) * 1000)
+        return np.percentile(times, 50), np.percentile(times, 99)
+
+    rng = np.random.default_rng(0)
+
+    for name in MODEL_PATHS:
+        model = get_model(name)
+        flat = compile_forest(model)
+        X = rng.uniform(0, 50, size=(10000, model.n_features_in_)).round(2)
+
+        expected = model.predict(X)
+        obtained = flat.predict(X)
+        assert np.array_equal(expected, obtained), f"{name}: las predicciones no coinciden"
+        if flat.classes_ is not None:
+            assert np.array_equal(model.predict_proba(X), flat.predict_proba(X)), f"{name}: las probabilidades no coinciden"
+        print(f"✅ {name}: {len(flat.feature)} nodos, profundidad {flat.max_depth}, coincide con sklearn")
+
+        for batch in (1, 12, 100, 1000, 10000):
+            repeat = 200 if batch <= 100 else 20
+            sk50, sk99 = percentiles(model.predict, X[:batch], repeat)
+            fl50, fl99 = percentiles(flat.predict, X[:batch], repeat)
+            print(
+                f"   batch={batch:>5}  sklearn p50={sk50:8.3f}ms p99={sk99:8.3f}ms"
+                f"  |  flat p50={fl50:8.3f}ms p99={fl99:8.3f}ms"
+            )
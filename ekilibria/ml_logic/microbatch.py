@@ -0,0 +1,94 @@
+import os
+import asyncio
+
+# Micro-batching de requests concurrentes (opt-in)
+MICROBATCH = os.getenv("MICROBATCH", "false").lower() in ("1", "true", "yes")
+# Tiempo máximo que una fila espera a que se llene el lote, en milisegundos
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+# Cantidad de filas a partir de la cual el lote se procesa sin esperar
+MICROBATCH_MAX_ROWS = int(os.getenv("MICROBATCH_MAX_ROWS", "512"))
+
+
+class MicroBatcher:
+    """
+    Junta las filas de requests concurrentes durante unos milisegundos (o hasta
+    `max_rows` filas), las procesa con una sola llamada a `batch_fn` en un hilo
+    aparte y devuelve a cada request su porción del resultado vía futures.
+
+    `batch_fn` recibe una lista de filas y devuelve una lista de resultados
+    del mismo largo y en el mismo orden (como predict_batch).
+    """
+
+    def __init__(self, batch_fn, max_wait_ms=MICROBATCH_MAX_WAIT_MS, max_rows=MICROBATCH_MAX_ROWS):
+        self.batch_fn = batch_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_rows = max_rows
+        self.batches = 0
+        self.rows = 0
+        self._pending = []
+        self._pending_rows = 0
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, rows: list) -> list:
+        """Encola las filas de un request y espera sus resultados."""
+        if not rows:
+            return []
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((rows, future))
+        self._pending_rows += len(rows)
+
+        if self._pending_rows >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        if not batch:
+            return
+
+        # Guardamos una referencia a la tarea para que no la recolecte el GC
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        rows = [row for request_rows, _ in batch for row in request_rows]
+        loop = asyncio.get_running_loop()
+
+        try:
+            results = await loop.run_in_executor(None, self.batch_fn, rows)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(rows)
+
+        # Cada request recibe su porción, en el mismo orden en que envió las filas
+        start = 0
+        for request_rows, future in batch:
+            end = start + len(request_rows)
+            if not future.done():
+                future.set_result(results[start:end])
+            start = end
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_rows": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_rows": self.max_rows
+        }
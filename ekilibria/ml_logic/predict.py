@@ -1,20 +1,22 @@
+import math
 import numpy as np
-import joblib
-import shap
-from pathlib import Path
 
-# Ruta a los modelos
-MODEL1_PATH = Path(__file__).resolve().parent.parent.parent / "models" / "weektype_predictor.joblib"
-MODEL2_PATH = Path(__file__).resolve().parent.parent.parent / "models" / "burnout_index_predictor.joblib"
+from ekilibria.ml_logic.cache import prediction_cache, feature_key
+from ekilibria.ml_logic.explainer import SHAP_METHOD, shap_contributions, contributions_to_percent
+from ekilibria.ml_logic.registry import MODEL_PATHS, get_model, get_predictor, model_version
 
-if not MODEL1_PATH.exists():
-    raise FileNotFoundError(f"El modelo de clasificación no se encuentra en la ruta: {MODEL1_PATH}")
+# Ruta a los modelos
+MODEL1_PATH = MODEL_PATHS["weektype"]
+MODEL2_PATH = MODEL_PATHS["burnout_index"]
 
-if not MODEL2_PATH.exists():
-    raise FileNotFoundError(f"El modelo de regresión no se encuentra en la ruta: {MODEL2_PATH}")
 
-model1 = joblib.load(MODEL1_PATH)
-model2 = joblib.load(MODEL2_PATH)
+def __getattr__(name):
+    # Los modelos se cargan de forma perezosa desde el registry en el primer uso
+    if name == "model1":
+        return get_model("weektype")
+    if name == "model2":
+        return get_model("burnout_index")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Orden esperado de features (el mismo del entrenamiento)
 expected_features = [
@@ -35,57 +37,215 @@ expected_features = [
 def predict_weektype(features_dict: dict) -> int:
     """Devuelve el tipo de semana predicho (0 a 3) a partir del dict de features."""
 
+    X = _feature_vector(features_dict)
+    return _predict_weektypes(X)[0]
+
+def predict_burnoutindex(features_dict: dict) -> int:
+    """Devuelve el burnout index predicho (1 a 10) a partir del dict de features."""
+
+    X = _feature_vector(features_dict)
+    return _predict_burnoutindexes(X)[0]
+
+
+def compute_burnout_contributions(features_dict: dict, method: str = None) -> dict:
+    """
+    Devuelve un dict con la contribución *en porcentaje* de cada feature
+    al burnout_index predicho. Ej: { 'emails_sent': +12.3, 'docs_created': -5.6, ... }
+    """
+    return compute_burnout_contributions_batch([features_dict], method=method)[0]
+
+
+def compute_burnout_contributions_batch(features_list: list, method: str = None) -> list:
+    """
+    Igual que compute_burnout_contributions pero para una lista de semanas:
+    usa un único explainer y una sola llamada vectorizada a shap_values.
+    `method` puede ser "exact" (TreeSHAP) o "approximate" (Saabas).
+    """
+    X, _, errors = build_feature_matrix(features_list)
+    if errors:
+        raise ValueError(next(iter(errors.values())))
+
+    return _compute_contributions(X, method)
+
+
+def _feature_vector(features_dict: dict):
     # Verificamos que estén todos los features esperados
     missing = [feat for feat in expected_features if feat not in features_dict]
     if missing:
         raise ValueError(f"Faltan las siguientes features: {missing}")
 
     # Reordenar los valores en el orden esperado
-    X = np.array([[features_dict[feat] for feat in expected_features]])
+    return np.array([[features_dict[feat] for feat in expected_features]], dtype=float)
 
-    # Predicción
-    prediction = model1.predict(X)
-    return int(prediction[0])
 
-def predict_burnoutindex(features_dict: dict) -> int:
-    """Devuelve el burnout index predicho (1 a 10) a partir del dict de features."""
+def _cached_rows(kind: str, model_name: str, X, compute) -> list:
+    """
+    Devuelve un resultado por fila de X consultando primero la caché de
+    predicciones; `compute` solo se llama con las filas que no estaban.
+    """
+    if not prediction_cache.enabled:
+        return compute(X)
 
-    # Verificamos que estén todos los features esperados
-    missing = [feat for feat in expected_features if feat not in features_dict]
+    version = model_version(model_name)
+    keys = [feature_key(kind, row, version) for row in X]
+    values = [prediction_cache.get(key) for key in keys]
+
+    missing = [i for i, value in enumerate(values) if value is None]
     if missing:
-        raise ValueError(f"Faltan las siguientes features: {missing}")
+        for i, value in zip(missing, compute(X[missing])):
+            values[i] = value
+        # Todas las filas nuevas en una sola escritura (un commit en el backend compartido)
+        prediction_cache.set_many((keys[i], values[i]) for i in missing)
 
-    # Reordenar los valores en el orden esperado
-    X = np.array([[features_dict[feat] for feat in expected_features]])
+    return values
+
+
+def _predict_weektypes(X) -> list:
+    return _cached_rows(
+        "weektype", "weektype", X,
+        lambda rows: [int(pred) for pred in get_predictor("weektype", len(rows)).predict(rows)]
+    )
 
-    # Predicción
-    prediction = model2.predict(X)
-    return prediction[0]
 
+def _predict_burnoutindexes(X) -> list:
+    return _cached_rows(
+        "burnout_index", "burnout_index", X,
+        lambda rows: get_predictor("burnout_index", len(rows)).predict(rows).tolist()
+    )
 
-def compute_burnout_contributions(features_dict: dict) -> dict:
+
+def _compute_contributions(X, method: str = None) -> list:
+    method = method or SHAP_METHOD
+
+    def compute(rows):
+        # Valores SHAP de todas las filas en una sola pasada
+        shap_values, expected_value = shap_contributions(
+            get_model("burnout_index"), rows, method=method, version=model_version("burnout_index")
+        )
+        # Convertimos las contribuciones en % del burnout_index
+        return contributions_to_percent(shap_values, expected_value, expected_features)
+
+    return _cached_rows(f"contributions:{method}", "burnout_index", X, compute)
+
+
+def build_feature_matrix(features_list: list):
     """
-    Devuelve un dict con la contribución *en porcentaje* de cada feature
-    al burnout_index predicho. Ej: { 'emails_sent': +12.3, 'docs_created': -5.6, ... }
+    Valida una lista de dicts de features de una sola vez y arma la matriz
+    (n_semanas_validas × n_features) en el orden esperado.
+    Devuelve (X, indices_validos, errores) donde `errores` mapea el índice
+    de cada fila inválida a su mensaje de error.
     """
-    # Verificamos que estén todos los features esperados
-    missing = [feat for feat in expected_features if feat not in features_dict]
+    rows = []
+    valid_idx = []
+    errors = {}
+
+    for i, features_dict in enumerate(features_list):
+        missing = [feat for feat in expected_features if feat not in features_dict]
+        if missing:
+            errors[i] = f"Faltan las siguientes features: {missing}"
+            continue
+        try:
+            row = [float(features_dict[feat]) for feat in expected_features]
+        except (TypeError, ValueError):
+            errors[i] = "Las features deben ser numéricas"
+            continue
+        # json acepta NaN e Infinity: el bosque compilado y scikit-learn los tratan distinto
+        if not all(math.isfinite(value) for value in row):
+            errors[i] = "Las features deben ser números finitos"
+            continue
+        rows.append(row)
+        valid_idx.append(i)
+
+    X = np.array(rows, dtype=float).reshape(len(rows), len(expected_features))
+    return X, valid_idx, errors
+
+
+def predict_matrix(X, method: str = None):
+    """
+    Predice una matriz ya validada (n_semanas × n_features, en el orden de
+    expected_features). Devuelve (tipos_de_semana, burnout_indexes, contribuciones).
+    """
+    # Una predicción por modelo para todas las semanas (solo las que no están en caché)
+    week_types = _predict_weektypes(X)
+    burnout_indexes = _predict_burnoutindexes(X)
+
+    # Contribuciones de todas las semanas en una sola pasada
+    contributions = _compute_contributions(X, method)
+
+    return week_types, burnout_indexes, contributions
+
+
+def predict_batch(features_list: list, method: str = None) -> list:
+    """
+    Predice tipo de semana, burnout index y contribuciones para una lista de
+    semanas con un solo predict por modelo y una sola pasada del explainer.
+    Devuelve un resultado por semana, en el mismo orden; las semanas inválidas
+    llevan una clave "error" en lugar de las predicciones.
+    """
+    X, valid_idx, errors = build_feature_matrix(features_list)
+
+    result = [
+        {
+            "fecha_desde": features_dict.get("fecha_desde"),
+            "fecha_hasta": features_dict.get("fecha_hasta"),
+        }
+        for features_dict in features_list
+    ]
+
+    for i, error in errors.items():
+        result[i]["error"] = error
+
+    if not valid_idx:
+        return result
+
+    week_types, burnout_indexes, contributions = predict_matrix(X, method=method)
+
+    for row, i in enumerate(valid_idx):
+        result[i].update({
+            "week_type": week_types[row],
+            "burnout_index": burnout_indexes[row],
+            "contributions": contributions[row]
+        })
+
+    return result
+
+
+def predict_rows(rows: list, columns: list = None, method: str = None):
+    """
+    Variante compacta de predict_batch: cada semana es una lista de valores
+    en el orden de `columns` (por defecto expected_features).
+    Devuelve (filas, errores): una fila [week_type, burnout_index, *contribuciones]
+    por semana (None si es inválida) y un dict índice -> mensaje de error.
+    """
+    columns = list(columns or expected_features)
+    missing = [feat for feat in expected_features if feat not in columns]
     if missing:
         raise ValueError(f"Faltan las siguientes features: {missing}")
-
-    # Reordenar los valores en el orden esperado
-    X = np.array([[features_dict[feat] for feat in expected_features]])
-
-    # Crear el explainer y obtener valores SHAP
-    explainer = shap.TreeExplainer(model2)
-    shap_values = explainer.shap_values(X)[0]  # contribuciones
-    expected_value = explainer.expected_value  # valor base
-    burnout_index = expected_value + sum(shap_values)
-
-    # Convertimos las contribuciones en % del burnout_index
-    contrib_dict = {
-        feat: round(float(shap_val) / float(burnout_index) * 100, 1)
-        for feat, shap_val in zip(expected_features, shap_values)
+    order = [columns.index(feat) for feat in expected_features]
+
+    try:
+        X = np.array(rows, dtype=float).reshape(len(rows), len(columns))
+    except (TypeError, ValueError):
+        # Filas de distinto largo: las validamos una por una
+        X = np.full((len(rows), len(columns)), np.nan)
+        for i, row in enumerate(rows):
+            try:
+                X[i] = np.array(row, dtype=float).reshape(len(columns))
+            except (TypeError, ValueError):
+                continue
+
+    X = X[:, order]
+    valid = np.isfinite(X).all(axis=1)
+    valid_idx = np.flatnonzero(valid).tolist()
+    errors = {
+        i: f"Cada fila debe tener {len(columns)} valores numéricos finitos"
+        for i in np.flatnonzero(~valid).tolist()
     }
 
-    return contrib_dict
+    result = [None] * len(rows)
+    if valid_idx:
+        week_types, burnout_indexes, contributions = predict_matrix(X[valid], method=method)
+        for row, i in enumerate(valid_idx):
+            result[i] = [week_types[row], burnout_indexes[row], *contributions[row].values()]
+
+    return result, errors
@@ -0,0 +1,109 @@
+import os
+import threading
+import joblib
+from pathlib import Path
+
+# Ruta a los modelos
+MODELS_DIR = Path(__file__).resolve().parent.parent.parent / "models"
+
+MODEL_PATHS = {
+    "weektype": MODELS_DIR / "weektype_predictor.joblib",
+    "burnout_index": MODELS_DIR / "burnout_index_predictor.joblib",
+}
+
+# Modo de memory-mapping para joblib.load ("r", "c" o vacío para desactivarlo).
+# Solo se mapean los arrays que joblib guarda como numpy: scikit-learn copia los
+# nodos de cada árbol a sus propios buffers al deserializar, así que cada proceso
+# que carga el modelo tiene su copia. Para compartir esas páginas entre workers hay
+# que cargar antes de forkear (warmup() con gunicorn --preload).
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE") or None
+
+# Si está activo, la API carga los modelos y el explainer al arrancar
+# (primer request rápido) en lugar de hacerlo en el primer uso (arranque rápido).
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Evaluador compilado de arrays planos (ver flat_forest.py) para lotes chicos,
+# donde el overhead por llamada de scikit-learn domina la latencia
+FLAT_FOREST = os.getenv("FLAT_FOREST", "true").lower() in ("1", "true", "yes")
+# A partir de esta cantidad de filas se usa el predict de scikit-learn
+FLAT_FOREST_MAX_ROWS = int(os.getenv("FLAT_FOREST_MAX_ROWS", "256"))
+
+_models = {}
+_compiled = {}
+_versions = {}
+_lock = threading.Lock()
+
+
+def get_model(name: str):
+    """Devuelve el modelo `name`, cargándolo desde disco solo la primera vez."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Otro hilo pudo haberlo cargado mientras esperábamos el lock
+        if name not in _models:
+            if name not in MODEL_PATHS:
+                raise KeyError(f"Modelo desconocido: '{name}'")
+
+            path = MODEL_PATHS[name]
+            if not path.exists():
+                raise FileNotFoundError(f"El modelo '{name}' no se encuentra en la ruta: {path}")
+
+            _models[name] = joblib.load(path, mmap_mode=MODEL_MMAP_MODE)
+
+    return _models[name]
+
+
+def get_predictor(name: str, n_rows: int = 1):
+    """
+    Devuelve el objeto con el que predecir `n_rows` filas con el modelo `name`:
+    el bosque compilado a arrays planos para lotes chicos o el modelo de
+    scikit-learn para lotes grandes (o si FLAT_FOREST está desactivado).
+    """
+    if not FLAT_FOREST or n_rows > FLAT_FOREST_MAX_ROWS:
+        return get_model(name)
+
+    compiled = _compiled.get(name)
+    if compiled is None:
+        from ekilibria.ml_logic.flat_forest import compile_forest
+
+        model = get_model(name)
+        with _lock:
+            if name not in _compiled:
+                _compiled[name] = compile_forest(model)
+        compiled = _compiled[name]
+    return compiled
+
+
+def model_version(name: str) -> str:
+    """
+    Identificador de la versión del modelo en disco (tamaño + fecha de
+    modificación del archivo). Cambia cada vez que se reemplaza el modelo.
+    """
+    version = _versions.get(name)
+    if version is None:
+        stat = MODEL_PATHS[name].stat()
+        version = f"{name}-{stat.st_size}-{stat.st_mtime_ns}"
+        _versions[name] = version
+    return version
+
+
+def loaded_models() -> list:
+    """Devuelve los nombres de los modelos ya cargados en este proceso."""
+    return list(_models)
+
+
+def warmup():
+    """
+    Carga todos los modelos, los compila y construye el explainer por adelantado.
+    Llamarlo antes de forkear los workers (p. ej. gunicorn --preload) hace
+    que todos compartan las páginas ya cargadas.
+    """
+    from ekilibria.ml_logic.explainer import get_explainer
+
+    for name in MODEL_PATHS:
+        get_model(name)
+        get_predictor(name)
+
+    get_explainer(get_model("burnout_index"), model_version("burnout_index"))
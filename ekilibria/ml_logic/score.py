@@ -0,0 +1,201 @@
+"""
+Scoring masivo en formato columnar (Arrow IPC o Parquet).
+
+Uso:
+    python -m ekilibria.ml_logic.score features.parquet predicciones.parquet
+    python -m ekilibria.ml_logic.score features.arrow predicciones.arrow --chunk-rows 50000
+"""
+import os
+import numpy as np
+from pathlib import Path
+
+from ekilibria.ml_logic.explainer import shap_contributions, contributions_percent_matrix
+from ekilibria.ml_logic.predict import expected_features
+from ekilibria.ml_logic.registry import get_model, get_predictor, model_version
+
+# Filas por bloque al leer y predecir
+SCORE_CHUNK_ROWS = int(os.getenv("SCORE_CHUNK_ROWS", "65536"))
+
+DATE_COLUMNS = ["fecha_desde", "fecha_hasta"]
+CONTRIBUTION_PREFIX = "contribution_"
+
+FORMATS = ("parquet", "arrow")
+
+
+def detect_format(path) -> str:
+    """Deduce el formato a partir de la extensión del archivo."""
+    suffix = Path(path).suffix.lower()
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    if suffix in (".arrow", ".feather", ".ipc", ".arrows"):
+        return "arrow"
+    raise ValueError(f"No se puede deducir el formato de '{path}', usar --format {'|'.join(FORMATS)}")
+
+
+def open_record_batches(source, fmt: str, chunk_rows: int = SCORE_CHUNK_ROWS):
+    """
+    Abre `source` (ruta o archivo binario) y devuelve (schema, bloques), donde
+    los bloques son de como mucho `chunk_rows` filas y se leen a medida que se recorren.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        parquet_file = pq.ParquetFile(source)
+        return parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=chunk_rows)
+
+    if fmt != "arrow":
+        raise ValueError(f"Formato desconocido: '{fmt}'")
+
+    # Arrow IPC puede venir en formato archivo (acceso aleatorio) o stream
+    try:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        reader = pa.ipc.open_stream(source)
+        batches = reader
+
+    def sliced():
+        for batch in batches:
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(start, chunk_rows)
+
+    return reader.schema, sliced()
+
+
+def iter_record_batches(source, fmt: str, chunk_rows: int = SCORE_CHUNK_ROWS):
+    """Lee `source` (ruta o archivo binario) de a bloques de como mucho `chunk_rows` filas."""
+    _, batches = open_record_batches(source, fmt, chunk_rows)
+    yield from batches
+
+
+def output_schema(input_schema):
+    """
+    Schema del resultado de score_record_batch para una entrada con `input_schema`:
+    fechas (si vienen), week_type, burnout_index, una contribución por feature y error.
+    """
+    import pyarrow as pa
+
+    missing = [feat for feat in expected_features if feat not in input_schema.names]
+    if missing:
+        raise ValueError(f"Faltan las siguientes columnas: {missing}")
+
+    fields = [input_schema.field(name) for name in DATE_COLUMNS if name in input_schema.names]
+    fields += [pa.field("week_type", pa.int64()), pa.field("burnout_index", pa.float64())]
+    fields += [pa.field(f"{CONTRIBUTION_PREFIX}{feat}", pa.float64()) for feat in expected_features]
+    fields.append(pa.field("error", pa.string()))
+    return pa.schema(fields)
+
+
+def score_record_batch(batch, method: str = None):
+    """
+    Predice un RecordBatch con las columnas de expected_features (y
+    opcionalmente fecha_desde/fecha_hasta) y devuelve otro RecordBatch con
+    week_type, burnout_index y una columna de contribución por feature.
+    Las filas con features nulas o no finitas (NaN, inf) quedan con
+    predicciones nulas y el motivo en la columna "error".
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    schema = output_schema(batch.schema)
+
+    n_rows = batch.num_rows
+    columns = []
+    for feat in expected_features:
+        column = batch.column(feat)
+        try:
+            columns.append(pc.cast(column, pa.float64()))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            raise ValueError(f"La columna '{feat}' debe ser numérica")
+
+    # Filas válidas: ninguna feature nula ni NaN/inf (el bosque compilado y
+    # scikit-learn los tratan distinto)
+    not_null = np.ones(n_rows, dtype=bool)
+    for column in columns:
+        if column.null_count:
+            not_null &= column.is_valid().to_numpy(zero_copy_only=False)
+
+    X = np.column_stack([
+        column.to_numpy(zero_copy_only=False) for column in columns
+    ]) if n_rows else np.empty((0, len(expected_features)))
+    valid = not_null & np.isfinite(X).all(axis=1)
+    X_valid = X[valid]
+
+    week_type = np.zeros(n_rows, dtype=np.int64)
+    burnout_index = np.zeros(n_rows, dtype=np.float64)
+    contributions = np.zeros((n_rows, len(expected_features)), dtype=np.float64)
+
+    if len(X_valid):
+        week_type[valid] = get_predictor("weektype", len(X_valid)).predict(X_valid)
+        burnout_index[valid] = get_predictor("burnout_index", len(X_valid)).predict(X_valid)
+        shap_values, expected_value = shap_contributions(
+            get_model("burnout_index"), X_valid, method=method, version=model_version("burnout_index")
+        )
+        contributions[valid] = contributions_percent_matrix(shap_values, expected_value)
+
+    arrays = [batch.column(name) for name in DATE_COLUMNS if name in batch.schema.names]
+    arrays.append(pa.array(week_type, mask=~valid))
+    arrays.append(pa.array(burnout_index, mask=~valid))
+    for i in range(len(expected_features)):
+        arrays.append(pa.array(contributions[:, i], mask=~valid))
+
+    errors = np.where(~not_null, "Faltan features en la fila", "Las features deben ser números finitos")
+    arrays.append(pa.array(errors, type=pa.string(), mask=valid))
+
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def score_stream(source, sink, fmt: str, chunk_rows: int = SCORE_CHUNK_ROWS, method: str = None) -> int:
+    """
+    Lee `source`, predice bloque a bloque y escribe el resultado en `sink`
+    con el mismo formato. Devuelve la cantidad de filas procesadas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    input_schema, batches = open_record_batches(source, fmt, chunk_rows)
+
+    # El writer se crea con el schema de salida antes del primer bloque: una entrada
+    # válida sin filas también produce un Parquet/Arrow válido (vacío)
+    schema = output_schema(input_schema)
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    n_rows = 0
+    try:
+        for batch in batches:
+            writer.write_batch(score_record_batch(batch, method=method))
+            n_rows += batch.num_rows
+    finally:
+        writer.close()
+
+    return n_rows
+
+
+def score_file(input_path, output_path, fmt: str = None, chunk_rows: int = SCORE_CHUNK_ROWS, method: str = None) -> int:
+    """Predice un archivo Parquet/Arrow completo y escribe las predicciones en `output_path`."""
+    fmt = fmt or detect_format(input_path)
+    return score_stream(str(input_path), str(output_path), fmt, chunk_rows=chunk_rows, method=method)
+
+
+if __name__ == "__main__":
+    import time
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Scoring masivo de semanas en formato Arrow IPC o Parquet")
+    parser.add_argument("input", help="Archivo de entrada con las features")
+    parser.add_argument("output", help="Archivo de salida con las predicciones")
+    parser.add_argument("--format", dest="fmt", choices=FORMATS, help="Formato (por defecto según la extensión)")
+    parser.add_argument("--chunk-rows", type=int, default=SCORE_CHUNK_ROWS, help="Filas por bloque")
+    parser.add_argument("--method", choices=("exact", "approximate"), help="Método de atribución SHAP")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    total = score_file(args.input, args.output, fmt=args.fmt, chunk_rows=args.chunk_rows, method=args.method)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {total} filas procesadas en {elapsed:.2f}s → {args.output}")
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime
+
+from ekilibria.microsoft_suite.drive_index import DeltaExpired, DriveIndex, sync_drive_index
+
+WEEK = (datetime(2025, 3, 3), datetime(2025, 3, 9, 23, 59, 59))
+
+
+def drive_file(file_id, created, modified):
+    return {
+        'id': file_id,
+        'file': {},
+        'createdDateTime': created,
+        'lastModifiedDateTime': modified,
+        'lastModifiedBy': {'user': {'email': 'user@example.com'}},
+    }
+
+
+def fake_pages(pages):
+    """get_page de sync_drive_index sobre un dict url -> página (None = primera página de la sincronización completa)."""
+    async def get_page(url):
+        if url not in pages:
+            raise DeltaExpired()
+        return pages[url]
+    return get_page
+
+
+def test_sync_applies_delta_then_deletion(tmp_path):
+    index = DriveIndex.for_drive("drive!1", tmp_path)
+    get_page = fake_pages({
+        None: {
+            'value': [drive_file('a', '2025-03-04T10:00:00Z', '2025-03-04T10:00:00Z')],
+            '@odata.nextLink': 'page2',
+        },
+        'page2': {
+            'value': [drive_file('b', '2025-02-01T10:00:00Z', '2025-03-05T10:00:00Z'), {'id': 'folder', 'folder': {}}],
+            '@odata.deltaLink': 'L1',
+        },
+        'L1': {'value': [{'id': 'a', 'deleted': {'state': 'deleted'}}], '@odata.deltaLink': 'L2'},
+    })
+
+    assert asyncio.run(sync_drive_index(index, get_page)) == 2
+    assert index.delta_link == 'L1'
+    assert index.count('UTC', *WEEK) == {'docs_created': 1, 'docs_edited': 1}
+
+    assert asyncio.run(sync_drive_index(index, get_page)) == 1
+    assert index.delta_link == 'L2'
+    assert index.count('UTC', *WEEK) == {'docs_created': 0, 'docs_edited': 1}
+    index.close()
+
+
+def test_commit_delta_rejects_stale_link(tmp_path):
+    index = DriveIndex.for_drive("drive!1", tmp_path)
+    assert index.commit_delta(None, [('a', 1741082400, 1741082400, None)], (), 'L1', reset=True)
+
+    # Un walk que arrancó antes de que otro worker guardara L1 se descarta entero
+    assert not index.commit_delta(None, [], (), 'L0', reset=True)
+    assert not index.commit_delta('L0', [], ['a'], 'L9')
+    assert index.delta_link == 'L1'
+    assert index.count('UTC', *WEEK)['docs_created'] == 1
+    index.close()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from ekilibria.ml_logic.flat_forest import compile_forest
+from ekilibria.ml_logic.registry import MODEL_PATHS, get_model
+
+pytestmark = pytest.mark.filterwarnings("ignore:X does not have valid feature names")
+
+
+@pytest.fixture(scope="module", params=sorted(MODEL_PATHS))
+def forest(request):
+    model = get_model(request.param)
+    return model, compile_forest(model)
+
+
+def assert_same_predictions(model, flat, X):
+    assert np.array_equal(model.predict(X), flat.predict(X))
+    if flat.classes_ is not None:
+        assert np.array_equal(model.predict_proba(X), flat.predict_proba(X))
+
+
+def random_rows(model, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, 50, size=(n_rows, model.n_features_in_)).round(2)
+
+
+def test_one_row(forest):
+    model, flat = forest
+    assert_same_predictions(model, flat, random_rows(model, 1))
+
+
+def test_full_batch(forest):
+    model, flat = forest
+    assert_same_predictions(model, flat, random_rows(model, 5000))
+
+
+def test_values_on_split_thresholds(forest):
+    # Cada fila pone una feature exactamente en el umbral de un nodo (en float32, como compara sklearn)
+    model, flat = forest
+    split_nodes = np.flatnonzero(flat.children[0::2] != np.arange(len(flat.feature)))
+    rng = np.random.default_rng(1)
+    nodes = rng.choice(split_nodes, size=min(2000, len(split_nodes)), replace=False)
+
+    X = random_rows(model, len(nodes), seed=2).astype(np.float32)
+    X[np.arange(len(nodes)), flat.feature[nodes]] = flat.threshold[nodes].astype(np.float32)
+    assert_same_predictions(model, flat, X)
+
+
+def test_empty_batch(forest):
+    model, flat = forest
+    X = random_rows(model, 0)
+    assert flat.predict(X).shape == (0,)
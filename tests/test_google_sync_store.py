@@ -0,0 +1,73 @@
+from datetime import date
+
+from ekilibria.google_suite.services.extract_features import week_datetimes
+from ekilibria.google_suite.services.sync_store import GoogleSyncStore
+
+WEEKS = week_datetimes([(date(2025, 3, 3), date(2025, 3, 9))])
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeCalendar:
+    """Servicio de Calendar que responde `responses` en orden y guarda los parámetros de cada llamada."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        self.calls.append(params)
+        return FakeRequest(self.responses.pop(0))
+
+
+def event(event_id, day, start_hour, end_hour):
+    return {
+        'id': event_id,
+        'status': 'confirmed',
+        'start': {'dateTime': f'2025-03-{day:02d}T{start_hour:02d}:00:00Z'},
+        'end': {'dateTime': f'2025-03-{day:02d}T{end_hour:02d}:00:00Z'},
+    }
+
+
+def test_calendar_sync_applies_delta_then_deletion(tmp_path):
+    store = GoogleSyncStore(tmp_path / "token_user.sqlite3")
+    window_start, window_end = WEEKS[0][0], WEEKS[-1][1]
+
+    full = FakeCalendar({'items': [event('a', 3, 10, 11), event('b', 4, 10, 12)], 'nextSyncToken': 't1'})
+    assert store.sync_calendar(full, window_start, window_end) == 2
+    # La sincronización completa tiene fin: no trae todas las instancias futuras de los recurrentes
+    assert 'timeMin' in full.calls[0] and 'timeMax' in full.calls[0]
+    assert store.calendar_features(WEEKS)[0]['num_events'] == 2
+
+    delta = FakeCalendar({'items': [{'id': 'b', 'status': 'cancelled'}, event('c', 5, 15, 16)], 'nextSyncToken': 't2'})
+    assert store.sync_calendar(delta, window_start, window_end) == 2
+    assert delta.calls[0]['syncToken'] == 't1'
+    assert store.get_state("calendar_token") == 't2'
+    assert store.calendar_features(WEEKS)[0]['num_events'] == 2
+    store.close()
+
+
+def test_commit_rejects_stale_token(tmp_path):
+    path = tmp_path / "token_user.sqlite3"
+    store, other = GoogleSyncStore(path), GoogleSyncStore(path)
+    window_start, window_end = WEEKS[0][0], WEEKS[-1][1]
+    store.sync_calendar(FakeCalendar({'items': [event('a', 3, 10, 11)], 'nextSyncToken': 't1'}), window_start, window_end)
+
+    # Otro worker avanza el token mientras esta sincronización seguía desde t1
+    other.sync_calendar(FakeCalendar({'items': [event('b', 4, 10, 11)], 'nextSyncToken': 't2'}), window_start, window_end)
+    assert not store.commit(
+        "events", ("id", "start_time", "event"), [], ['a', 'b'], "calendar", 't1', {"calendar_token": 't1b'}
+    )
+    assert store.get_state("calendar_token") == 't2'
+    assert store.calendar_features(WEEKS)[0]['num_events'] == 2
+    store.close()
+    other.close()
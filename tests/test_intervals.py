@@ -0,0 +1,68 @@
+import numpy as np
+
+from ekilibria.features import intervals
+
+
+def times(*values):
+    return np.array(values, dtype='datetime64[s]')
+
+
+def test_sweep_gaps_nested_events():
+    # B está dentro de A; C empieza después de B pero mientras A sigue en curso
+    start = times('2025-03-03T09:00', '2025-03-03T10:00', '2025-03-03T11:30')
+    end = times('2025-03-03T12:00', '2025-03-03T11:00', '2025-03-03T12:30')
+    gaps = intervals.sweep_gaps(start, end)
+    assert np.isnan(gaps[0])
+    assert gaps[1] == -2 * 3600
+    # Solo se compara contra el evento anterior (B), no contra A
+    assert gaps[2] == 30 * 60
+
+
+def test_sweep_gaps_touching_events():
+    start = times('2025-03-03T09:00', '2025-03-03T10:00')
+    end = times('2025-03-03T10:00', '2025-03-03T11:00')
+    gaps = intervals.sweep_gaps(start, end)
+    assert gaps[1] == 0
+
+    features = intervals.meeting_features(start, end)
+    assert features['num_overlapping_meetings'][0] == 0
+    assert features['num_meetings_no_breaks'][0] == 1
+
+
+def test_sweep_gaps_unsorted_input_keeps_original_order():
+    start = times('2025-03-03T11:00', '2025-03-03T09:00', '2025-03-03T10:00')
+    end = times('2025-03-03T12:00', '2025-03-03T10:30', '2025-03-03T10:45')
+    gaps = intervals.sweep_gaps(start, end)
+    assert np.isnan(gaps[1])
+    assert gaps[2] == -30 * 60
+    assert gaps[0] == 15 * 60
+
+
+def test_sweep_gaps_events_split_across_groups():
+    # Los eventos intercalados de dos grupos no se comparan entre sí
+    start = times('2025-03-03T09:00', '2025-03-03T09:30', '2025-03-03T10:00', '2025-03-03T10:10')
+    end = times('2025-03-03T10:00', '2025-03-03T10:30', '2025-03-03T11:00', '2025-03-03T11:00')
+    group = np.array([0, 1, 0, 1])
+    gaps = intervals.sweep_gaps(start, end, group)
+    assert np.isnan(gaps[0]) and np.isnan(gaps[1])
+    assert gaps[2] == 0
+    assert gaps[3] == -20 * 60
+
+    features = intervals.meeting_features(start, end, group=group, n_groups=3)
+    assert features['num_events'].tolist() == [2, 2, 0]
+    assert features['num_overlapping_meetings'].tolist() == [0, 1, 0]
+    assert features['num_meetings_no_breaks'].tolist() == [1, 0, 0]
+
+
+def test_no_break_boundary():
+    start = times('2025-03-03T09:00', '2025-03-03T10:15')
+    end = times('2025-03-03T10:00', '2025-03-03T11:00')
+    # Google: hueco de menos de 15 minutos; Microsoft: hasta 15 minutos inclusive
+    assert intervals.meeting_features(start, end)['num_meetings_no_breaks'][0] == 0
+    assert intervals.meeting_features(start, end, no_break_inclusive=True)['num_meetings_no_breaks'][0] == 1
+
+
+def test_empty():
+    features = intervals.meeting_features(times(), times(), n_groups=2)
+    assert features['num_events'].tolist() == [0, 0]
+    assert features['avg_meeting_duration'].tolist() == [0, 0]
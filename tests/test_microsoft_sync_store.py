@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from ekilibria.microsoft_suite.sync_store import MicrosoftSyncStore
+
+COLUMNS = ("id", "folder", "received")
+
+
+def test_commit_rejects_stale_delta_link(tmp_path):
+    store = MicrosoftSyncStore(tmp_path / "microsoft_user.sqlite3")
+    assert store.commit("messages", COLUMNS, [('m1', 'Inbox', 1741082400)], (), "messages_Inbox_delta", None,
+                        {"messages_Inbox_delta": 'L1'}, reset_where=("folder = ?", ('Inbox',)))
+    assert store.commit("messages", COLUMNS, [('m2', 'Inbox', 1741168800)], ['m1'], "messages_Inbox_delta", 'L1',
+                        {"messages_Inbox_delta": 'L2'})
+
+    # Otro worker ya avanzó el link a L2: los cambios calculados desde L1 no se aplican
+    assert not store.commit("messages", COLUMNS, [], ['m2'], "messages_Inbox_delta", 'L1',
+                            {"messages_Inbox_delta": 'L2b'})
+    assert store.get_state("messages_Inbox_delta") == 'L2'
+    received = store.received_times('Inbox', datetime(2025, 3, 3), datetime(2025, 3, 9, 23, 59, 59))
+    assert received.astype('int64').tolist() == [1741168800]
+    store.close()